@@ -0,0 +1,294 @@
+###############################################################################
+# AdifDatabase.py
+# Author: Tom Kerr AB3GY
+#
+# AdifDatabase class.
+# Stores ADIF QSO records in an SQLite database for safe concurrent writes,
+# with streaming import from and export to ADIF files.
+# Each QSO is stored as a JSON object of all its fields, with the common
+# fields also stored in columns of their own.
+#
+# ADIF = Amateur Data Interchange Format
+# Reference: http://www.adif.org
+#
+# Designed for personal use by the author, but available to anyone under the
+# license terms below.
+###############################################################################
+
+###############################################################################
+# License
+# Copyright (c) 2024 Tom Kerr AB3GY (ab3gy@arrl.net).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+# System level packages.
+import json
+import os
+import sqlite3
+import threading
+
+# Local packages.
+from adif import iter_records, write_records
+
+
+##############################################################################
+# Globals.
+##############################################################################
+SCHEMA_VERSION = 2
+IMPORT_BATCH_SIZE = 1000   # Records inserted per executemany() during import
+FETCH_SIZE = 1000          # Rows fetched at a time during export
+
+SQL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS qso (
+    id       INTEGER PRIMARY KEY,
+    call     TEXT NOT NULL DEFAULT '',
+    band     TEXT NOT NULL DEFAULT '',
+    mode     TEXT NOT NULL DEFAULT '',
+    qso_date TEXT NOT NULL DEFAULT '',
+    time_on  TEXT NOT NULL DEFAULT '',
+    fields   TEXT NOT NULL
+);
+-- Schema version 1 indexes.  Lookups use the in-memory indexes built from
+-- records(), so these only slowed down inserts.
+DROP INDEX IF EXISTS qso_call;
+DROP INDEX IF EXISTS qso_band;
+DROP INDEX IF EXISTS qso_mode;
+DROP INDEX IF EXISTS qso_date;
+"""
+
+# Statements with parameters, compiled once and reused from the
+# connection's statement cache.
+SQL_INSERT = 'INSERT INTO qso (call, band, mode, qso_date, time_on, fields) VALUES (?, ?, ?, ?, ?, ?)'
+SQL_COUNT  = 'SELECT COUNT(*) FROM qso'
+SQL_ALL    = 'SELECT fields FROM qso ORDER BY id'
+
+
+##############################################################################
+# AdifDatabase class.
+##############################################################################
+class AdifDatabase(object):
+    """
+    AdifDatabase class.
+    Uses one connection shared by all threads under a lock.  The database is
+    opened in WAL mode so readers in other processes are not blocked.
+    """
+    # ------------------------------------------------------------------------
+    def __init__(self, filename):
+        """
+        Class constructor.
+        
+        Parameters
+        ----------
+        filename : str
+            The database file name.  The file is created if it does not exist.
+        
+        Returns
+        -------
+        None.
+        """
+        self.filename = str(filename)
+        self.errmsg = ''
+        self._conn = None
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------------
+    def open(self):
+        """
+        Open the database and create the tables if needed.
+        Returns True if successful, False otherwise.
+        """
+        try:
+            self._conn = sqlite3.connect(self.filename, check_same_thread=False,
+                                         isolation_level=None, cached_statements=32)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(SQL_SCHEMA)
+            self._conn.execute('PRAGMA user_version={}'.format(SCHEMA_VERSION))
+        except sqlite3.Error as err:
+            self.errmsg = str(err)
+            print('ADIF database open error: {}'.format(self.errmsg))
+            self._conn = None
+            return False
+        return True
+
+    # ------------------------------------------------------------------------
+    def close(self):
+        """
+        Close the database.
+        """
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except sqlite3.Error as err:
+                    print('ADIF database close error: {}'.format(str(err)))
+                self._conn = None
+
+    # ------------------------------------------------------------------------
+    @staticmethod
+    def _row(qso):
+        """
+        Return the insert parameters for a QSO record dictionary.
+        """
+        return (qso.get('CALL', '').strip().upper(), qso.get('BAND', '').strip().lower(),
+                qso.get('MODE', '').strip().upper(), qso.get('QSO_DATE', '').strip(),
+                qso.get('TIME_ON', '').strip(), json.dumps(dict(qso), ensure_ascii=False))
+
+    # ------------------------------------------------------------------------
+    def write(self, qso):
+        """
+        Add a QSO record dictionary to the database.
+        Returns True if successful, False otherwise.
+        """
+        try:
+            with self._lock:
+                self._conn.execute(SQL_INSERT, self._row(qso))
+        except (sqlite3.Error, AttributeError) as err:
+            self.errmsg = str(err)
+            print('ADIF database write error: {}'.format(self.errmsg))
+            return False
+        return True
+
+    # ------------------------------------------------------------------------
+    def count(self):
+        """
+        Return the number of QSOs in the database.
+        """
+        with self._lock:
+            return self._conn.execute(SQL_COUNT).fetchone()[0]
+
+    # ------------------------------------------------------------------------
+    def records(self):
+        """
+        Iterate over all QSO record dictionaries in the order they were added.
+        Rows are fetched FETCH_SIZE at a time.
+        """
+        with self._lock:
+            cursor = self._conn.execute(SQL_ALL)
+            rows = cursor.fetchmany(FETCH_SIZE)
+        while (len(rows) > 0):
+            for (fields,) in rows:
+                yield json.loads(fields)
+            with self._lock:
+                rows = cursor.fetchmany(FETCH_SIZE)
+
+    # ------------------------------------------------------------------------
+    def import_adif(self, source):
+        """
+        Add all QSO records in an ADIF file or stream to the database in a
+        single transaction.  The file is read incrementally.
+        
+        Parameters
+        ----------
+        source : str, path or file object
+            The ADIF input; see adif.iter_records().
+        
+        Returns
+        -------
+        int : The number of records imported, or -1 on error.
+        """
+        count = 0
+        batch = []
+        try:
+            with self._lock:
+                self._conn.execute('BEGIN')
+                try:
+                    for qso in iter_records(source):
+                        batch.append(self._row(qso))
+                        if (len(batch) >= IMPORT_BATCH_SIZE):
+                            self._conn.executemany(SQL_INSERT, batch)
+                            count += len(batch)
+                            batch = []
+                    if (len(batch) > 0):
+                        self._conn.executemany(SQL_INSERT, batch)
+                        count += len(batch)
+                    self._conn.execute('COMMIT')
+                except Exception:
+                    self._conn.execute('ROLLBACK')
+                    raise
+        except Exception as err:
+            self.errmsg = str(err)
+            print('ADIF database import error: {}'.format(self.errmsg))
+            return -1
+        return count
+
+    # ------------------------------------------------------------------------
+    def export_adif(self, dest, header=None):
+        """
+        Write all QSO records to an ADIF file or stream.
+        A file name is written to a temporary file and renamed when complete.
+        
+        Parameters
+        ----------
+        dest : str, path, file object or socket
+            The ADIF output; see adif.write_records().
+        header : str or dict
+            Optional ADIF header.
+        
+        Returns
+        -------
+        int : The number of records exported, or -1 on error.
+        """
+        try:
+            if isinstance(dest, (str, bytes, os.PathLike)):
+                tmp_file = str(dest) + '.tmp'
+                count = write_records(tmp_file, self.records(), header, sort=False)
+                os.replace(tmp_file, dest)
+            else:
+                count = write_records(dest, self.records(), header, sort=False)
+        except Exception as err:
+            self.errmsg = str(err)
+            print('ADIF database export error: {}'.format(self.errmsg))
+            return -1
+        return count
+
+
+##############################################################################
+# Main program.
+##############################################################################
+if __name__ == "__main__":
+    import sys
+    import time
+    
+    # Arg 1 is the database, arg 2 an ADIF file to import, arg 3 an ADIF
+    # file to export to.
+    if len(sys.argv) < 2:
+        print('Please specify a database file.')
+        sys.exit(1)
+    db = AdifDatabase(sys.argv[1])
+    if not db.open(): sys.exit(1)
+    if len(sys.argv) > 2:
+        start = time.perf_counter()
+        count = db.import_adif(sys.argv[2])
+        print('{} QSOs imported in {:.2f} s'.format(count, time.perf_counter() - start))
+    if len(sys.argv) > 3:
+        start = time.perf_counter()
+        count = db.export_adif(sys.argv[3], 'potarig export <EOH>\n')
+        print('{} QSOs exported in {:.2f} s'.format(count, time.perf_counter() - start))
+    print('{} QSOs in {}'.format(db.count(), db.filename))
+    db.close()
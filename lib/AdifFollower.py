@@ -0,0 +1,330 @@
+###############################################################################
+# AdifFollower.py
+# Author: Tom Kerr AB3GY
+#
+# AdifFollower class.
+# Follows an ADIF log file that other programs append to, like 'tail -f'.
+# Only the bytes added since the last check are parsed, and each new QSO
+# record is published to subscribers.  Truncation and rotation of the file
+# are detected and reported so the subscriber can rebuild its view of the
+# log.  Uses inotify on Linux and falls back to polling the file status.
+#
+# ADIF = Amateur Data Interchange Format
+# Reference: http://www.adif.org
+#
+# Designed for personal use by the author, but available to anyone under the
+# license terms below.
+###############################################################################
+
+###############################################################################
+# License
+# Copyright (c) 2024 Tom Kerr AB3GY (ab3gy@arrl.net).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+# System level packages.
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+
+# Local packages.
+from adifcache import last_eor, parse_range, tail_checksum
+
+
+##############################################################################
+# Globals.
+##############################################################################
+DEFAULT_POLL_INTERVAL = 1.0  # Seconds between file status checks
+
+# Event types.
+EVENT_QSO   = 'qso'    # A new QSO record was appended
+EVENT_RESET = 'reset'  # The file was truncated or replaced
+
+# inotify event masks from <sys/inotify.h>.
+IN_MODIFY      = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_NONBLOCK    = 0o4000
+IN_CLOEXEC     = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+##############################################################################
+# Classes.
+##############################################################################
+
+class _Inotify(object):
+    """
+    Minimal inotify wrapper using ctypes.
+    Watches a directory so that files replaced by rotation are also seen.
+    Raises OSError if inotify is not available.
+    """
+    # ------------------------------------------------------------------------
+    def __init__(self, path):
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None: raise OSError('libc not found')
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'): raise OSError('inotify not supported')
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if (self.fd < 0): raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if (wd < 0):
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, 'inotify_add_watch failed')
+
+    # ------------------------------------------------------------------------
+    def wait(self, names, timeout):
+        """
+        Wait up to timeout seconds for a change to one of the file names.
+        Returns True if a change was seen, False on timeout.
+        """
+        (ready, _, _) = select.select([self.fd], [], [], timeout)
+        if (len(ready) == 0): return False
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return False
+        pos = 0
+        changed = False
+        while (pos + 16 <= len(data)):
+            (wd, mask, cookie, length) = struct.unpack_from('iIII', data, pos)
+            name = data[pos+16:pos+16+length].rstrip(b'\0')
+            if (name in names): changed = True
+            pos += 16 + length
+        return changed
+
+    # ------------------------------------------------------------------------
+    def close(self):
+        os.close(self.fd)
+
+
+##############################################################################
+# AdifFollower class.
+##############################################################################
+class AdifFollower(object):
+    """
+    AdifFollower class.
+    Each event is a dictionary with the keys:
+        type  : (str) 'qso' or 'reset'
+        qso   : (dict) The new QSO record, for 'qso' events
+        qsos  : (list) All QSO records in the file, for 'reset' events
+        rotated : (bool) True if the file was replaced rather than
+                  truncated, for 'reset' events
+    """
+    # ------------------------------------------------------------------------
+    def __init__(self, filename, offset=None, poll_interval=DEFAULT_POLL_INTERVAL):
+        """
+        Class constructor.
+        
+        Parameters
+        ----------
+        filename : str
+            The ADIF file name.
+        offset : int
+            The byte offset up to which the file has already been read.
+            Defaults to the end of the last complete record in the file.
+        poll_interval : float
+            Seconds between file status checks.
+        
+        Returns
+        -------
+        None.
+        """
+        self.filename = str(filename)
+        self.poll_interval = float(poll_interval)
+        self.offset = 0
+        self._crc = 0          # tail_checksum() of the file at offset
+        self.inotify = False   # True if inotify is in use
+        self._ident = None     # (device, inode) of the file being followed
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        try:
+            st = os.stat(self.filename)
+            self._ident = (st.st_dev, st.st_ino)
+            with open(self.filename, 'rb') as f:
+                if offset is None:
+                    offset = last_eor(f, 0, st.st_size)
+                self.offset = min(int(offset), st.st_size)
+                self._crc = tail_checksum(f, self.offset)
+        except OSError:
+            pass
+
+    # ------------------------------------------------------------------------
+    def subscribe(self, callback):
+        """
+        Register a function called with each event dictionary.
+        Callbacks run in the follower thread.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+    # ------------------------------------------------------------------------
+    def unsubscribe(self, callback):
+        """
+        Remove a function registered with subscribe().
+        """
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    # ------------------------------------------------------------------------
+    def _publish(self, event):
+        """
+        Send an event to all subscribers.
+        """
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as err:
+                print('ADIF follower subscriber error: {}'.format(str(err)))
+
+    # ------------------------------------------------------------------------
+    def check(self):
+        """
+        Check the file for changes and publish events.
+        Returns the number of new QSO records, or -1 if the file was reset.
+        """
+        try:
+            st = os.stat(self.filename)
+        except FileNotFoundError:
+            return 0   # Rotated away; wait for the new file
+        ident = (st.st_dev, st.st_ino)
+        if (ident == self._ident) and (st.st_size == self.offset):
+            return 0
+        with open(self.filename, 'rb') as f:
+            if (ident != self._ident) or (st.st_size < self.offset) or \
+                    (tail_checksum(f, self.offset) != self._crc):
+                # Truncated, rewritten or replaced: read the whole file again.
+                rotated = (self._ident is not None) and (ident != self._ident)
+                end = last_eor(f, 0, st.st_size)
+                records = parse_range(f, 0, end)
+                self._ident = ident
+                self.offset = end
+                self._crc = tail_checksum(f, end)
+                self._publish({'type': EVENT_RESET, 'qsos': records, 'rotated': rotated})
+                return -1
+            end = last_eor(f, self.offset, st.st_size)
+            if (end == self.offset): return 0   # Record not complete yet
+            records = parse_range(f, self.offset, end)
+            self.offset = end
+            self._crc = tail_checksum(f, end)
+        for qso in records:
+            self._publish({'type': EVENT_QSO, 'qso': qso})
+        return len(records)
+
+    # ------------------------------------------------------------------------
+    def start(self):
+        """
+        Start following the file in a background thread.
+        Has no effect if it is already running.
+        """
+        if (self._thread is not None) and self._thread.is_alive(): return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='AdifFollower', daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------------
+    def stop(self, timeout=None):
+        """
+        Stop the follower thread and wait for it to exit.
+        """
+        self._stop.set()
+        if (self._thread is not None) and (self._thread is not threading.current_thread()):
+            self._thread.join(timeout)
+
+    # ------------------------------------------------------------------------
+    def _run(self):
+        """
+        Follower thread main loop.
+        Waits for inotify events if available, otherwise polls, and checks
+        the file status at least every poll_interval seconds either way.
+        """
+        watcher = None
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        names = {os.fsencode(os.path.basename(self.filename))}
+        try:
+            watcher = _Inotify(directory)
+        except (OSError, AttributeError):
+            watcher = None
+        self.inotify = (watcher is not None)
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.check()
+                except Exception as err:
+                    print('ADIF follower error: {}'.format(str(err)))
+                if watcher is not None:
+                    # Short waits so stop() is not delayed by a long interval.
+                    waited = 0.0
+                    while (waited < self.poll_interval) and not self._stop.is_set():
+                        if watcher.wait(names, min(0.25, self.poll_interval)): break
+                        waited += 0.25
+                else:
+                    self._stop.wait(self.poll_interval)
+        finally:
+            if watcher is not None: watcher.close()
+
+
+##############################################################################
+# Main program.
+##############################################################################
+if __name__ == "__main__":
+    import sys
+    import time
+    
+    if len(sys.argv) < 2:
+        print('Please specify an ADIF input file.')
+        sys.exit(1)
+    
+    def show(event):
+        if (event['type'] == EVENT_QSO):
+            print('New QSO: {}'.format(event['qso']))
+        else:
+            print('Log reset: {} QSOs, rotated={}'.format(len(event['qsos']), event['rotated']))
+    
+    follower = AdifFollower(sys.argv[1])
+    follower.subscribe(show)
+    follower.start()
+    print('Following {} from offset {}'.format(follower.filename, follower.offset))
+    print('Press CTRL-C to quit')
+    try:
+        while True: time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    follower.stop()
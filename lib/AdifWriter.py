@@ -0,0 +1,351 @@
+###############################################################################
+# AdifWriter.py
+# Author: Tom Kerr AB3GY
+#
+# AdifWriter class.
+# Appends ADIF records to a log file through a long-lived, buffered file
+# handle.  Records are queued by the caller and written by a background
+# thread in group commits, so the caller never waits on disk I/O.
+#
+# Designed for personal use by the author, but available to anyone under the
+# license terms below.
+###############################################################################
+
+###############################################################################
+# License
+# Copyright (c) 2024 Tom Kerr AB3GY (ab3gy@arrl.net).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+# System level packages.
+import logging
+import os
+import queue
+import threading
+import time
+
+# Local packages.
+from adif import detect_encoding, non_ascii_re
+
+
+##############################################################################
+# Globals.
+##############################################################################
+DEFAULT_HEADER = 'potarig log file <eoh>\n'
+DEFAULT_FSYNC_INTERVAL_MS = 1000
+BUFFER_SIZE = 65536
+RETRY_INTERVAL = 5.0  # Seconds between retries of a failed write with nothing queued
+
+# fsync policies.
+FSYNC_RECORD   = 'record'    # fsync after every group commit
+FSYNC_INTERVAL = 'interval'  # fsync at most every fsync_interval_ms
+FSYNC_SHUTDOWN = 'shutdown'  # fsync only when the writer is closed
+FSYNC_POLICIES = (FSYNC_RECORD, FSYNC_INTERVAL, FSYNC_SHUTDOWN)
+
+_CLOSE = object()  # Queue sentinel that stops the writer thread
+
+# Errors are also written to the application log through the root logger,
+# where Logger installs its queue handler.
+_logger = logging.getLogger('AdifWriter')
+
+
+##############################################################################
+# AdifWriter class.
+##############################################################################
+class AdifWriter(object):
+    """
+    AdifWriter class.
+    Appends ADIF records to a file from a background thread.
+    A new file is written as UTF-8.  Records are appended to an existing
+    file in the encoding it was written in, so one file never mixes two;
+    format them with the encoding attribute (see adif.format_record()).
+    
+    Records queued while a write is in progress are written together in the
+    next group commit: one buffered write and flush for the whole group.
+    The fsync policy controls when the data is forced to disk.  If a write
+    fails, the file is reopened and the records are written again by the
+    next commit, so none are dropped while the writer runs.
+    """
+    # ------------------------------------------------------------------------
+    def __init__(self, filename, fsync_policy=FSYNC_INTERVAL,
+                 fsync_interval_ms=DEFAULT_FSYNC_INTERVAL_MS, header=DEFAULT_HEADER):
+        """
+        Class constructor.
+        
+        Parameters
+        ----------
+        filename : str
+            The ADIF file name.  The file is created with the header if it
+            does not exist.
+        fsync_policy : str
+            'record', 'interval' or 'shutdown'.
+        fsync_interval_ms : int
+            Maximum time in milliseconds between a write and its fsync when
+            the policy is 'interval'.
+        header : str
+            The ADIF header written to a new file.
+        
+        Returns
+        -------
+        None.
+        """
+        if fsync_policy not in FSYNC_POLICIES:
+            print('Unknown ADIF fsync policy "{}", using {}'.format(fsync_policy, FSYNC_INTERVAL))
+            fsync_policy = FSYNC_INTERVAL
+        self.filename = filename
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = float(fsync_interval_ms) / 1000.0
+        self.header = header
+        self.encoding = 'utf-8'
+        self.errmsg = ''
+        self.records = 0   # Number of records written
+        self.commits = 0   # Number of group commits
+        self._file = None
+        self._failed = []  # Records of a failed commit, written by the next one
+        self._queue = queue.Queue()
+        self._dirty = False
+        self._last_sync = time.monotonic()
+        self._thread = None
+    
+    # ------------------------------------------------------------------------
+    def open(self):
+        """
+        Open the file and start the writer thread.
+        Returns True if successful, False otherwise.
+        """
+        try:
+            new_file = (not os.path.exists(self.filename)) or (os.path.getsize(self.filename) == 0)
+            self.encoding = 'utf-8' if new_file else self._file_encoding()
+            self._open_file()
+            if new_file:
+                self._file.write(self.header)
+                self._file.flush()
+                self._sync()
+        except Exception as err:
+            self.errmsg = str(err)
+            print('ADIF file open error: {}'.format(self.errmsg))
+            self._file = None
+            return False
+        self._thread = threading.Thread(target=self._run, name='AdifWriter', daemon=True)
+        self._thread.start()
+        return True
+    
+    # ------------------------------------------------------------------------
+    def _open_file(self):
+        """
+        Open the file for appending in its encoding.
+        """
+        self._file = open(self.filename, 'a', buffering=BUFFER_SIZE,
+                          encoding=self.encoding, errors='replace')
+    
+    # ------------------------------------------------------------------------
+    def _file_encoding(self):
+        """
+        Return the encoding of the existing file, detected from its first
+        run of non-ASCII bytes as adif.detect_encoding() does.  UTF-8 if
+        the file is all ASCII.
+        """
+        pending = b''
+        with open(self.filename, 'rb') as f:
+            while True:
+                chunk = f.read(BUFFER_SIZE)
+                data = pending + chunk
+                encoding = detect_encoding(data)
+                if (encoding is not None): return encoding
+                if (len(chunk) == 0): return 'utf-8'
+                # Keep a non-ASCII run cut short by the end of the chunk.
+                m = non_ascii_re.search(data)
+                pending = data[m.start():] if (m is not None) else b''
+    
+    # ------------------------------------------------------------------------
+    def write(self, record):
+        """
+        Queue a formatted ADIF record for writing.  Returns immediately.
+        A newline is appended to the record.
+        """
+        self._queue.put(record + '\n')
+    
+    # ------------------------------------------------------------------------
+    def flush(self):
+        """
+        Wait until all queued records have been written and flushed to the
+        operating system.
+        """
+        if self._thread is not None:
+            self._queue.join()
+    
+    # ------------------------------------------------------------------------
+    def close(self):
+        """
+        Write all queued records, fsync the file and close it.
+        """
+        if self._thread is not None:
+            self._queue.put(_CLOSE)
+            self._thread.join()
+            self._thread = None
+        if (len(self._failed) > 0):
+            self._report('ADIF file {}: {} records not written'.format(
+                self.filename, len(self._failed)))
+            self._failed = []
+        if self._file is not None:
+            try:
+                self._file.flush()
+                self._sync()
+                self._file.close()
+            except Exception as err:
+                self.errmsg = str(err)
+                print('ADIF file close error: {}'.format(self.errmsg))
+            self._file = None
+    
+    # ------------------------------------------------------------------------
+    def _sync(self):
+        """
+        Force written data to disk.
+        """
+        os.fsync(self._file.fileno())
+        self._dirty = False
+        self._last_sync = time.monotonic()
+    
+    # ------------------------------------------------------------------------
+    def _sync_if_due(self):
+        """
+        fsync the file if the interval policy's deadline has passed since
+        the first unsynced write.
+        """
+        if not self._dirty or (self.fsync_policy != FSYNC_INTERVAL): return
+        if self._file is None: return
+        if (time.monotonic() < self._last_sync + self.fsync_interval): return
+        try:
+            self._sync()
+        except Exception as err:
+            print('ADIF file fsync error: {}'.format(str(err)))
+    
+    # ------------------------------------------------------------------------
+    def _commit(self, group):
+        """
+        Write a group of records, after those of a failed commit, and apply
+        the fsync policy.  On error the records are kept for the next commit
+        and the file is closed, to be reopened then.
+        """
+        group = self._failed + group
+        self._failed = []
+        try:
+            if self._file is None: self._open_file()
+            self._file.write(''.join(group))
+            self._file.flush()
+            self._dirty = True
+            self.records += len(group)
+            self.commits += 1
+            if (self.fsync_policy == FSYNC_RECORD):
+                self._sync()
+            self.errmsg = ''
+        except Exception as err:
+            self.errmsg = str(err)
+            self._failed = group
+            self._report('ADIF file write error, {} records kept to retry: {}'.format(
+                len(group), self.errmsg))
+            if self._file is not None:
+                try:
+                    self._file.close()  # Discards the unwritten buffer
+                except Exception:
+                    pass
+                self._file = None
+    
+    # ------------------------------------------------------------------------
+    @staticmethod
+    def _report(msg):
+        """
+        Print an error message and write it to the application log.
+        """
+        print(msg)
+        _logger.error(msg)
+    
+    # ------------------------------------------------------------------------
+    def _run(self):
+        """
+        Writer thread main loop.
+        """
+        closing = False
+        while not closing:
+            timeout = None
+            if self._dirty and (self.fsync_policy == FSYNC_INTERVAL):
+                timeout = max(self._last_sync + self.fsync_interval - time.monotonic(), 0.0)
+            if (len(self._failed) > 0):
+                timeout = RETRY_INTERVAL if (timeout is None) else min(timeout, RETRY_INTERVAL)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                # The fsync interval or retry delay expired with no new records.
+                if (len(self._failed) > 0): self._commit([])
+                self._sync_if_due()
+                continue
+            
+            # Gather everything else already queued into one group commit.
+            items = [item]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            group = [i for i in items if i is not _CLOSE]
+            closing = (len(group) < len(items))
+            if (len(group) > 0):
+                self._commit(group)
+            # A steady stream of records must not postpone the fsync.
+            self._sync_if_due()
+            for i in items:
+                self._queue.task_done()
+
+
+##############################################################################
+# Main program.
+############################################################################## 
+if __name__ == "__main__":
+    import sys
+    
+    # Arg 1 is the ADIF file, arg 2 the number of records, arg 3 the policy.
+    if len(sys.argv) < 2:
+        print('Please specify an ADIF output file.')
+        sys.exit(1)
+    count = 1000
+    policy = FSYNC_INTERVAL
+    if len(sys.argv) > 2:
+        count = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        policy = sys.argv[3]
+    
+    writer = AdifWriter(sys.argv[1], policy)
+    writer.open()
+    start = time.perf_counter()
+    for i in range(count):
+        writer.write('<CALL:5>AB3GY <QSO_DATE:8>20240101 <TIME_ON:4>1200 <EOR>')
+    queued = time.perf_counter() - start
+    writer.close()
+    total = time.perf_counter() - start
+    print('{} records queued in {:.3f} s, written in {:.3f} s with {} commits ({} policy)'.format(
+        writer.records, queued, total, writer.commits, writer.fsync_policy))
@@ -6,6 +6,7 @@
 # Implements a .INI configuration file for saving/restoring configuration
 # parameters. File format is similar to Microsoft Windows .INI files.
 # Parameters are stored in sections as key/value pairs.
+# The file can be watched for changes and reloaded at runtime.
 #
 # Designed for personal use by the author, but available to anyone under the
 # license terms below.
@@ -46,7 +47,9 @@
 import os
 import sys
 import configparser
+import copy
 import datetime
+import threading
 
 # Local packages.
 
@@ -54,6 +57,7 @@ import datetime
 ##############################################################################
 # Globals.
 ##############################################################################
+DEFAULT_WATCH_INTERVAL = 2.0  # Seconds between config file change checks
 
 
 ##############################################################################
@@ -98,6 +102,13 @@ class ConfigFile(object):
         
         # The configuration file parser object.
         self.config = configparser.ConfigParser()
+        
+        # File (mtime, size) when last read, for change detection.
+        self._stamp = None
+        
+        # Change watcher thread.
+        self._watch_thread = None
+        self._watch_stop = threading.Event()
 
     # ------------------------------------------------------------------------
     def get(self, section, key):
@@ -237,6 +248,7 @@ class ConfigFile(object):
         # See if the config file exists.
         if os.path.isfile(self.ini_file):
             try:
+                self._stamp = self._file_stamp()
                 self.config.read(self.ini_file)
                 status = True
             except Exception as err:
@@ -286,9 +298,171 @@ class ConfigFile(object):
             status = False
             err_msg = str(err)
         self._close(file_out)
+        if status: self._stamp = self._file_stamp()
         
         return (status, err_msg)
         
+    # ------------------------------------------------------------------------
+    def changed(self):
+        """
+        Return True if the .INI file has changed since it was last read.
+        The file modification time and size are compared.
+        
+        Parameters
+        ----------
+        None.
+        
+        Returns
+        -------
+        True if the file has changed, False otherwise.
+        """
+        return (self._file_stamp() != self._stamp)
+
+    # ------------------------------------------------------------------------
+    def reload(self, apply=None):
+        """
+        Read the .INI file again and replace the config parameters if the
+        new ones are accepted.
+        
+        The file is parsed into a new ConfigFile object.  If any section
+        changed and apply is given, apply(new_config, sections) is called
+        to validate and use the new parameters, and returns (status,
+        err_msg).  The parameters of this object are only replaced if it
+        succeeds, in one assignment, so readers see either the old or the
+        new file.  The file is not read again until it changes, even if
+        the new parameters are rejected.
+        
+        Parameters
+        ----------
+        apply : function
+            Optional function called with the new ConfigFile object and the
+            list of changed section names.
+        
+        Returns
+        -------
+        (status, err_msg, sections) : tuple
+            status : bool
+                True if the new parameters are in use, False otherwise.
+            err_msg : str
+                Error message if an error occurred.
+            sections : list
+                The names of the sections that changed.
+        """
+        stamp = self._file_stamp()
+        new_config = copy.copy(self)
+        new_config.config = configparser.ConfigParser()
+        try:
+            if stamp is None: raise OSError('{} not found'.format(self.ini_file))
+            new_config.config.read(self.ini_file)
+        except Exception as err:
+            self._stamp = stamp
+            return (False, str(err), [])
+        self._stamp = stamp
+        
+        sections = []
+        names = set(self.config.sections()) | set(new_config.config.sections())
+        for section in sorted(names):
+            if (self.get_section_items(section) != new_config.get_section_items(section)):
+                sections.append(section)
+        if (len(sections) == 0):
+            return (True, '', sections)
+        if apply is not None:
+            try:
+                (status, err_msg) = apply(new_config, sections)
+            except Exception as err:
+                (status, err_msg) = (False, str(err))
+            if not status:
+                return (False, err_msg, sections)
+        self.config = new_config.config
+        return (True, '', sections)
+
+    # ------------------------------------------------------------------------
+    def get_section_items(self, section):
+        """
+        Get all items in the specified section, or an empty dictionary if
+        the section does not exist.  Unlike get_section(), no error message
+        is printed.
+        
+        Parameters
+        ----------
+        section : str
+            The config file section name.
+
+        Returns
+        -------
+        All items in the section as a dictionary.
+        """
+        if not self.config.has_section(str(section)): return {}
+        return dict(self.config.items(str(section)))
+
+    # ------------------------------------------------------------------------
+    def start_watch(self, apply, interval=DEFAULT_WATCH_INTERVAL):
+        """
+        Start a background thread that checks the .INI file every interval
+        seconds and calls reload(apply) when it changes.  Errors are printed.
+        Has no effect if the thread is already running.
+        
+        Parameters
+        ----------
+        apply : function
+            The function passed to reload().
+        interval : float
+            Seconds between checks.
+        
+        Returns
+        -------
+        None.
+        """
+        if (self._watch_thread is not None) and self._watch_thread.is_alive(): return
+        self._watch_stop.clear()
+        self._watch_thread = threading.Thread(target=self._watch, args=(apply, float(interval)),
+                                              name='ConfigWatch', daemon=True)
+        self._watch_thread.start()
+
+    # ------------------------------------------------------------------------
+    def stop_watch(self, timeout=None):
+        """
+        Stop the change watcher thread and wait for it to exit.
+        
+        Parameters
+        ----------
+        timeout : float
+            Optional maximum seconds to wait.
+        
+        Returns
+        -------
+        None.
+        """
+        self._watch_stop.set()
+        if (self._watch_thread is not None) and (self._watch_thread is not threading.current_thread()):
+            self._watch_thread.join(timeout)
+
+    # ------------------------------------------------------------------------
+    def _watch(self, apply, interval):
+        """
+        Change watcher thread.
+        """
+        while not self._watch_stop.wait(interval):
+            if not self.changed(): continue
+            (status, err_msg, sections) = self.reload(apply)
+            if status:
+                if (len(sections) > 0):
+                    print('Configuration reloaded: {}'.format(', '.join(sections)))
+            else:
+                print('Configuration not reloaded: {}'.format(err_msg))
+
+    # ------------------------------------------------------------------------
+    def _file_stamp(self):
+        """
+        Return the .INI file (modification time, size), or None if it does
+        not exist.
+        """
+        try:
+            st = os.stat(self.ini_file)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
     # ------------------------------------------------------------------------
     def _close(self, file):
         """
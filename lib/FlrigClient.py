@@ -47,6 +47,8 @@
 ###############################################################################
 
 # System level packages.
+import http.client
+import threading
 import time
 import xmlrpc.client
 
@@ -56,12 +58,101 @@ import xmlrpc.client
 ##############################################################################
 # Globals.
 ##############################################################################
+DEFAULT_CONNECT_TIMEOUT = 2.0  # Seconds allowed to open the TCP connection
+DEFAULT_CALL_TIMEOUT    = 5.0  # Seconds allowed for each xmlrpc call
 
 
 ##############################################################################
 # Functions.
 ##############################################################################
 
+
+##############################################################################
+# KeepAliveTransport class.
+##############################################################################
+class KeepAliveTransport(xmlrpc.client.Transport):
+    """
+    KeepAliveTransport class.
+    An xmlrpc transport that keeps a persistent HTTP/1.1 connection open to
+    the flrig server, applies connect and call timeouts, and records the
+    latency of each call.
+    
+    A single transport may be shared by several threads.  Calls are
+    serialized on the one connection.  A connection dropped by the server is
+    re-opened transparently and the call retried once.
+    """
+    # ------------------------------------------------------------------------
+    def __init__(self, connect_timeout=DEFAULT_CONNECT_TIMEOUT, 
+                 call_timeout=DEFAULT_CALL_TIMEOUT):
+        """
+        Class constructor.
+        
+        Parameters
+        ----------
+        connect_timeout : float
+            Timeout in seconds for opening the connection.
+        call_timeout : float
+            Timeout in seconds for sending a call and receiving its response.
+            
+        Returns
+        -------
+        None.
+        """
+        super().__init__()
+        self.connect_timeout = float(connect_timeout)
+        self.call_timeout = float(call_timeout)
+        self.last_latency = 0.0   # Latency of the last call in seconds
+        self.call_count = 0       # Number of completed calls
+        self.total_latency = 0.0  # Sum of all completed call latencies
+        self.reconnects = 0       # Number of connections opened
+        self._lock = threading.RLock()
+    
+    # ------------------------------------------------------------------------
+    def make_connection(self, host):
+        """
+        Return the cached connection, or open a new one with the configured
+        timeouts.
+        """
+        if self._connection and (host == self._connection[0]):
+            return self._connection[1]
+        chost, self._extra_headers, x509 = self.get_host_info(host)
+        conn = http.client.HTTPConnection(chost, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.call_timeout)
+        self._connection = host, conn
+        self.reconnects += 1
+        return conn
+    
+    # ------------------------------------------------------------------------
+    def request(self, host, handler, request_body, verbose=False):
+        """
+        Send an xmlrpc request and return the parsed response.
+        Thread-safe; updates the latency statistics on success.
+        """
+        with self._lock:
+            start = time.perf_counter()
+            resp = super().request(host, handler, request_body, verbose)
+            self.last_latency = time.perf_counter() - start
+            self.call_count += 1
+            self.total_latency += self.last_latency
+        return resp
+    
+    # ------------------------------------------------------------------------
+    def mean_latency(self):
+        """
+        Return the mean call latency in seconds, or 0.0 if no calls completed.
+        """
+        if (self.call_count == 0): return 0.0
+        return self.total_latency / self.call_count
+    
+    # ------------------------------------------------------------------------
+    def close(self):
+        """
+        Close the persistent connection.
+        """
+        with self._lock:
+            super().close()
+
     
 ##############################################################################
 # FlrigClient class.
@@ -72,7 +163,8 @@ class FlrigClient(object):
     Implements an xmlrpc client to communicate with a flrig server.
     """
     # ------------------------------------------------------------------------
-    def __init__(self, server_url=''):
+    def __init__(self, server_url='', connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 call_timeout=DEFAULT_CALL_TIMEOUT):
         """
         Class constructor.
         
@@ -80,6 +172,10 @@ class FlrigClient(object):
         ----------
         server_url : str
             The flrig server url.
+        connect_timeout : float
+            Timeout in seconds for opening the server connection.
+        call_timeout : float
+            Timeout in seconds for each xmlrpc call.
             
         Returns
         -------
@@ -87,6 +183,7 @@ class FlrigClient(object):
         """
         self.server_url = server_url
         self.server = None
+        self.transport = KeepAliveTransport(connect_timeout, call_timeout)
         self.errmsg = ''
         if (len(server_url) > 0):
             self.create_server_proxy(server_url)
@@ -174,13 +271,43 @@ class FlrigClient(object):
         self.errmsg is empty if successful, or contains an error message if failed.
         """
         try:
-            self.server = xmlrpc.client.ServerProxy(url)
+            self.transport.close()
+            self.server = xmlrpc.client.ServerProxy(url, transport=self.transport)
             self.errmsg = ''
         except Exception as err:
             self.server = None
             self.errmsg = str(err)
             print('Error creating flrig server proxy {}: {}'.format(url, self.errmsg))
 
+    # ------------------------------------------------------------------------
+    def close(self):
+        """
+        Close the persistent connection to the FLRig server.
+        It is re-opened automatically by the next command.
+        """
+        self.transport.close()
+
+    # ------------------------------------------------------------------------
+    def last_latency(self):
+        """
+        Return the latency of the last successful command in seconds.
+        """
+        return self.transport.last_latency
+
+    # ------------------------------------------------------------------------
+    def call_count(self):
+        """
+        Return the number of successful commands.
+        """
+        return self.transport.call_count
+
+    # ------------------------------------------------------------------------
+    def mean_latency(self):
+        """
+        Return the mean command latency in seconds.
+        """
+        return self.transport.mean_latency()
+
     # ------------------------------------------------------------------------
     def cat_string(self, val):
         """
@@ -449,5 +576,9 @@ if __name__ == "__main__":
         print('VFOset  = {}'.format(client.set_vfo(vfo)))
         print('VFO     = {}'.format(client.get_vfo()))
     print('info:\n{}'.format(client.get_info()))
+    print('calls = {}, mean latency = {:.1f} ms, connections = {}'.format(
+        client.transport.call_count,
+        client.transport.mean_latency() * 1000.0,
+        client.transport.reconnects))
     
    
\ No newline at end of file
@@ -0,0 +1,284 @@
+###############################################################################
+# FlrigEmulator.py
+# Author: Tom Kerr AB3GY
+#
+# FlrigEmulator class.
+# Implements a local stand-in for the flrig xmlrpc server so that FlrigClient
+# and applications using it can be tested and benchmarked without flrig or
+# a transceiver.  Only the rig.* commands used by FlrigClient are provided.
+# A configurable latency and jitter is applied to every call to mimic the
+# CAT command delay of a real transceiver.
+#
+# Supported commands: http://www.w1hkj.com/flrig-help/xmlrpc_commands.html
+#
+# Designed for personal use by the author, but available to anyone under the
+# license terms below.
+###############################################################################
+
+###############################################################################
+# License
+# Copyright (c) 2024 Tom Kerr AB3GY (ab3gy@arrl.net).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+# System level packages.
+import random
+import socketserver
+import threading
+import time
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+# Local packages.
+
+
+##############################################################################
+# Globals.
+##############################################################################
+DEFAULT_MODES = ['LSB', 'USB', 'CW-U', 'FM', 'AM', 'RTTY-LSB', 'CW-L',
+                 'DATA-LSB', 'RTTY-USB', 'DATA-FM', 'FM-N', 'DATA-USB', 'AM-N', 'C4FM']
+DEFAULT_BWS = ['3000', '2400', '1800', '500', '250']
+
+
+##############################################################################
+# Classes.
+##############################################################################
+
+class _RequestHandler(SimpleXMLRPCRequestHandler):
+    """
+    Request handler that supports persistent HTTP/1.1 connections.
+    """
+    protocol_version = 'HTTP/1.1'
+    rpc_paths = ('/', '/RPC2')
+
+
+class _ThreadedServer(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    """
+    xmlrpc server that handles each connection in its own thread.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+##############################################################################
+# FlrigEmulator class.
+##############################################################################
+class FlrigEmulator(object):
+    """
+    FlrigEmulator class.
+    Emulates the flrig xmlrpc server for a transceiver with two VFOs.
+    The transceiver state is shared by all connections and protected by a
+    lock, so commands are executed one at a time as on a real CAT port.
+    """
+    # ------------------------------------------------------------------------
+    def __init__(self, host='localhost', port=12345, latency=0.0, jitter=0.0):
+        """
+        Class constructor.
+
+        Parameters
+        ----------
+        host : str
+            The host name or address to listen on.
+        port : int
+            The TCP port to listen on.  Use 0 to pick a free port.
+        latency : float
+            Mean delay in seconds applied to every rig command.
+        jitter : float
+            Maximum random deviation in seconds from the mean latency.
+
+        Returns
+        -------
+        None.
+        """
+        self.latency = float(latency)
+        self.jitter = float(jitter)
+        self.call_count = 0
+        self.xcvr = 'FlrigEmulator'
+        self.modes = list(DEFAULT_MODES)
+        self.bws = list(DEFAULT_BWS)
+        self.vfo = {'A': 14074000, 'B': 7074000}
+        self.mode = {'A': 'USB', 'B': 'LSB'}
+        self.bw = {'A': '3000', 'B': '3000'}
+        self.active = 'A'
+        self.ptt = 0
+        self.split = 0
+        self.power = 100
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.server = _ThreadedServer((host, int(port)), requestHandler=_RequestHandler,
+                                      logRequests=False, allow_none=True)
+        self.server.register_introspection_functions()
+        self.server.register_multicall_functions()
+        self._register()
+
+    # ------------------------------------------------------------------------
+    def url(self):
+        """
+        Return the server URL for use by FlrigClient.
+        """
+        host, port = self.server.server_address[0:2]
+        return 'http://{}:{}'.format(host, port)
+
+    # ------------------------------------------------------------------------
+    def start(self):
+        """
+        Serve requests in a background thread.
+        """
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        name='FlrigEmulator', daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------------
+    def stop(self):
+        """
+        Stop serving requests and close the listening socket.
+        """
+        if self._thread is not None:
+            self.server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server.server_close()
+
+    # ------------------------------------------------------------------------
+    def _delay(self):
+        """
+        Sleep for the configured latency plus a random jitter.
+        Called with the lock held to serialize commands like a CAT port.
+        """
+        self.call_count += 1
+        delay = self.latency
+        if (self.jitter > 0.0):
+            delay += random.uniform(-self.jitter, self.jitter)
+        if (delay > 0.0): time.sleep(delay)
+
+    # ------------------------------------------------------------------------
+    def _cmd(self, func):
+        """
+        Wrap a command function with the lock and the latency delay.
+        """
+        def wrapper(*args):
+            with self._lock:
+                self._delay()
+                return func(*args)
+        return wrapper
+
+    # ------------------------------------------------------------------------
+    def _register(self):
+        """
+        Register the emulated flrig commands.
+        """
+        other = lambda: 'B' if (self.active == 'A') else 'A'
+        cmds = {
+            'main.get_version'  : lambda: '2.0.05',
+            'rig.get_xcvr'      : lambda: self.xcvr,
+            'rig.get_info'      : lambda: 'R:{}\nT:{}\nFA:{}\nM:{}\nL:0\nU:0\n'.format(
+                                    self.xcvr, 'TX' if self.ptt else 'RX',
+                                    self.vfo[self.active], self.mode[self.active]),
+            'rig.get_AB'        : lambda: self.active,
+            'rig.get_vfo'       : lambda: str(self.vfo[self.active]),
+            'rig.set_vfo'       : lambda v: self._set('vfo', self.active, int(v)),
+            'rig.get_vfoA'      : lambda: str(self.vfo['A']),
+            'rig.set_vfoA'      : lambda v: self._set('vfo', 'A', int(v)),
+            'rig.get_vfoB'      : lambda: str(self.vfo['B']),
+            'rig.set_vfoB'      : lambda v: self._set('vfo', 'B', int(v)),
+            'rig.get_mode'      : lambda: self.mode[self.active],
+            'rig.set_mode'      : lambda v: self._set_mode(self.active, v),
+            'rig.get_modeA'     : lambda: self.mode['A'],
+            'rig.set_modeA'     : lambda v: self._set_mode('A', v),
+            'rig.get_modeB'     : lambda: self.mode['B'],
+            'rig.set_modeB'     : lambda v: self._set_mode('B', v),
+            'rig.get_modes'     : lambda: self.modes,
+            'rig.get_bw'        : lambda: [self.bw[self.active], ''],
+            'rig.get_bwA'       : lambda: [self.bw['A'], ''],
+            'rig.get_bwB'       : lambda: [self.bw['B'], ''],
+            'rig.get_bws'       : lambda: [['Bandwidth'] + self.bws],
+            'rig.set_bandwidth' : lambda v: self._set('bw', self.active, str(v)),
+            'rig.get_ptt'       : lambda: self.ptt,
+            'rig.set_ptt'       : lambda v: self._set_attr('ptt', int(v)),
+            'rig.get_split'     : lambda: self.split,
+            'rig.set_split'     : lambda v: self._set_attr('split', int(v)),
+            'rig.get_power'     : lambda: self.power,
+            'rig.set_power'     : lambda v: self._set_attr('power', int(v)),
+            'rig.get_maxpwr'    : lambda: 100,
+            'rig.swap'          : lambda: self._set_attr('active', other()),
+        }
+        for name, func in cmds.items():
+            self.server.register_function(self._cmd(func), name)
+
+    # ------------------------------------------------------------------------
+    def _set(self, table, vfo, value):
+        """
+        Set a per-VFO value.
+        """
+        getattr(self, table)[vfo] = value
+        return ''
+
+    # ------------------------------------------------------------------------
+    def _set_attr(self, name, value):
+        """
+        Set a transceiver-wide value.
+        """
+        setattr(self, name, value)
+        return ''
+
+    # ------------------------------------------------------------------------
+    def _set_mode(self, vfo, value):
+        """
+        Set the mode of a VFO if it is in the mode table.
+        """
+        if value in self.modes:
+            self.mode[vfo] = value
+        return ''
+
+
+##############################################################################
+# Main program.
+##############################################################################
+if __name__ == "__main__":
+    import sys
+
+    # Arg 1 is the TCP port, arg 2 the latency and arg 3 the jitter in ms.
+    port = 12345
+    latency = 0.0
+    jitter = 0.0
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        latency = float(sys.argv[2]) / 1000.0
+    if len(sys.argv) > 3:
+        jitter = float(sys.argv[3]) / 1000.0
+
+    emulator = FlrigEmulator('localhost', port, latency, jitter)
+    print('flrig emulator listening on {}'.format(emulator.url()))
+    print('Press CTRL-C to quit')
+    try:
+        emulator.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    emulator.server.server_close()
+    print('{} commands served'.format(emulator.call_count))
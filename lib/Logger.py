@@ -1,10 +1,17 @@
 # Logger.py
 # Simple logger class for application logging.
+# Messages are queued and written to the log file and the console by a
+# background thread, so logging does not wait for file I/O.
 
 # System packages.
+import atexit
 import os
+import queue
+import sys
+import threading
 import time
 import logging
+import logging.handlers
 
 ##############################################################################
 # Globals.
@@ -13,10 +20,107 @@ import logging
 # Global Logger object for use by an application.
 logger = None
 
+# Log file rotation modes.
+ROTATE_NONE = 'none'  # Never rotate the log file
+ROTATE_SIZE = 'size'  # Rotate when the log file reaches max_bytes
+ROTATE_TIME = 'time'  # Rotate at the interval set by when, in UTC
+ROTATE_MODES = (ROTATE_NONE, ROTATE_SIZE, ROTATE_TIME)
+
+# Policies for a message logged while the queue is full.
+OVERFLOW_DROP  = 'drop'   # Discard the message
+OVERFLOW_BLOCK = 'block'  # Wait up to BLOCK_TIMEOUT seconds, then discard it
+OVERFLOW_POLICIES = (OVERFLOW_DROP, OVERFLOW_BLOCK)
+
+DEFAULT_MAX_BYTES = 1000000
+DEFAULT_BACKUP_COUNT = 5
+DEFAULT_WHEN = 'midnight'
+DEFAULT_QUEUE_SIZE = 1000
+BLOCK_TIMEOUT = 0.5
+
+# Message timestamp format, in UTC.
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
 ##############################################################################
 # Functions.
 ##############################################################################
 
+# ----------------------------------------------------------------------
+def _is_console(record):
+    """
+    Log record filter: True for messages logged by print_and_log().
+    """
+    return getattr(record, 'console', False)
+
+##############################################################################
+# Queue handler and listener classes.
+##############################################################################
+# ----------------------------------------------------------------------
+class _BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that applies an overflow policy when the queue is full
+    and counts the messages discarded.  The queue can be handed over to a
+    new logger without removing the handler.
+    """
+    def __init__(self, log_queue, overflow):
+        super().__init__(log_queue)
+        self.overflow = overflow
+        self.dropped = 0
+        self._busy = 0   # Records being put on the queue
+        self._cond = threading.Condition()
+
+    def enqueue(self, record):
+        with self._cond:
+            (log_queue, overflow) = (self.queue, self.overflow)
+            self._busy += 1
+        try:
+            if (overflow == OVERFLOW_BLOCK):
+                log_queue.put(record, timeout=BLOCK_TIMEOUT)
+            else:
+                log_queue.put_nowait(record)
+        except queue.Full:
+            with self._cond:
+                self.dropped += 1
+        finally:
+            with self._cond:
+                self._busy -= 1
+                self._cond.notify_all()
+
+    def count_dropped(self):
+        """
+        Return the number of messages discarded.
+        """
+        with self._cond:
+            return self.dropped
+
+    def take_dropped(self):
+        """
+        Return the number of messages discarded and reset it.
+        """
+        with self._cond:
+            (dropped, self.dropped) = (self.dropped, 0)
+        return dropped
+
+    def handover(self, log_queue, overflow):
+        """
+        Send later records to a new queue, and wait until no record is still
+        being put on the old one.  Returns the number of messages the old
+        queue discarded.
+        """
+        with self._cond:
+            (self.queue, self.overflow) = (log_queue, overflow)
+            (dropped, self.dropped) = (self.dropped, 0)
+            self._cond.wait_for(lambda: self._busy == 0)
+        return dropped
+
+# ----------------------------------------------------------------------
+class _QueueListener(logging.handlers.QueueListener):
+    """
+    Queue listener that waits for room in a full queue to stop, so the
+    queued messages are always written.
+    """
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
 ##############################################################################
 # Logger class.
 ##############################################################################
@@ -26,17 +130,67 @@ class Logger(object):
     Simple logger class for application logging.
     """
     # ------------------------------------------------------------------
-    def __init__(self, logfile, default_level=logging.INFO):
+    def __init__(self, logfile, default_level=logging.INFO,
+                 rotate=ROTATE_NONE, max_bytes=DEFAULT_MAX_BYTES,
+                 backup_count=DEFAULT_BACKUP_COUNT, when=DEFAULT_WHEN,
+                 queue_size=DEFAULT_QUEUE_SIZE, overflow=OVERFLOW_DROP,
+                 install=True):
         """
         Class constructor.
         Parameters:
             logfile (str) : The log file name.
             default_level (int) : The default logging level, defaults to INFO.
+            rotate (str) : Log file rotation mode, one of ROTATE_MODES.
+            max_bytes (int) : Log file size that triggers rotation for ROTATE_SIZE.
+            backup_count (int) : Number of rotated log files kept.
+            when (str) : Rotation interval for ROTATE_TIME, as for
+                logging.handlers.TimedRotatingFileHandler.
+            queue_size (int) : Maximum number of queued messages, 0 for no limit.
+            overflow (str) : Policy for a full queue, one of OVERFLOW_POLICIES.
+            install (bool) : If True, start logging now.  Otherwise the
+                logger is only prepared, and starts when install() is called.
+        Raises ValueError for an unknown rotate or overflow value and
+        OSError if the log file can not be opened.
         """
+        if rotate not in ROTATE_MODES:
+            raise ValueError('Unknown log rotation mode "{}"'.format(rotate))
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('Unknown log overflow policy "{}"'.format(overflow))
         logger_name = os.path.basename(os.path.splitext(logfile)[0])
-        logging.basicConfig(filename=logfile, level=default_level)
         self.logfile = logfile
         self.logger = logging.getLogger(logger_name)
+        self.default_level = default_level
+
+        # The file is opened by the first message written, after any
+        # previous logger of the same file has closed it.
+        open(logfile, 'a').close()
+        if (rotate == ROTATE_SIZE):
+            file_handler = logging.handlers.RotatingFileHandler(logfile,
+                maxBytes=max_bytes, backupCount=backup_count, delay=True)
+        elif (rotate == ROTATE_TIME):
+            file_handler = logging.handlers.TimedRotatingFileHandler(logfile,
+                when=when, backupCount=backup_count, utc=True, delay=True)
+        else:
+            file_handler = logging.FileHandler(logfile, delay=True)
+        file_formatter = logging.Formatter('%(levelname)s:%(name)s:%(asctime)s %(message)s',
+                                           TIMESTAMP_FORMAT)
+        file_formatter.converter = time.gmtime
+        file_handler.setFormatter(file_formatter)
+
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_formatter = logging.Formatter('%(asctime)s %(message)s', TIMESTAMP_FORMAT)
+        console_formatter.converter = time.gmtime
+        console_handler.setFormatter(console_formatter)
+        console_handler.addFilter(_is_console)
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._overflow = overflow
+        self._handlers = (file_handler, console_handler)
+        self._queue_handler = None
+        self._listener = None
+        self._started = False
+        self._dropped = 0   # Messages dropped before a handover
+        if install: self.install()
 
     # ------------------------------------------------------------------
     def __del__(self):
@@ -44,7 +198,47 @@ class Logger(object):
         Class destructor.
         """
         self.close()
-    
+
+    # ----------------------------------------------------------------------
+    def install(self, previous=None):
+        """
+        Start logging with this logger.
+        The queue handler on the root logger (as set up by
+        logging.basicConfig()) is taken over from the previous logger if
+        given, so no message is logged twice or lost.  The previous logger
+        writes the messages already queued and is closed before this one
+        writes, so the two never write the same file at once.
+        Parameters:
+            previous : (Logger) The logger in use, or None.
+        Returns:
+            None
+        """
+        if self._started: return
+        self._started = True
+        self._listener = _QueueListener(self._queue, *self._handlers)
+        handler = None
+        if previous is not None:
+            handler = previous._release_handler()
+        if handler is None:
+            handler = _BoundedQueueHandler(self._queue, self._overflow)
+            logging.getLogger().addHandler(handler)
+        else:
+            previous._dropped += handler.handover(self._queue, self._overflow)
+            previous.close()
+        self._queue_handler = handler
+        logging.getLogger().setLevel(self.default_level)
+        self._listener.start()
+        atexit.register(self.close)
+
+    # ----------------------------------------------------------------------
+    def _release_handler(self):
+        """
+        Give up the root logger queue handler for install().
+        Returns the handler, or None if this logger has none.
+        """
+        (handler, self._queue_handler) = (self._queue_handler, None)
+        return handler
+
     # ----------------------------------------------------------------------
     def log_msg(self, msg, level=logging.INFO):
         """
@@ -55,10 +249,8 @@ class Logger(object):
         Returns:
             None
         """
-        timestamp = time.strftime('%Y-%m-%d %H:%M:%S ', time.gmtime())
-        logmsg = timestamp + str(msg)
-        self.logger.log(level, logmsg)
-        
+        self.logger.log(level, str(msg))
+
     # ----------------------------------------------------------------------
     def print_and_log(self, msg, level=logging.INFO):
         """
@@ -69,15 +261,60 @@ class Logger(object):
         Returns:
             None
         """
-        timestamp = time.strftime('%Y-%m-%d %H:%M:%S ', time.gmtime())
-        logmsg = timestamp + str(msg)
-        print(logmsg)
-        self.logger.log(level, logmsg)
+        if self._listener is None:
+            print(time.strftime(TIMESTAMP_FORMAT + ' ', time.gmtime()) + str(msg))
+        self.logger.log(level, str(msg), extra={'console': True})
+
+    # ----------------------------------------------------------------------
+    def dropped(self):
+        """
+        Return the number of messages discarded because the queue was full.
+        """
+        handler = self._queue_handler
+        if handler is None: return self._dropped
+        return self._dropped + handler.count_dropped()
 
     # ----------------------------------------------------------------------
     def close(self):
         """
         Shut down the logger.
+        Writes all queued messages and closes the log file.
         """
-        logging.shutdown()
+        listener = getattr(self, '_listener', None)
+        if listener is None:
+            # Never installed: just release the log file.
+            for handler in getattr(self, '_handlers', ()):
+                handler.close()
+            return
+        self._listener = None
+        handler = self._release_handler()
+        if handler is not None:
+            logging.getLogger().removeHandler(handler)
+            self._dropped += handler.take_dropped()
+        if (self._dropped > 0):
+            self._queue.put(self.logger.makeRecord(self.logger.name,
+                logging.WARNING, '', 0, '{} log messages dropped'.format(self._dropped),
+                None, None))
+        listener.stop()
+        for handler in self._handlers:
+            handler.close()
+        atexit.unregister(self.close)
+
+
+##############################################################################
+# Main program.
+##############################################################################
+if __name__ == "__main__":
+    import tempfile
+    print('{} main program called'.format(os.path.basename(sys.argv[0])))
 
+    logfile = os.path.join(tempfile.gettempdir(), 'Logger_test.log')
+    test = Logger(logfile, rotate=ROTATE_SIZE, max_bytes=10000, backup_count=1)
+    start = time.perf_counter()
+    for i in range(1000):
+        test.log_msg('Test message {}'.format(i))
+    elapsed = time.perf_counter() - start
+    test.print_and_log('1000 messages queued in {:.1f} ms, {} dropped'.format(
+        elapsed * 1000.0, test.dropped()))
+    test.close()
+    print('Log written to {}'.format(logfile))
@@ -0,0 +1,382 @@
+###############################################################################
+# QsoTable.py
+# Author: Tom Kerr AB3GY
+#
+# QsoTable class.
+# Compact in-memory storage for large numbers of ADIF QSO records.
+# Field names are kept once in a shared table and each QSO is a tuple of
+# values in table order.  Short repeated values such as bands and modes are
+# shared, and the QSO date, time and frequency are kept in numeric arrays.
+# Each QSO can be read and updated as a dictionary, so the table can be
+# passed to adifMerge.mergeLog() and qslrcvd.evaluate().
+#
+# ADIF = Amateur Data Interchange Format
+# Reference: http://www.adif.org
+#
+# Designed for personal use by the author, but available to anyone under the
+# license terms below.
+###############################################################################
+
+###############################################################################
+# License
+# Copyright (c) 2024 Tom Kerr AB3GY (ab3gy@arrl.net).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+# System level packages.
+import array
+from collections.abc import MutableMapping
+import math
+import sys
+
+# Local packages.
+from adif import iter_records
+
+
+##############################################################################
+# Globals.
+##############################################################################
+
+# Values up to this length are shared between records.
+MAX_SHARED_LEN = 12
+
+# Missing value codes for the numeric columns.
+NO_DATE = 0
+NO_TIME = -1
+NO_FREQ = math.nan
+
+# TIME_ON codes: HHMM is stored as is, HHMMSS plus TIME_SECONDS.
+TIME_SECONDS = 1000000
+
+# Missing value in a record tuple.
+_MISSING = None
+
+
+##############################################################################
+# Functions.
+##############################################################################
+
+# ----------------------------------------------------------------------------
+def encode_date(value):
+    """
+    Return the numeric code of a QSO_DATE value, or None if the value cannot
+    be restored exactly from a number.
+    """
+    if (len(value) == 8) and value.isdigit() and (value[0] != '0'):
+        return int(value)
+    return None
+
+# ----------------------------------------------------------------------------
+def decode_date(code):
+    return str(code)
+
+# ----------------------------------------------------------------------------
+def encode_time(value):
+    """
+    Return the numeric code of a TIME_ON value, or None if the value cannot
+    be restored exactly from a number.
+    """
+    if value.isdigit():
+        if (len(value) == 4): return int(value)
+        if (len(value) == 6): return int(value) + TIME_SECONDS
+    return None
+
+# ----------------------------------------------------------------------------
+def decode_time(code):
+    if (code >= TIME_SECONDS): return '{:06d}'.format(code - TIME_SECONDS)
+    return '{:04d}'.format(code)
+
+# ----------------------------------------------------------------------------
+def encode_freq(value):
+    """
+    Return the numeric code of a FREQ value, or None if the value cannot be
+    restored exactly from a number.
+    """
+    try:
+        code = float(value)
+    except ValueError:
+        return None
+    if (repr(code) == value) and not math.isnan(code): return code
+    return None
+
+# ----------------------------------------------------------------------------
+def decode_freq(code):
+    return repr(code)
+
+# Numeric columns as (field, array type code, missing code, encode, decode).
+NUMERIC_FIELDS = (
+    ('QSO_DATE', 'i', NO_DATE, encode_date, decode_date),
+    ('TIME_ON',  'i', NO_TIME, encode_time, decode_time),
+    ('FREQ',     'd', NO_FREQ, encode_freq, decode_freq),
+)
+
+
+##############################################################################
+# QsoRecord class.
+##############################################################################
+class QsoRecord(MutableMapping):
+    """
+    Dictionary view of one QSO in a QsoTable.
+    Reads and writes go to the table, so any number of views of the same
+    QSO stay consistent.
+    """
+    __slots__ = ('table', 'row')
+
+    # ------------------------------------------------------------------------
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __getitem__(self, field):
+        return self.table.get_value(self.row, field)
+
+    def __setitem__(self, field, value):
+        self.table.set_value(self.row, field, value)
+
+    def __delitem__(self, field):
+        if field not in self: raise KeyError(field)
+        self.table.set_value(self.row, field, _MISSING)
+
+    def __iter__(self):
+        return iter(self.table.row_fields(self.row))
+
+    def __len__(self):
+        return len(self.table.row_fields(self.row))
+
+    def __contains__(self, field):
+        try:
+            self.table.get_value(self.row, field)
+        except KeyError:
+            return False
+        return True
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+##############################################################################
+# QsoTable class.
+##############################################################################
+class QsoTable(object):
+    """
+    QsoTable class.
+    A list-like container of QSO records.  Indexing and iteration return
+    QsoRecord dictionary views; append() accepts any QSO dictionary.
+    """
+    # ------------------------------------------------------------------------
+    def __init__(self, records=None):
+        """
+        Class constructor.
+        
+        Parameters
+        ----------
+        records : iterable
+            Optional QSO record dictionaries to add.
+        
+        Returns
+        -------
+        None.
+        """
+        self.fields = []         # Shared field name table
+        self._field_index = {}   # Field name: position in self.fields
+        self._rows = []          # Value tuples in field table order
+        self._shared = {}        # Shared short values
+        self._numeric = {}       # Field: numeric column array
+        self._decoders = {}      # Field: (missing code, encode, decode)
+        self._odd = {}           # (row, field): value that has no numeric code
+        for (field, typecode, missing, encode, decode) in NUMERIC_FIELDS:
+            self._numeric[field] = array.array(typecode)
+            self._decoders[field] = (missing, encode, decode)
+        if records is not None:
+            self.extend(records)
+
+    # ------------------------------------------------------------------------
+    @classmethod
+    def from_adif(cls, source, header=None):
+        """
+        Create a table from an ADIF file or stream.  See adif.iter_records().
+        """
+        return cls(iter_records(source, header))
+
+    # ------------------------------------------------------------------------
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, row):
+        if (row < 0): row += len(self._rows)
+        if not (0 <= row < len(self._rows)): raise IndexError('QsoTable index out of range')
+        return QsoRecord(self, row)
+
+    def __iter__(self):
+        for row in range(len(self._rows)):
+            yield QsoRecord(self, row)
+
+    # ------------------------------------------------------------------------
+    def _column(self, field):
+        """
+        Return the position of a field in the field table, adding it if needed.
+        """
+        col = self._field_index.get(field)
+        if col is None:
+            field = sys.intern(field)
+            col = self._field_index[field] = len(self.fields)
+            self.fields.append(field)
+        return col
+
+    # ------------------------------------------------------------------------
+    def _share(self, value):
+        """
+        Return the shared copy of a short value.
+        """
+        if (len(value) <= MAX_SHARED_LEN):
+            return self._shared.setdefault(value, value)
+        return value
+
+    # ------------------------------------------------------------------------
+    def append(self, qso):
+        """
+        Add a QSO record dictionary to the table.
+        """
+        row = len(self._rows)
+        values = []
+        for (field, column) in self._numeric.items():
+            (missing, encode, decode) = self._decoders[field]
+            value = qso.get(field)
+            code = missing
+            if value is not None:
+                code = encode(value)
+                if code is None:
+                    code = missing
+                    self._odd[(row, field)] = value
+            column.append(code)
+        for (field, value) in qso.items():
+            if field in self._numeric: continue
+            col = self._column(field)
+            if (col >= len(values)):
+                values.extend([_MISSING] * (col + 1 - len(values)))
+            values[col] = self._share(value)
+        self._rows.append(tuple(values))
+
+    # ------------------------------------------------------------------------
+    def extend(self, records):
+        """
+        Add QSO record dictionaries to the table.
+        """
+        for qso in records:
+            self.append(qso)
+
+    # ------------------------------------------------------------------------
+    def get_value(self, row, field):
+        """
+        Return a field value of a QSO.  Raises KeyError if it is missing.
+        """
+        column = self._numeric.get(field)
+        if column is not None:
+            (missing, encode, decode) = self._decoders[field]
+            code = column[row]
+            if (code == missing) or (code != code):   # code != code for NaN
+                return self._odd[(row, field)]
+            return decode(code)
+        col = self._field_index.get(field)
+        values = self._rows[row]
+        if (col is None) or (col >= len(values)) or (values[col] is _MISSING):
+            raise KeyError(field)
+        return values[col]
+
+    # ------------------------------------------------------------------------
+    def set_value(self, row, field, value):
+        """
+        Set a field value of a QSO.  A value of None deletes the field.
+        """
+        column = self._numeric.get(field)
+        if column is not None:
+            (missing, encode, decode) = self._decoders[field]
+            self._odd.pop((row, field), None)
+            code = None if (value is None) else encode(value)
+            if code is None:
+                code = missing
+                if value is not None: self._odd[(row, field)] = value
+            column[row] = code
+            return
+        col = self._column(field)
+        values = list(self._rows[row])
+        if (col >= len(values)):
+            values.extend([_MISSING] * (col + 1 - len(values)))
+        values[col] = _MISSING if (value is None) else self._share(value)
+        self._rows[row] = tuple(values)
+
+    # ------------------------------------------------------------------------
+    def row_fields(self, row):
+        """
+        Return the list of field names present in a QSO.
+        """
+        values = self._rows[row]
+        names = [self.fields[col] for (col, v) in enumerate(values) if v is not _MISSING]
+        for (field, column) in self._numeric.items():
+            code = column[row]
+            missing = self._decoders[field][0]
+            if ((code != missing) and (code == code)) or ((row, field) in self._odd):
+                names.append(field)
+        return names
+
+    # ------------------------------------------------------------------------
+    def column(self, field):
+        """
+        Return the numeric array of QSO_DATE, TIME_ON or FREQ codes, for fast
+        filtering and sorting.  Dates are YYYYMMDD integers, times are HHMM
+        or HHMMSS + TIME_SECONDS integers and frequencies are MHz floats.
+        """
+        return self._numeric[field]
+
+
+##############################################################################
+# Main program.
+##############################################################################
+if __name__ == "__main__":
+    import time
+    import tracemalloc
+    
+    if len(sys.argv) < 2:
+        print('Please specify an ADIF input file.')
+        sys.exit(1)
+    
+    tracemalloc.start()
+    start = time.perf_counter()
+    records = [dict(qso) for qso in iter_records(sys.argv[1])]
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    print('{} QSOs as dictionaries: {:.0f} bytes per QSO ({:.2f} s)'.format(
+        len(records), dict_bytes / max(len(records), 1), time.perf_counter() - start))
+    del records
+    
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    table = QsoTable.from_adif(sys.argv[1])
+    table_bytes = tracemalloc.get_traced_memory()[0] - base
+    print('{} QSOs in a QsoTable:  {:.0f} bytes per QSO ({:.2f} s)'.format(
+        len(table), table_bytes / max(len(table), 1), time.perf_counter() - start))
@@ -0,0 +1,434 @@
+###############################################################################
+# RigctldClient.py
+# Author: Tom Kerr AB3GY
+#
+# RigctldClient class.
+# Implements a client for the Hamlib rigctld network daemon using its
+# line-oriented TCP protocol.  Provides the same command methods as
+# FlrigClient so either can be used as the potarig rig backend.
+#
+# Hamlib main page: https://hamlib.github.io/
+# rigctld protocol: https://hamlib.sourceforge.net/html/rigctld.1.html
+#
+# Designed for personal use by the author, but available to anyone under the
+# license terms below.
+###############################################################################
+
+###############################################################################
+# License
+# Copyright (c) 2024 Tom Kerr AB3GY (ab3gy@arrl.net).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+# System level packages.
+import socket
+import threading
+import time
+
+# Local packages.
+
+
+##############################################################################
+# Globals.
+##############################################################################
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 4532
+DEFAULT_CONNECT_TIMEOUT = 2.0  # Seconds allowed to open the TCP connection
+DEFAULT_CALL_TIMEOUT    = 5.0  # Seconds allowed for each command response
+
+# Number of response lines returned by each get command on success.
+# Set commands return a single 'RPRT n' line.
+RESPONSE_LINES = {
+    'f' : 1,  # Frequency
+    'm' : 2,  # Mode, passband
+    't' : 1,  # PTT
+    's' : 2,  # Split, TX VFO
+    'v' : 1,  # VFO
+    'l' : 1,  # Level
+}
+
+
+##############################################################################
+# Functions.
+##############################################################################
+
+
+##############################################################################
+# RigctldClient class.
+##############################################################################
+class RigctldClient(object):
+    """
+    RigctldClient class.
+    Implements a rigctld client over a persistent TCP connection.
+    
+    Several commands can be sent in one write and their responses read back
+    in order (pipelining), so a group of commands costs a single network
+    round trip.  The client is thread-safe; commands from different threads
+    are serialized on the one connection.  A dropped connection is re-opened
+    transparently and the commands retried once.
+    """
+    # ------------------------------------------------------------------------
+    def __init__(self, server_url='', connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 call_timeout=DEFAULT_CALL_TIMEOUT):
+        """
+        Class constructor.
+        
+        Parameters
+        ----------
+        server_url : str
+            The rigctld server address as 'host:port'.  The port defaults
+            to 4532 if omitted.
+        connect_timeout : float
+            Timeout in seconds for opening the server connection.
+        call_timeout : float
+            Timeout in seconds for each command response.
+            
+        Returns
+        -------
+        None.
+        """
+        self.server_url = server_url
+        self.host = DEFAULT_HOST
+        self.port = DEFAULT_PORT
+        self.connect_timeout = float(connect_timeout)
+        self.call_timeout = float(call_timeout)
+        self.errmsg = ''
+        self.commands = 0        # Number of commands sent
+        self.round_trips = 0     # Number of pipelined command groups sent
+        self.total_latency = 0.0 # Sum of all round trip latencies
+        self._last_latency = 0.0
+        self._sock = None
+        self._file = None
+        self._lock = threading.RLock()
+        if (len(server_url) > 0):
+            self._parse_url(server_url)
+    
+    # ------------------------------------------------------------------------
+    def _parse_url(self, url):
+        """
+        Split a 'host:port' address into its parts.
+        A leading 'tcp://' is ignored.
+        """
+        if url.startswith('tcp://'): url = url[6:]
+        host, sep, port = url.rpartition(':')
+        if (len(sep) == 0):
+            self.host = url
+        else:
+            self.host = host
+            self.port = int(port)
+    
+    # ------------------------------------------------------------------------
+    def _connect(self):
+        """
+        Open the connection to rigctld if it is not already open.
+        """
+        if self._sock is not None: return
+        sock = socket.create_connection((self.host, self.port), self.connect_timeout)
+        sock.settimeout(self.call_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._file = sock.makefile('rb')
+    
+    # ------------------------------------------------------------------------
+    def close(self):
+        """
+        Close the connection to rigctld.
+        It is re-opened automatically by the next command.
+        """
+        with self._lock:
+            for obj in (self._file, self._sock):
+                try:
+                    if obj is not None: obj.close()
+                except Exception:
+                    pass
+            self._file = None
+            self._sock = None
+    
+    # ------------------------------------------------------------------------
+    def _read_response(self, cmd):
+        """
+        Read the response lines for one command.
+        Returns a list of strings.  Raises an exception if the rig reported
+        an error or the connection was closed.
+        """
+        nlines = RESPONSE_LINES.get(cmd.split(' ')[0], 1)
+        lines = []
+        while (len(lines) < nlines):
+            line = self._file.readline()
+            if (len(line) == 0):
+                raise ConnectionResetError('rigctld closed the connection')
+            line = line.decode('utf-8', errors='replace').rstrip('\r\n')
+            if line.startswith('RPRT '):
+                code = int(line[5:])
+                if (code != 0):
+                    raise RuntimeError('rigctld command "{}" failed: RPRT {}'.format(cmd, code))
+                break
+            lines.append(line)
+        return lines
+    
+    # ------------------------------------------------------------------------
+    def pipeline(self, cmds):
+        """
+        Send several rigctld commands in a single write and read their
+        responses.
+        
+        Parameters
+        ----------
+        cmds : list
+            rigctld command strings, e.g. ['F 14074000', 'f']
+        
+        Returns
+        -------
+        resp : list
+            A list of response line lists, one per command, or an empty list
+            if the commands failed.
+        self.errmsg is empty if successful, or contains an error message if failed.
+        """
+        data = ''.join([c + '\n' for c in cmds]).encode('utf-8')
+        resp = []
+        with self._lock:
+            start = time.perf_counter()
+            for attempt in (0, 1):
+                try:
+                    self._connect()
+                    self._sock.sendall(data)
+                    resp = [self._read_response(c) for c in cmds]
+                    self.errmsg = ''
+                    break
+                except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError) as err:
+                    # Stale connection; re-open and retry once.
+                    self.close()
+                    self.errmsg = str(err)
+                    if attempt: break
+                except Exception as err:
+                    # Responses may be out of step after an error; start over.
+                    self.close()
+                    self.errmsg = str(err)
+                    break
+            if (len(self.errmsg) == 0):
+                self._last_latency = time.perf_counter() - start
+                self.total_latency += self._last_latency
+                self.round_trips += 1
+                self.commands += len(cmds)
+        if (len(self.errmsg) > 0):
+            print('rigctld error: {}'.format(self.errmsg))
+        return resp
+    
+    # ------------------------------------------------------------------------
+    def _string_cmd(self, cmd):
+        """
+        Execute a single rigctld command and return the first response line.
+        Returns an empty string if the command failed or returns no data.
+        """
+        resp = self.pipeline([cmd])
+        if (len(resp) == 0) or (len(resp[0]) == 0): return ''
+        return resp[0][0]
+    
+    # ------------------------------------------------------------------------
+    def last_latency(self):
+        """
+        Return the latency of the last successful round trip in seconds.
+        """
+        return self._last_latency
+    
+    # ------------------------------------------------------------------------
+    def call_count(self):
+        """
+        Return the number of commands sent.
+        """
+        return self.commands
+    
+    # ------------------------------------------------------------------------
+    def mean_latency(self):
+        """
+        Return the mean round trip latency in seconds, or 0.0 if none completed.
+        """
+        if (self.round_trips == 0): return 0.0
+        return self.total_latency / self.round_trips
+    
+    # ------------------------------------------------------------------------
+    def get_AB(self):
+        """
+        Return the VFO in use (A/B).
+        """
+        vfo = self._string_cmd('v')
+        if vfo.startswith('VFO'): vfo = vfo[3:]
+        return vfo
+    
+    # ------------------------------------------------------------------------
+    def get_bw(self):
+        """
+        Return the current passband in Hz.
+        NOTE: Returns a list, in the same format as FlrigClient.get_bw().
+        """
+        resp = self.pipeline(['m'])
+        if (len(resp) == 0) or (len(resp[0]) < 2): return ''
+        return [resp[0][1], '']
+    
+    # ------------------------------------------------------------------------
+    def set_bw(self, val):
+        """
+        Set the passband of the current mode in Hz.
+        """
+        mode = self.get_mode()
+        if (len(mode) == 0): return ''
+        return self._string_cmd('M {} {}'.format(mode, int(val)))
+    
+    # ------------------------------------------------------------------------
+    def get_mode(self):
+        """
+        Return the mode of the current VFO.
+        """
+        return self._string_cmd('m')
+    
+    # ------------------------------------------------------------------------
+    def set_mode(self, val):
+        """
+        Set the mode of the current VFO with the default passband.
+        """
+        return self._string_cmd('M {} 0'.format(str(val)))
+    
+    # ------------------------------------------------------------------------
+    def get_modes(self):
+        """
+        Return a list of the modes supported by the transceiver.
+        """
+        modes = self._string_cmd('M ?')
+        return modes.split()
+    
+    # ------------------------------------------------------------------------
+    def get_ptt(self):
+        """
+        Return the PTT state (1 = on, 0 = off).
+        """
+        return self._string_cmd('t')
+    
+    # ------------------------------------------------------------------------
+    def set_ptt(self, val):
+        """
+        Set the PTT state (1 = on, 0 = off).
+        """
+        return self._string_cmd('T {}'.format(int(val)))
+    
+    # ------------------------------------------------------------------------
+    def get_split(self):
+        """
+        Return the split state (1 = on, 0 = off).
+        """
+        return self._string_cmd('s')
+    
+    # ------------------------------------------------------------------------
+    def set_split(self, val):
+        """
+        Set the split state (1 = on, 0 = off) with VFO B for transmit.
+        """
+        return self._string_cmd('S {} VFOB'.format(int(val)))
+    
+    # ------------------------------------------------------------------------
+    def get_vfo(self):
+        """
+        Return the current VFO frequency in Hz.
+        """
+        freq = self._string_cmd('f')
+        if freq.endswith('.000000'): freq = freq[:-7]
+        return freq
+    
+    # ------------------------------------------------------------------------
+    def set_vfo(self, val):
+        """
+        Set the current VFO frequency in Hz.
+        """
+        return self._string_cmd('F {}'.format(int(float(val))))
+    
+    # ------------------------------------------------------------------------
+    def get_xcvr(self):
+        """
+        Return the transceiver name.
+        """
+        return self._string_cmd('_')
+    
+    # ------------------------------------------------------------------------
+    def swap(self):
+        """
+        Execute VFO swap.
+        """
+        return self._string_cmd('G XCHG')
+    
+    # ------------------------------------------------------------------------
+    def tune(self, freq_hz, mode):
+        """
+        Set the VFO frequency and mode and read back the frequency, pipelined
+        in a single round trip.  Either value may be empty to leave it
+        unchanged.
+        
+        Returns the VFO frequency in Hz after the commands, or an empty
+        string if the commands failed.
+        """
+        cmds = []
+        if (freq_hz > 0.0): cmds.append('F {}'.format(int(freq_hz)))
+        if (len(mode) > 0): cmds.append('M {} 0'.format(mode))
+        cmds.append('f')
+        resp = self.pipeline(cmds)
+        if (len(resp) == 0) or (len(resp[-1]) == 0): return ''
+        freq = resp[-1][0]
+        if freq.endswith('.000000'): freq = freq[:-7]
+        return freq
+
+
+##############################################################################
+# Main program.
+############################################################################## 
+if __name__ == "__main__":
+    import sys
+    
+    url = ''
+    vfo = 0
+    
+    # Arg 1 is the rigctld server address as host:port.
+    if len(sys.argv) > 1:
+        url = sys.argv[1]
+    
+    # Arg 2 is the VFO frequency to set.
+    if len(sys.argv) > 2:
+        vfo = int(sys.argv[2])
+        
+    client = RigctldClient(url)
+    print('rigctld server = {}:{}'.format(client.host, client.port))
+    print('xcvr    = {}'.format(client.get_xcvr()))
+    print('modes   = {}'.format(client.get_modes()))
+    print('mode    = {}'.format(client.get_mode()))
+    print('VFO A/B = {}'.format(client.get_AB()))
+    print('VFO     = {}'.format(client.get_vfo()))
+    print('split   = {}'.format(client.get_split()))
+    print('BW      = {}'.format(client.get_bw()))
+    print('PTT     = {}'.format(client.get_ptt()))
+    if (vfo > 0):
+        print('VFOset  = {}'.format(client.set_vfo(vfo)))
+        print('VFO     = {}'.format(client.get_vfo()))
+    print('commands = {}, mean latency = {:.1f} ms'.format(
+        client.call_count(), client.mean_latency() * 1000.0))
@@ -0,0 +1,269 @@
+###############################################################################
+# RigctldEmulator.py
+# Author: Tom Kerr AB3GY
+#
+# RigctldEmulator class.
+# Implements a local stand-in for the Hamlib rigctld network daemon so that
+# RigctldClient and applications using it can be tested and benchmarked
+# without Hamlib or a transceiver.  Only the short-form commands used by
+# RigctldClient are provided.  A configurable latency and jitter is applied
+# to every command to mimic the CAT command delay of a real transceiver.
+#
+# rigctld protocol: https://hamlib.sourceforge.net/html/rigctld.1.html
+#
+# Designed for personal use by the author, but available to anyone under the
+# license terms below.
+###############################################################################
+
+###############################################################################
+# License
+# Copyright (c) 2024 Tom Kerr AB3GY (ab3gy@arrl.net).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+# System level packages.
+import random
+import socketserver
+import threading
+import time
+
+# Local packages.
+
+
+##############################################################################
+# Globals.
+##############################################################################
+DEFAULT_MODES = ['AM', 'CW', 'USB', 'LSB', 'RTTY', 'FM', 'CWR', 'RTTYR',
+                 'PKTLSB', 'PKTUSB', 'PKTFM']
+RIG_EINVAL = -1   # Hamlib invalid parameter error code
+RIG_ENIMPL = -4   # Hamlib function not implemented error code
+
+
+##############################################################################
+# Classes.
+##############################################################################
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handle one rigctld client connection until it is closed.
+    """
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        emulator = self.server.emulator
+        for line in self.rfile:
+            cmd = line.decode('utf-8', errors='replace').strip()
+            if (len(cmd) == 0): continue
+            if (cmd == 'q'): break
+            resp = emulator.execute(cmd)
+            self.wfile.write(resp.encode('utf-8'))
+
+
+class _ThreadedServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    TCP server that handles each connection in its own thread.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+##############################################################################
+# RigctldEmulator class.
+##############################################################################
+class RigctldEmulator(object):
+    """
+    RigctldEmulator class.
+    Emulates rigctld for a transceiver with two VFOs.
+    The transceiver state is shared by all connections and protected by a
+    lock, so commands are executed one at a time as on a real CAT port.
+    """
+    # ------------------------------------------------------------------------
+    def __init__(self, host='localhost', port=4532, latency=0.0, jitter=0.0):
+        """
+        Class constructor.
+
+        Parameters
+        ----------
+        host : str
+            The host name or address to listen on.
+        port : int
+            The TCP port to listen on.  Use 0 to pick a free port.
+        latency : float
+            Mean delay in seconds applied to every rig command.
+        jitter : float
+            Maximum random deviation in seconds from the mean latency.
+
+        Returns
+        -------
+        None.
+        """
+        self.latency = float(latency)
+        self.jitter = float(jitter)
+        self.call_count = 0
+        self.xcvr = 'RigctldEmulator'
+        self.modes = list(DEFAULT_MODES)
+        self.vfo = {'VFOA': 14074000, 'VFOB': 7074000}
+        self.mode = {'VFOA': 'USB', 'VFOB': 'LSB'}
+        self.passband = {'VFOA': 2400, 'VFOB': 2400}
+        self.active = 'VFOA'
+        self.ptt = 0
+        self.split = 0
+        self.tx_vfo = 'VFOB'
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.server = _ThreadedServer((host, int(port)), _RequestHandler)
+        self.server.emulator = self
+
+    # ------------------------------------------------------------------------
+    def url(self):
+        """
+        Return the server address for use by RigctldClient.
+        """
+        host, port = self.server.server_address[0:2]
+        return '{}:{}'.format(host, port)
+
+    # ------------------------------------------------------------------------
+    def start(self):
+        """
+        Serve requests in a background thread.
+        """
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        name='RigctldEmulator', daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------------
+    def stop(self):
+        """
+        Stop serving requests and close the listening socket.
+        """
+        if self._thread is not None:
+            self.server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server.server_close()
+
+    # ------------------------------------------------------------------------
+    def _delay(self):
+        """
+        Sleep for the configured latency plus a random jitter.
+        """
+        self.call_count += 1
+        delay = self.latency
+        if (self.jitter > 0.0):
+            delay += random.uniform(-self.jitter, self.jitter)
+        if (delay > 0.0): time.sleep(delay)
+
+    # ------------------------------------------------------------------------
+    def execute(self, cmd):
+        """
+        Execute one rigctld command line and return the response text.
+        """
+        with self._lock:
+            self._delay()
+            try:
+                return self._execute(cmd.split())
+            except (ValueError, IndexError):
+                return 'RPRT {}\n'.format(RIG_EINVAL)
+
+    # ------------------------------------------------------------------------
+    def _execute(self, args):
+        """
+        Execute a parsed command and return the response text.
+        """
+        ok = 'RPRT 0\n'
+        cmd = args[0]
+        vfo = self.active
+        if (cmd == 'f'):
+            return '{}\n'.format(self.vfo[vfo])
+        elif (cmd == 'F'):
+            self.vfo[vfo] = int(float(args[1]))
+            return ok
+        elif (cmd == 'm'):
+            return '{}\n{}\n'.format(self.mode[vfo], self.passband[vfo])
+        elif (cmd == 'M'):
+            if (args[1] == '?'):
+                return '{}\n'.format(' '.join(self.modes))
+            if args[1] not in self.modes:
+                return 'RPRT {}\n'.format(RIG_EINVAL)
+            self.mode[vfo] = args[1]
+            passband = int(args[2])
+            if (passband > 0): self.passband[vfo] = passband
+            return ok
+        elif (cmd == 't'):
+            return '{}\n'.format(self.ptt)
+        elif (cmd == 'T'):
+            self.ptt = int(args[1])
+            return ok
+        elif (cmd == 's'):
+            return '{}\n{}\n'.format(self.split, self.tx_vfo)
+        elif (cmd == 'S'):
+            self.split = int(args[1])
+            self.tx_vfo = args[2]
+            return ok
+        elif (cmd == 'v'):
+            return '{}\n'.format(self.active)
+        elif (cmd == 'V'):
+            if args[1] not in self.vfo:
+                return 'RPRT {}\n'.format(RIG_EINVAL)
+            self.active = args[1]
+            return ok
+        elif (cmd == 'G') and (args[1] == 'XCHG'):
+            self.active = 'VFOB' if (self.active == 'VFOA') else 'VFOA'
+            return ok
+        elif (cmd == '_'):
+            return '{}\n'.format(self.xcvr)
+        return 'RPRT {}\n'.format(RIG_ENIMPL)
+
+
+##############################################################################
+# Main program.
+##############################################################################
+if __name__ == "__main__":
+    import sys
+
+    # Arg 1 is the TCP port, arg 2 the latency and arg 3 the jitter in ms.
+    port = 4532
+    latency = 0.0
+    jitter = 0.0
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        latency = float(sys.argv[2]) / 1000.0
+    if len(sys.argv) > 3:
+        jitter = float(sys.argv[3]) / 1000.0
+
+    emulator = RigctldEmulator('localhost', port, latency, jitter)
+    print('rigctld emulator listening on {}'.format(emulator.url()))
+    print('Press CTRL-C to quit')
+    try:
+        emulator.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    emulator.server.server_close()
+    print('{} commands served'.format(emulator.call_count))
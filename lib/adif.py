@@ -42,13 +42,18 @@
 # POSSIBILITY OF SUCH DAMAGE.
 ###############################################################################
 
+import array
+import bisect
+import calendar
 from datetime import datetime, timedelta
+import gzip
+import io
+import os
 import re
 import sys
 import traceback
+import types
 
-# Local packages.
-from strutils import make_utf8
 
 
 ##############################################################################
@@ -65,6 +70,74 @@ from strutils import make_utf8
 adif_specifier_re = re.compile('\<(\w+):(\d+)(:\w)?\>([^<]*)', re.IGNORECASE)
 adif_eoh_re       = re.compile("\<EOH\>", re.IGNORECASE)
 adif_eor_re       = re.compile("\<EOR\>", re.IGNORECASE)
+adif_marker_re    = re.compile("\<EO[HR]\>", re.IGNORECASE)
+adif_tag_re       = re.compile('[A-Za-z0-9_]+')
+
+
+##############################################################################
+# Tokenizer scan results.
+##############################################################################
+SCAN_END = 0   # End of buffer reached without an <EOR> or <EOH>
+SCAN_EOR = 1   # End of record found
+SCAN_EOH = 2   # End of header found
+
+# Fields copied to the header dictionary when found.
+header_tags = ('ADIF_VER', 'CREATED_TIMESTAMP', 'PROGRAMID', 'PROGRAMVERSION')
+
+# Bytes read at a time by iter_records().
+READ_CHUNK_SIZE = 65536
+
+# Encoding used for non-UTF-8 input when the encoding is detected.
+FALLBACK_ENCODING = 'cp1252'
+
+# A run of non-ASCII bytes, used to detect the input encoding.
+non_ascii_re = re.compile(rb'[\x80-\xff]+')
+
+# Value terminators in scanned text: a value whose declared length ends
+# just before one of these is taken to be complete.
+VALUE_END_CHARS = ' \t<'
+
+# First two bytes of a gzip file.
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Characters formatted before each buffered write by write_records().
+WRITE_BUFFER_SIZE = 1048576
+
+# Formatted '<FIELD:length>' tags keyed by (field, length), shared by all
+# records.  Cleared when it reaches MAX_TAG_CACHE entries.
+_tag_cache = {}
+MAX_TAG_CACHE = 20000
+
+# Field names already checked by scan_record(), up to MAX_TAG_CACHE of them.
+_known_tags = set()
+
+# Fields required by adifMerge.minimumQso().
+minimum_qso_fields = ('CALL', 'BAND', 'MODE', 'QSO_DATE', 'TIME_ON')
+
+# QSL source bits returned by qslrcvd.qsl_mask().
+QSL_CARD    = 0x01  # Paper QSL card (QSL_RCVD)
+QSL_CLUBLOG = 0x02  # ClubLog
+QSL_EQSL    = 0x04  # eQSL.cc
+QSL_LOTW    = 0x08  # ARRL Logbook of the World
+QSL_QRZ     = 0x10  # QRZ.com
+qsl_sources = {QSL_CARD: 'card', QSL_CLUBLOG: 'clublog', QSL_EQSL: 'eqsl',
+               QSL_LOTW: 'lotw', QSL_QRZ: 'qrz'}
+
+# QSL field predicates as (bit, field, values).  A field confirms the QSL
+# source if its value is in values, or if values is None and the field is
+# not empty.  Matches the individual qslrcvd methods.
+qsl_predicates = (
+    (QSL_CARD,    'QSL_RCVD',                       frozenset(('Y', 'V'))),
+    (QSL_CLUBLOG, 'APP_MASTERLOG_CLUBLOG_QSL',      frozenset(('Y', 'V'))),
+    (QSL_CLUBLOG, 'APP_MASTERLOG_CLUBLOG_QSLRDATE', None),
+    (QSL_EQSL,    'EQSL_QSL_RCVD',                  frozenset(('Y',))),
+    (QSL_EQSL,    'EQSL_QSLRDATE',                  None),
+    (QSL_LOTW,    'LOTW_QSL_RCVD',                  frozenset(('Y',))),
+    (QSL_LOTW,    'APP_LOTW_2XQSL',                 None),
+    (QSL_LOTW,    'APP_LOTW_QSLMODE',               None),
+    (QSL_LOTW,    'APP_LOTW_RXQSL',                 None),
+    (QSL_QRZ,     'APP_QRZLOG_STATUS',              frozenset(('C',))),
+)
 
 
 ##############################################################################
@@ -104,6 +177,400 @@ def freq2band(fmhz):
             return bandmap_bands[i]
     return 'NONE'
     
+# ----------------------------------------------------------------------------
+def detect_encoding(data):
+    """
+    Detect the encoding of ADIF input from its first run of non-ASCII bytes.
+    
+    Parameters
+    ----------
+    data : bytes-like
+        The raw ADIF input.
+    
+    Returns
+    -------
+    str : 'utf-8' if the run is valid UTF-8, otherwise FALLBACK_ENCODING.
+        None if there is no non-ASCII byte, or if the run is cut short by
+        the end of data, so more input is needed to decide.
+    """
+    m = non_ascii_re.search(data)
+    if m is None: return None
+    try:
+        m.group(0).decode('utf-8')
+    except UnicodeDecodeError as err:
+        if (m.end() == len(data)) and (err.end == len(m.group(0))): return None
+        return FALLBACK_ENCODING
+    return 'utf-8'
+
+# ----------------------------------------------------------------------------
+def bytes_to_text(data):
+    """
+    Convert raw ADIF input to the text scanned by scan_record() when an
+    encoding is given: each byte becomes one character, so offsets and
+    lengths in the text are byte offsets and lengths, and CR and LF are
+    replaced with spaces.
+    """
+    return data.decode('latin-1').replace('\n', ' ').replace('\r', ' ')
+
+# ----------------------------------------------------------------------------
+def decode_value(buf, start, stop, sz, encoding):
+    """
+    Decode a non-ASCII field value from text made by bytes_to_text().
+    
+    The declared length sz is taken as a byte count.  Programs that count
+    characters instead write a shorter length, which ends the value in the
+    middle of the text; if the value taken as sz characters ends where a
+    value should (at a space, '<' or the end of the buffer) and the byte
+    count does not, the character count is used.
+    
+    Returns (value, stop) where stop is the offset following the value.
+    """
+    if (stop >= len(buf)) or (buf[stop] in VALUE_END_CHARS):
+        return (buf[start:stop].encode('latin-1').decode(encoding, errors='replace'), stop)
+    limit = buf.find('<', start)
+    if (limit < 0): limit = len(buf)
+    text = buf[start:limit].encode('latin-1').decode(encoding, errors='surrogateescape')[0:sz]
+    end = start + len(text.encode(encoding, errors='surrogateescape'))
+    if (end >= len(buf)) or (buf[end] in VALUE_END_CHARS):
+        stop = end
+    return (buf[start:stop].encode('latin-1').decode(encoding, errors='replace'), stop)
+
+# ----------------------------------------------------------------------------
+def scan_record(buf, pos, qso, header=None, encoding=None):
+    """
+    Tokenize ADIF fields from a string buffer in a single pass.
+    
+    Scanning starts at offset pos and stops after the next <EOR> or <EOH>
+    tag, or at the end of the buffer.  Each <TAG:len> specifier is read and
+    the value taken from the declared number of characters that follow it,
+    using offsets into the buffer rather than slicing off the remainder.
+    If the value is cut short by a '<' before the declared length, it ends
+    at the '<'.  A '<' is only taken as a specifier if the tag before the
+    ':' is a field name (letters, digits and underscores); otherwise it is
+    text and scanning resumes after it.  An <EOR> or <EOH> always ends the
+    record, even inside a malformed specifier, so records can be split on
+    the end tags alone.
+    
+    Parameters
+    ----------
+    buf : str
+        The buffer to scan.
+    pos : int
+        Offset in buf to start scanning.
+    qso : dict
+        Dictionary that receives the fields found, keyed by upper-case tag.
+        On SCAN_END it holds the fields of the unterminated record.
+    header : dict
+        Optional dictionary that receives header-specific fields.  They are
+        only copied when the record ends with an <EOR> or <EOH>; see
+        copy_header_fields().
+    encoding : str
+        If given, buf is raw input converted with bytes_to_text(), lengths
+        are byte counts, and non-ASCII values are decoded with this
+        encoding; see decode_value().  Otherwise buf is decoded text.
+    
+    Returns
+    -------
+    (status, pos) : tuple
+        status : int
+            SCAN_EOR, SCAN_EOH, or SCAN_END if neither tag was found.
+        pos : int
+            Offset in buf following the last character scanned.
+    """
+    find = buf.find
+    is_tag = adif_tag_re.fullmatch
+    known_tags = _known_tags
+    m = adif_marker_re.search(buf, pos)
+    end = m.start() if m else len(buf)
+    while True:
+        lt = find('<', pos, end)
+        if (lt < 0): break
+        gt = find('>', lt + 1, end)
+        if (gt < 0): break
+        c1 = find(':', lt + 1, gt)
+        if (c1 < 0):
+            pos = gt + 1  # Tag without a value
+            continue
+        c2 = find(':', c1 + 1, gt)  # Optional data type indicator
+        tag = buf[lt+1:c1]
+        if (tag not in known_tags):
+            if not is_tag(tag):
+                pos = lt + 1  # A '<' in the text
+                continue
+            if (len(known_tags) < MAX_TAG_CACHE): known_tags.add(tag)
+        try:
+            sz = int(buf[c1+1:gt if (c2 < 0) else c2])
+        except ValueError:
+            pos = lt + 1
+            continue
+        start = gt + 1
+        stop = start + sz
+        nxt = find('<', start, stop)
+        if (nxt >= 0): stop = nxt
+        value = buf[start:stop]
+        if (encoding is not None) and not value.isascii():
+            (value, stop) = decode_value(buf, start, stop, sz, encoding)
+        qso[tag.upper()] = value
+        pos = stop
+    if m is None: return (SCAN_END, len(buf))
+    
+    if header is not None: copy_header_fields(qso, header)
+    if (buf[m.start()+3] in 'Rr'): return (SCAN_EOR, m.end())
+    return (SCAN_EOH, m.end())
+
+# ----------------------------------------------------------------------------
+def copy_header_fields(qso, header):
+    """
+    Copy the header-specific fields found in a record to a header dictionary.
+    """
+    for tag in qso:
+        if tag in header_tags:
+            header[tag] = qso[tag]
+        elif tag == 'ADIF_VERS':            # Bug in Log4OM
+            header[tag] = qso[tag]
+            header['ADIF_VER'] = qso[tag]   # ADIF standard tag name
+        elif tag.startswith('USERDEF'):
+            header[tag] = qso[tag]
+
+# ----------------------------------------------------------------------------
+def incomplete_record(buf, pos, encoding=None):
+    """
+    Print a message if the text left at the end of the input holds fields
+    of a record without an <EOR>, which are not returned.
+    """
+    qso = {}
+    scan_record(buf, pos, qso, None, encoding)
+    if (len(qso) > 0):
+        print('ADIF input ends without <EOR>: {} fields ignored'.format(len(qso)))
+
+# ----------------------------------------------------------------------------
+def format_fields(fields, names, sep, byte_lengths=True, encoding='utf-8'):
+    """
+    Format ADIF fields as '<NAME:length>value' followed by sep, using
+    cached tags.  Returns a list of strings to be joined.
+    
+    Parameters
+    ----------
+    fields : dict
+        The field values keyed by upper-case tag.
+    names : iterable
+        The tags to format, in order.
+    sep : str
+        The separator written after each field value.
+    byte_lengths : bool
+        If True, the field lengths are byte counts in encoding, as the
+        ADIF specification and the parser count them.  Otherwise they are
+        character counts, as written by some older programs.
+    encoding : str
+        The encoding the fields will be written in.
+    
+    Returns
+    -------
+    parts : list
+        The formatted tags, values and separators.
+    """
+    cache = _tag_cache
+    if (len(cache) >= MAX_TAG_CACHE): cache.clear()
+    parts = []
+    append = parts.append
+    for name in names:
+        value = fields[name]
+        n = len(value)
+        if byte_lengths and not value.isascii():
+            n = len(value.encode(encoding, errors='replace'))
+        tag = cache.get((name, n))
+        if tag is None:
+            tag = cache[(name, n)] = '<{}:{}>'.format(name, n)
+        append(tag)
+        append(value)
+        append(sep)
+    return parts
+
+# ----------------------------------------------------------------------------
+def format_record(qso, sort=True, byte_lengths=True, encoding='utf-8'):
+    """
+    Return a QSO record dictionary as a formatted ADIF record ending in <EOR>.
+    
+    Parameters
+    ----------
+    qso : dict
+        The QSO fields keyed by upper-case tag.
+    sort : bool
+        If True, the fields are written in tag order.  Otherwise they are
+        written in dictionary order.
+    byte_lengths : bool
+        If True, the field lengths are byte counts in encoding, so the
+        record reads back unchanged.  Otherwise they are character counts.
+    encoding : str
+        The encoding the record will be written in.
+    
+    Returns
+    -------
+    str : The ADIF record.
+    """
+    parts = format_fields(qso, sorted(qso) if sort else qso, ' ', byte_lengths, encoding)
+    parts.append('<EOR>')
+    return ''.join(parts)
+
+# ----------------------------------------------------------------------------
+def write_records(dest, records, header=None, sort=True, byte_lengths=True,
+                  encoding='utf-8'):
+    """
+    Write QSO records to a file or socket as ADIF, one record per line.
+    Records are formatted into a buffer of WRITE_BUFFER_SIZE characters
+    which is encoded and written in one call.
+    
+    Parameters
+    ----------
+    dest : str, path, file object or socket
+        A file name to create, an open text or binary file object, or a
+        connected socket.
+    records : iterable
+        The QSO record dictionaries.
+    header : str or dict
+        Optional header written first.  A dictionary is formatted one
+        field per line and followed by <EOH>.
+    sort : bool
+        If True, the fields are written in tag order.
+    byte_lengths : bool
+        If True, the field lengths are byte counts in the output encoding.
+        Otherwise they are character counts.
+    encoding : str
+        The encoding used for file names, binary files and sockets.  Text
+        files are written in their own encoding.
+    
+    Returns
+    -------
+    int : The number of records written.
+    """
+    close = isinstance(dest, (str, bytes, os.PathLike))
+    if close:
+        dest = open(dest, 'wb')
+    if hasattr(dest, 'sendall'):
+        write = lambda text: dest.sendall(text.encode(encoding))
+    elif isinstance(dest, io.TextIOBase):
+        write = dest.write
+        encoding = getattr(dest, 'encoding', None) or encoding
+    else:
+        write = lambda text: dest.write(text.encode(encoding))
+    
+    count = 0
+    size = 0
+    buf = []
+    try:
+        if isinstance(header, dict):
+            buf.extend(format_fields(header, sorted(header), '\n', byte_lengths, encoding))
+            buf.append('<EOH>\n')
+        elif header:
+            buf.append(header)
+        for qso in records:
+            parts = format_fields(qso, sorted(qso) if sort else qso, ' ', byte_lengths, encoding)
+            parts.append('<EOR>\n')
+            record = ''.join(parts)
+            buf.append(record)
+            size += len(record)
+            count += 1
+            if (size >= WRITE_BUFFER_SIZE):
+                write(''.join(buf))
+                buf = []
+                size = 0
+        if (len(buf) > 0):
+            write(''.join(buf))
+    finally:
+        if close: dest.close()
+    return count
+
+# ----------------------------------------------------------------------------
+def open_adif(source):
+    """
+    Open an ADIF file or stream for reading as bytes.
+    
+    Parameters
+    ----------
+    source : str, path or file object
+        A file name, or an open text or binary file object.  Gzip-compressed
+        files and binary streams are decompressed transparently.
+    
+    Returns
+    -------
+    file : file object
+        A binary file object, or source itself if it is a text file object.
+        The caller should close it when source is a file name.
+    """
+    if isinstance(source, (str, bytes, os.PathLike)):
+        source = open(source, 'rb')
+    elif isinstance(source, io.TextIOBase):
+        return source
+    if not isinstance(source, io.BufferedIOBase):
+        source = io.BufferedReader(source)
+    if hasattr(source, 'peek') and source.peek(2)[:2] == GZIP_MAGIC:
+        source = gzip.GzipFile(fileobj=source, mode='rb')
+    return source
+
+# ----------------------------------------------------------------------------
+def text_encoding(file):
+    """
+    Return the encoding used to turn text read from a text file object back
+    into bytes.
+    """
+    return getattr(file, 'encoding', None) or 'utf-8'
+
+# ----------------------------------------------------------------------------
+def iter_records(source, header=None, encoding=None):
+    """
+    Iterate over the QSO records in an ADIF file or stream.
+    
+    The input is read as bytes in fixed-size chunks and only the unparsed
+    part of the current record is kept, so memory use does not depend on
+    the file size or line lengths.  Field lengths are byte counts, and
+    each non-ASCII value is decoded once.  Each record is independent of
+    the others and read-only; copy it with dict() to modify it.
+    
+    Parameters
+    ----------
+    source : str, path or file object
+        A file name, or an open text or binary file object.  Gzip-compressed
+        input is decompressed transparently.  Text is converted back to
+        bytes with the file's encoding.
+    header : dict
+        Optional dictionary that receives the header fields.
+    encoding : str
+        The input encoding.  Detected from the input if None; see
+        detect_encoding().
+    
+    Yields
+    ------
+    qso : mapping
+        A read-only dictionary of QSO fields keyed by upper-case tag.
+    """
+    f = open_adif(source)
+    close = isinstance(source, (str, bytes, os.PathLike))
+    text_file = isinstance(f, io.TextIOBase)
+    buf = ''
+    pos = 0      # Start of the unparsed text in buf
+    search = 0   # Offset in buf to search for the next end tag
+    try:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if (len(chunk) == 0): break
+            if text_file:
+                chunk = chunk.encode(text_encoding(f), errors='replace')
+            buf = buf[pos:] + bytes_to_text(chunk)
+            if (encoding is None) and not buf.isascii():
+                encoding = detect_encoding(buf.encode('latin-1'))
+            search = max(search - pos, 0)
+            pos = 0
+            m = adif_marker_re.search(buf, search)
+            while m:
+                qso = {}
+                (status, pos) = scan_record(buf, pos, qso, header, encoding or 'utf-8')
+                if (status == SCAN_EOR):
+                    yield types.MappingProxyType(qso)
+                m = adif_marker_re.search(buf, pos)
+            search = max(len(buf) - 4, pos)  # An end tag may span two chunks
+        incomplete_record(buf, pos, encoding or 'utf-8')
+    finally:
+        if close: f.close()
 
 
 ##############################################################################
@@ -135,8 +602,16 @@ class adif(object):
         if dict is not None:
             self.QSO = dict
 
-        # Remainder of the last line read from the ADIF input file.
+        # Unparsed text read from the ADIF input file, starting at offset
+        # self._pos.  Lines read since the last parse are held in self._parts
+        # and self._marks counts the <EOR>/<EOH> tags they contain.
         self._line = ''
+        self._pos = 0
+        self._parts = []
+        self._marks = 0
+        
+        # Input encoding detected by next_record().
+        self._encoding = None
         
 
     # ------------------------------------------------------------------------    
@@ -146,6 +621,10 @@ class adif(object):
         """
         self.QSO = {}
         self._line = ''
+        self._pos = 0
+        self._parts = []
+        self._marks = 0
+        self._encoding = None
 
     # ------------------------------------------------------------------------ 
     def copy_from(self, adif):
@@ -156,6 +635,10 @@ class adif(object):
         self.QSO = adif.QSO
         self.HEADER = adif.HEADER
         self._line = adif._line
+        self._pos = adif._pos
+        self._parts = list(adif._parts)
+        self._marks = adif._marks
+        self._encoding = adif._encoding
 
     # ------------------------------------------------------------------------    
     def del_field(self, field):
@@ -175,20 +658,13 @@ class adif(object):
         return self._EOH
 
     # ------------------------------------------------------------------------    
-    def get_adif(self, sort=True):
+    def get_adif(self, sort=True, encoding='utf-8'):
         """
         Return the entire ADIF QSO record as a formatted ADIF record.
+        Field lengths are byte counts in encoding, which the record must be
+        written in.
         """
-        adif = ""
-        if sort:
-            fields = sorted(self.QSO.keys())
-        else:
-            fields = list(self.QSO.keys())
-        for field in fields:
-            value = self.QSO[field]
-            adif += '<' + field + ':' + str(len(value)) + '>' + value + ' '
-        adif += '<EOR>'
-        return adif
+        return format_record(self.QSO, sort, encoding=encoding)
 
     # ------------------------------------------------------------------------    
     def get_field(self, field):
@@ -215,11 +691,7 @@ class adif(object):
         """
         Return all header fields as a single string with newlines after each field.
         """
-        hdr = ""
-        for field in sorted(self.HEADER.keys()):
-            value = self.HEADER[field]
-            hdr += '<' + field + ':' + str(len(value)) + '>' + value + '\n'
-        return hdr
+        return ''.join(format_fields(self.HEADER, sorted(self.HEADER), '\n'))
 
     # ------------------------------------------------------------------------    
     def get_record(self):
@@ -239,60 +711,65 @@ class adif(object):
         return False
 
     # ------------------------------------------------------------------------    
-    def next_record(self, file):
+    def next_record(self, file, encoding=None):
         """
         Get the next ADIF record in an open file.
         
         Returns True if a record was parsed successfully, or False otherwise.
         
+        Lines are collected until one containing an <EOR> or <EOH> is read,
+        then joined once and tokenized with scan_record().  Only the new
+        lines are searched for the end tags.  Field lengths are byte counts
+        and each non-ASCII value is decoded once, with the given encoding or
+        the one detected from the input (see detect_encoding()).
+        
+        The file should be opened in binary mode.  Lines read from a text
+        file are converted back to bytes with the file's encoding, and
+        universal newlines make multi-line values one byte shorter per CR LF.
+        
         LIMITATION: Multiple-line fields are converted to a single line.
         Newline characters are replaced with spaces.
         """
-        eor = True # This clears the ADIF record upon first entry into self.parse() in the for() loop
-        
-        # Check if there is an <EOR> in the current line.
-        m = adif_eor_re.search(self._line)
-        if m: 
-            # The current line contains an <EOR>. Parse it.
-            eor = self.parse(self._line, True);
-            if eor:
-                idx = m.end()    # Index of the end of the <EOR> in the string
-                self._line = self._line[idx:] # Remove the part we just parsed
-                return True
-        
-        # Get lines in the file until an <EOR> is found.
-        # Convert multiple lines to a single line.
-        for line in file:
-            self._line += make_utf8(line).replace('\n', ' ').replace('\r', ' ')  # Replace CR/LF with spaces
-            
-            # Check for end of header first.
-            m = adif_eoh_re.search(self._line)
-            if m:
-                # Parse the header.
-                self.parse(self._line, True);
-                idx = m.end()    # Index of the end of the <EOH> in the string
-                self._line = self._line[idx:] # Remove the part we just parsed
-                eor = False
-            
-            m = adif_eor_re.search(self._line)
-            if m:
-                # End of record found.
-                eor = self.parse(self._line, eor);
-                if eor:
-                    idx = m.end()    # Index of the end of the <EOR> in the string
-                    self._line = self._line[idx:] # Remove the part we just parsed
+        if encoding is not None: self._encoding = encoding
+        while True:
+            # Parse the buffered text while it contains an end tag.
+            while (self._marks > 0):
+                if (len(self._parts) > 0):
+                    self._line = self._line[self._pos:] + ''.join(self._parts)
+                    self._pos = 0
+                    self._parts = []
+                qso = {}
+                (status, self._pos) = scan_record(self._line, self._pos, qso, self.HEADER,
+                                                  self._encoding or 'utf-8')
+                self._marks -= 1
+                if (status == SCAN_EOR):
+                    self._EOH = False
+                    self.QSO = qso
                     return True
-
-        # Check whatever is remaining at the end of the current line.
-        m = adif_eor_re.search(self._line)
-        if m:
-            eor = self.parse(self._line, eor)
-            if eor:
-                idx = m.end()    # Index of the end of the <EOR> in the string
-                self._line = self._line[idx:] # Remove the part we just parsed
-                return True
-                
-        return False
+                if (status == SCAN_EOH):
+                    self._EOH = True
+                    self.QSO = {}
+                else:
+                    self._marks = 0  # End tag count was wrong
+            
+            # Get lines in the file until an <EOR> or <EOH> is found.
+            line = file.readline()
+            if (len(line) == 0):
+                if (len(self._parts) > 0) or (self._pos < len(self._line)):
+                    self._line = self._line[self._pos:] + ''.join(self._parts)
+                    self._pos = 0
+                    self._parts = []
+                    incomplete_record(self._line, 0, self._encoding or 'utf-8')
+                    self._line = ''
+                return False
+            if isinstance(line, str):
+                line = line.encode(text_encoding(file), errors='replace')
+            if (self._encoding is None) and not line.isascii():
+                self._encoding = detect_encoding(line)
+            line = bytes_to_text(line)  # Replace CR/LF with spaces
+            self._parts.append(line)
+            if ('<' in line):
+                self._marks += len(adif_marker_re.findall(line))
 
     # ------------------------------------------------------------------------        
     def parse(self, record, new=False):
@@ -302,57 +779,26 @@ class adif(object):
         Clears the record first if new = True
         
         Returns True if an End-Of-Record tag is found, False otherwise.
+        Fields are parsed up to the first <EOR>.  If an <EOH> is found, the
+        header fields are kept and the QSO fields are cleared.  Without
+        either tag, the fields found are kept and the header fields copied.
         
         LIMITATION: Multi-line fields are not supported by this function.
         The next_record() function will combine multi-line fields into a
         single line before calling this function.
         """
         self._EOH = False
-        
-        eor_found = False
         if new: self.clear()
         
-        value = ''
-        
-        m = adif_specifier_re.search(record)
-        while m:
-            tag = m.group(1).upper()   # Group 1 is the ADIF tag
-            sz  = int(m.group(2))      # Group 2 is the specified field length
-            sz1 = len(m.group(4))      # Get the actual length of the field value
-            if (sz1 < sz): sz = sz1    # Use the smaller length; non-UTF-8 chars can mess up the ADIF-specified length
-            value = m.group(4)[0:sz]   # Group 4 is the field value
-            self.QSO[tag] = value
-            
-            pos = int(m.start(4) + sz)
-            record = record[pos:]
-            m = adif_specifier_re.search(record)
-            
-            # Check for header-specific fields.
-            if tag == 'ADIF_VER':
-                self.HEADER[tag] = value
-            elif tag == 'ADIF_VERS':            # Bug in Log4OM
-                self.HEADER[tag] = value
-                self.HEADER['ADIF_VER'] = value # ADIF standard tag name
-            elif tag == 'CREATED_TIMESTAMP':
-                self.HEADER[tag] = value
-            elif tag == 'PROGRAMID':
-                self.HEADER[tag] = value
-            elif tag == 'PROGRAMVERSION':
-                self.HEADER[tag] = value
-            elif tag.startswith('USERDEF'):
-                self.HEADER[tag] = value
-        
-        # Check for end of record.
-        m = adif_eor_re.search(record)
-        if m: eor_found = True
-        
-        # Check for end of header.
-        m = adif_eoh_re.search(record)
-        if m:
-            self.clear()
-            self._EOH = True
-        
-        return eor_found
+        pos = 0
+        while True:
+            (status, pos) = scan_record(record, pos, self.QSO, self.HEADER)
+            if (status == SCAN_EOH):
+                self.clear()
+                self._EOH = True
+                continue
+            if (status == SCAN_END): copy_header_fields(self.QSO, self.HEADER)
+            return (status == SCAN_EOR)
 
     # ------------------------------------------------------------------------    
     def set_field(self, field, value):
@@ -516,14 +962,10 @@ class adifMerge(object):
         -------
         bool : True if minimum QSO criteria met, False otherwise.
         """
-        ok = False
-        a1 = adif(record)
-        
         # Check for minimum QSO fields.
-        if  (a1.has_field('CALL')) and (a1.has_field('BAND')) and (a1.has_field('MODE')) and \
-            (a1.has_field('QSO_DATE')) and (a1.has_field('TIME_ON')):
-                ok = True
-        return ok
+        for field in minimum_qso_fields:
+            if field not in record: return False
+        return True
 
     # -----------------------------------------------------------------------------
     def modeMatch(self, record1, record2):
@@ -612,6 +1054,198 @@ class adifMerge(object):
             match = True
         return match    
 
+    # -----------------------------------------------------------------------------
+    def qsoEpoch(self, record):
+        """
+        Return the QSO start time of a record in seconds since the Unix epoch.
+        Assumes the record has passed the minimumQso() check.
+        
+        Parameters
+        ----------
+        record : dict
+            An ADIF QSO record passed as a Python dictionary.
+        
+        Returns
+        -------
+        int : The QSO start time in UTC seconds, or None if the QSO_DATE or
+            TIME_ON field is not valid.
+        """
+        d = record['QSO_DATE']
+        t = record['TIME_ON']
+        try:
+            tsec = int(t[4:6]) if (len(t) > 4) else 0
+            return calendar.timegm((int(d[0:4]), int(d[4:6]), int(d[6:8]),
+                                    int(t[0:2]), int(t[2:4]), tsec))
+        except ValueError:
+            return None
+
+    # -----------------------------------------------------------------------------
+    def buildIndex(self, records):
+        """
+        Build a match index for a list of QSO records.
+        Records are grouped by (CALL, BAND) and kept sorted by QSO start time
+        within each group, with the upper-case mode and submode precomputed.
+        Records failing the minimumQso() check are not indexed.
+        
+        Parameters
+        ----------
+        records : list
+            A list of ADIF QSO records passed as Python dictionaries.
+        
+        Returns
+        -------
+        index : dict
+            A dictionary keyed by (CALL, BAND) of (epochs, entries) list pairs,
+            where each entry is a (mode, submode, record) tuple.
+        """
+        index = {}
+        for record in records:
+            self._indexAdd(index, record)
+        return index
+
+    # -----------------------------------------------------------------------------
+    def _indexAdd(self, index, record):
+        """
+        Add a QSO record to a match index built by buildIndex().
+        Returns the (key, epoch, entry) added, or None if the record could
+        not be indexed.
+        """
+        if not self.minimumQso(record): return None
+        epoch = self.qsoEpoch(record)
+        if epoch is None: return None
+        key = (record['CALL'].upper(), record['BAND'].upper())
+        entry = (record['MODE'].upper(), record.get('SUBMODE', '').upper(), record)
+        (epochs, entries) = index.setdefault(key, ([], []))
+        i = bisect.bisect_right(epochs, epoch)
+        epochs.insert(i, epoch)
+        entries.insert(i, entry)
+        return (key, epoch, entry)
+
+    # -----------------------------------------------------------------------------
+    def _indexFind(self, index, key, epoch, mode, submode):
+        """
+        Return the indexed record closest in time to a QSO that matches its
+        mode within MaxSeconds, or None if there is none.
+        Uses the same mode rules as modeMatch().
+        """
+        bucket = index.get(key)
+        if bucket is None: return None
+        (epochs, entries) = bucket
+        best = None
+        best_dt = self.MaxSeconds + 1
+        i = bisect.bisect_left(epochs, epoch - self.MaxSeconds)
+        while (i < len(epochs)) and (epochs[i] <= epoch + self.MaxSeconds):
+            (m2, sm2, record) = entries[i]
+            if (len(mode) == 0) or (len(m2) == 0):
+                ok = False  # An empty mode never matches
+            elif (m2 == mode):
+                ok = (len(submode) == 0) or (len(sm2) == 0) or (submode == sm2)
+            else:
+                ok = (mode == sm2) or (m2 == submode)
+            dt = abs(epochs[i] - epoch)
+            if ok and (dt < best_dt):
+                best = record
+                best_dt = dt
+            i += 1
+        return best
+
+    # -----------------------------------------------------------------------------
+    def mergeLog(self, from_records, into_records, update_fields=True, dry_run=False):
+        """
+        Merge all QSO records of one log into another log.
+        Each record in from_records is merged into the closest matching record
+        in into_records as in merge(), or appended to into_records if there is
+        no match.  Matching uses the same rules as match(), but looks up
+        candidates in an index built once for the whole log, so large logs
+        merge in O((n + m) log m) time instead of O(n * m).
+        
+        Parameters
+        ----------
+        from_records : list
+            A list of ADIF QSO records passed as Python dictionaries.  These
+            records are merged into into_records.
+        into_records : list
+            A list of ADIF QSO records passed as Python dictionaries.  The list
+            and its records are modified to become the merged log.
+        update_fields : bool
+            If True, then existing fields in into_records can be modified by
+            from_records if the information is different.  If False, then
+            existing fields in into_records are not modified.
+        dry_run : bool
+            If True, then into_records is not modified and only the statistics
+            are returned.  The statistics are the same as for a real merge:
+            field changes are applied to copies of the matched records, so
+            later records matching the same record see them.
+        
+        Returns
+        -------
+        stats : dict
+            Merge statistics with the following keys:
+            matched : Number of records matching a record in into_records
+            modified : Number of records in into_records modified
+            added : Number of unmatched records appended to into_records
+            skipped : Number of records failing the minimumQso() check
+            fields_added : Number of fields added to existing records
+            fields_updated : Number of existing fields updated
+        """
+        stats = {'matched': 0, 'modified': 0, 'added': 0, 'skipped': 0,
+                 'fields_added': 0, 'fields_updated': 0}
+        index = self.buildIndex(into_records)
+        changed = set()  # ids of into records modified
+        pending = {}     # Dry run copies of matched into records, by id
+        
+        for from_record in from_records:
+            if not self.minimumQso(from_record):
+                stats['skipped'] += 1
+                continue
+            epoch = self.qsoEpoch(from_record)
+            if epoch is None:
+                stats['skipped'] += 1
+                continue
+            key = (from_record['CALL'].upper(), from_record['BAND'].upper())
+            mode = from_record['MODE'].upper()
+            submode = from_record.get('SUBMODE', '').upper()
+            into_record = self._indexFind(index, key, epoch, mode, submode)
+            
+            if into_record is None:
+                # No match: add the record to the log.
+                # Index the stored record, which is a view for a QsoTable.
+                record = from_record
+                if not dry_run:
+                    into_records.append(dict(from_record))
+                    record = into_records[-1]
+                self._indexAdd(index, record)
+                stats['added'] += 1
+                if self.Verbose:
+                    self._print_msg('New QSO ' + key[0] + ' ' + key[1] + ' ' + mode)
+                continue
+            
+            # Merge the QSO records.
+            stats['matched'] += 1
+            target = into_record
+            if dry_run:
+                target = pending.get(id(into_record))
+                if target is None: target = pending[id(into_record)] = dict(into_record)
+            modified = False
+            for (field, data_from) in from_record.items():
+                if field not in target:
+                    stats['fields_added'] += 1
+                elif update_fields and (target[field] != data_from):
+                    stats['fields_updated'] += 1
+                else:
+                    continue
+                modified = True
+                target[field] = data_from
+                if self.Verbose:
+                    self._print_msg(key[0] + ' ' + field + ": '" + data_from + "'")
+            if modified and (id(into_record) not in changed):
+                changed.add(id(into_record))
+                stats['modified'] += 1
+        
+        if self.Verbose:
+            self._print_msg(str(stats))
+        return stats
+
 
 ###############################################################################
 # QSL received class.
@@ -754,6 +1388,88 @@ class qslrcvd(object):
 
         return False
 
+    # ------------------------------------------------------------------------
+    def qsl_mask(self, qso):
+        """
+        Determine the QSL sources confirming a QSO in a single pass over the
+        QSL fields.
+        
+        Parameters
+        ----------
+        qso : dict
+            An ADIF QSO record passed as a Python dictionary.
+        
+        Returns
+        -------
+        int : A bitmask of QSL_CARD, QSL_CLUBLOG, QSL_EQSL, QSL_LOTW and
+            QSL_QRZ.  Zero if no QSL was received.
+        """
+        mask = 0
+        get = qso.get
+        for (bit, field, values) in qsl_predicates:
+            value = get(field)
+            if value:
+                if (values is None) or (value in values): mask |= bit
+        return mask
+
+    # ------------------------------------------------------------------------
+    def evaluate(self, records):
+        """
+        Determine the QSL status of every QSO in a log.
+        
+        Parameters
+        ----------
+        records : iterable
+            ADIF QSO records passed as Python dictionaries.
+        
+        Returns
+        -------
+        The following tuple is returned: (masks, report)
+        masks : array
+            An array of unsigned bytes with the qsl_mask() of each record,
+            in record order.
+        report : dict
+            Confirmation counts and rates with the following keys:
+            total : Number of QSOs
+            confirmed : Number of QSOs confirmed by any source
+            rate : Fraction of QSOs confirmed
+            sources : Dictionary of confirmed QSOs by source name
+            band, mode, year : Dictionaries keyed by band, mode and year of
+                {'total', 'confirmed', 'rate'} dictionaries
+        """
+        masks = array.array('B')
+        groups = {'band': {}, 'mode': {}, 'year': {}}
+        source_counts = dict.fromkeys(qsl_sources, 0)
+        confirmed = 0
+        for qso in records:
+            mask = self.qsl_mask(qso)
+            masks.append(mask)
+            hit = 1 if mask else 0
+            confirmed += hit
+            for bit in source_counts:
+                if (mask & bit): source_counts[bit] += 1
+            keys = (('band', qso.get('BAND', '').lower()),
+                    ('mode', qso.get('MODE', '').upper()),
+                    ('year', qso.get('QSO_DATE', '')[0:4]))
+            for (group, key) in keys:
+                counts = groups[group].get(key)
+                if counts is None:
+                    counts = groups[group][key] = [0, 0]
+                counts[0] += 1
+                counts[1] += hit
+        
+        rate = lambda total, conf: (float(conf) / total) if (total > 0) else 0.0
+        report = {
+            'total'     : len(masks),
+            'confirmed' : confirmed,
+            'rate'      : rate(len(masks), confirmed),
+            'sources'   : {qsl_sources[bit]: n for (bit, n) in source_counts.items()},
+        }
+        for (group, table) in groups.items():
+            report[group] = {key: {'total': t, 'confirmed': c, 'rate': rate(t, c)}
+                             for (key, (t, c)) in sorted(table.items())}
+        return (masks, report)
+
 
 ###########################################################################
 # Main program example test script.
@@ -770,7 +1486,7 @@ if __name__ == "__main__":
     
     count = 0
     myAdif = adif()
-    adif_in = open(adif_file, 'r')
+    adif_in = open(adif_file, 'rb')
     while myAdif.next_record(adif_in):
         count += 1
         #print(myAdif.get_record() + '\n')  # Returns Python dictionary
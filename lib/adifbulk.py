@@ -0,0 +1,207 @@
+###############################################################################
+# adifbulk.py
+# Author: Tom Kerr AB3GY
+#
+# Bulk loading of large ADIF log files.
+# The file is memory-mapped, split into chunks at <EOR> boundaries, and the
+# chunks are parsed in parallel by a process pool.  Records are returned in
+# their original file order.
+#
+# ADIF = Amateur Data Interchange Format
+# Reference: http://www.adif.org
+#
+# Designed for personal use by the author, but available to anyone under the
+# license terms below.
+###############################################################################
+
+###############################################################################
+# License
+# Copyright (c) 2024 Tom Kerr AB3GY (ab3gy@arrl.net).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+# System level packages.
+import concurrent.futures
+import mmap
+import os
+import re
+
+# Local packages.
+from adif import bytes_to_text, detect_encoding, incomplete_record, iter_records, scan_record
+from adif import GZIP_MAGIC, SCAN_EOH, SCAN_EOR
+
+
+##############################################################################
+# Globals.
+##############################################################################
+
+# Byte pattern used to find chunk boundaries in the mapped file.
+eor_bytes_re = re.compile(rb'<EOR>', re.IGNORECASE)
+
+# Files smaller than this are parsed in the calling process.
+MIN_PARALLEL_SIZE = 1000000
+
+# Minimum chunk size in bytes given to each worker.
+MIN_CHUNK_SIZE = 250000
+
+
+##############################################################################
+# Functions.
+##############################################################################
+
+# ----------------------------------------------------------------------------
+def parse_bytes(data, header=None, encoding=None):
+    """
+    Parse all complete QSO records in raw ADIF input.
+    Field lengths are byte counts, and non-ASCII values are decoded with
+    encoding, or the one detected from data if None.
+    Returns a list of QSO dictionaries.
+    """
+    if encoding is None: encoding = detect_encoding(data) or 'utf-8'
+    text = bytes_to_text(data)
+    records = []
+    pos = 0
+    while True:
+        qso = {}
+        start = pos
+        (status, pos) = scan_record(text, pos, qso, header, encoding)
+        if (status == SCAN_EOR):
+            records.append(qso)
+        elif (status != SCAN_EOH):
+            if (len(qso) > 0): incomplete_record(text, start, encoding)
+            return records
+
+# ----------------------------------------------------------------------------
+def _parse_chunk(filename, start, end, encoding):
+    """
+    Process pool worker: parse the records between two byte offsets of a file.
+    Returns (records, header) where records is a list of QSO dictionaries.
+    """
+    header = {}
+    with open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return (parse_bytes(mm[start:end], header, encoding), header)
+
+# ----------------------------------------------------------------------------
+def split_chunks(mm, start, count):
+    """
+    Split a mapped file into about count chunks that end just after an <EOR>.
+    
+    Parameters
+    ----------
+    mm : mmap
+        The mapped ADIF file.
+    start : int
+        Offset of the first chunk.
+    count : int
+        The desired number of chunks.
+    
+    Returns
+    -------
+    chunks : list
+        A list of (start, end) byte offset tuples covering start..len(mm).
+    """
+    size = len(mm)
+    chunk_size = max((size - start) // max(count, 1), MIN_CHUNK_SIZE)
+    chunks = []
+    pos = start
+    while (pos < size):
+        m = eor_bytes_re.search(mm, min(pos + chunk_size, size))
+        end = m.end() if m else size
+        chunks.append((pos, end))
+        pos = end
+    return chunks
+
+# ----------------------------------------------------------------------------
+def load_parallel(filename, workers=None, header=None, encoding=None):
+    """
+    Load all QSO records from an ADIF file using a process pool.
+    
+    Parameters
+    ----------
+    filename : str
+        The ADIF file name.
+    workers : int
+        Number of worker processes.  Defaults to the number of CPUs.
+        Use 1 to parse in the calling process.  Gzip-compressed files are
+        always read in the calling process.
+    header : dict
+        Optional dictionary that receives the header fields.
+    encoding : str
+        The file encoding.  Detected from the file if None; see
+        adif.detect_encoding().
+    
+    Returns
+    -------
+    records : list
+        The QSO records as dictionaries, in file order.
+    """
+    if workers is None: workers = os.cpu_count() or 1
+    with open(filename, 'rb') as f:
+        if (os.fstat(f.fileno()).st_size == 0): return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Compressed files cannot be split; read them sequentially.
+            if (mm[0:2] == GZIP_MAGIC):
+                return [dict(qso) for qso in iter_records(filename, header, encoding)]
+            
+            # Detect the encoding once, so all chunks agree.
+            if encoding is None: encoding = detect_encoding(mm) or 'utf-8'
+            if (workers <= 1) or (len(mm) < MIN_PARALLEL_SIZE):
+                return parse_bytes(mm[0:], header, encoding)
+            chunks = split_chunks(mm, 0, workers * 4)
+    
+    records = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_parse_chunk, filename, s, e, encoding) for (s, e) in chunks]
+        for future in futures:
+            (chunk_records, chunk_header) = future.result()
+            records.extend(chunk_records)
+            if header is not None: header.update(chunk_header)
+    return records
+
+
+##############################################################################
+# Main program.
+##############################################################################
+if __name__ == "__main__":
+    import sys
+    import time
+    
+    if len(sys.argv) < 2:
+        print('Please specify an ADIF input file.')
+        sys.exit(1)
+    workers = None
+    if len(sys.argv) > 2:
+        workers = int(sys.argv[2])
+    
+    header = {}
+    start = time.perf_counter()
+    records = load_parallel(sys.argv[1], workers, header)
+    elapsed = time.perf_counter() - start
+    print('Header fields: {}'.format(header))
+    print('{} ADIF records loaded in {:.2f} s.'.format(len(records), elapsed))
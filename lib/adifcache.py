@@ -0,0 +1,315 @@
+###############################################################################
+# adifcache.py
+# Author: Tom Kerr AB3GY
+#
+# Binary sidecar cache of parsed ADIF log files.
+# The parsed records are stored next to the log (e.g. potarig_log.adif.idx)
+# in blocks of columns, so later loads skip the ADIF parser.  The cache is
+# keyed on the log file size, modification time and a checksum of its tail.
+# When the log has only grown, just the new records are parsed and appended
+# to the cache as a new block.  Otherwise the cache is rebuilt.
+#
+# ADIF = Amateur Data Interchange Format
+# Reference: http://www.adif.org
+#
+# Designed for personal use by the author, but available to anyone under the
+# license terms below.
+###############################################################################
+
+###############################################################################
+# License
+# Copyright (c) 2024 Tom Kerr AB3GY (ab3gy@arrl.net).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors
+# may be used to endorse or promote products derived from this software without
+# specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+###############################################################################
+
+# System level packages.
+import marshal
+import os
+import struct
+import zlib
+
+# Local packages.
+from adif import iter_records, GZIP_MAGIC
+from adifbulk import parse_bytes
+
+
+##############################################################################
+# Globals.
+##############################################################################
+
+CACHE_SUFFIX  = '.idx'
+CACHE_MAGIC   = b'ADIFIDX\x00'
+CACHE_VERSION = 2  # 2: field lengths read as byte counts
+
+# Fixed cache file header: magic, version, log file size, log file mtime in
+# ns, tail checksum, byte offset of the end of the last record in the log,
+# record count, and the end of the valid data in the cache file.
+CACHE_HEADER = struct.Struct('<8sIQqIQQQ')
+
+# Frame length prefix.
+FRAME_LEN = struct.Struct('<I')
+
+# Number of bytes at the end of the log covered by the tail checksum.
+TAIL_SIZE = 4096
+
+# Number of bytes searched backwards at a time for the last <EOR>.
+EOR_SEARCH_SIZE = 65536
+
+
+##############################################################################
+# Functions.
+##############################################################################
+
+# ----------------------------------------------------------------------------
+def cache_name(filename):
+    """
+    Return the sidecar cache file name for an ADIF file.
+    """
+    return str(filename) + CACHE_SUFFIX
+
+# ----------------------------------------------------------------------------
+def tail_checksum(f, size):
+    """
+    Return the CRC-32 of the last TAIL_SIZE bytes before offset size.
+    """
+    start = max(size - TAIL_SIZE, 0)
+    f.seek(start)
+    return zlib.crc32(f.read(size - start))
+
+# ----------------------------------------------------------------------------
+def last_eor(f, start, end):
+    """
+    Return the offset just after the last <EOR> between start and end,
+    or start if there is none.
+    """
+    pos = end
+    while (pos > start):
+        lo = max(pos - EOR_SEARCH_SIZE, start)
+        f.seek(lo)
+        data = f.read(pos - lo + 4).upper()  # An <EOR> may span two windows
+        idx = data.rfind(b'<EOR>')
+        if (idx >= 0): return lo + idx + 5
+        pos = lo
+    return start
+
+# ----------------------------------------------------------------------------
+def encode_block(records):
+    """
+    Encode a list of QSO dictionaries as one columnar block.
+    The block is (tags, columns), with None for fields a record lacks.
+    """
+    tags = {}
+    for qso in records:
+        for tag in qso:
+            if tag not in tags: tags[tag] = len(tags)
+    tags = tuple(tags)
+    columns = tuple(tuple(qso.get(tag) for qso in records) for tag in tags)
+    return marshal.dumps((tags, columns))
+
+# ----------------------------------------------------------------------------
+def decode_block(data):
+    """
+    Decode a block written by encode_block() into a list of QSO dictionaries.
+    """
+    (tags, columns) = marshal.loads(data)
+    return [{t: v for (t, v) in zip(tags, row) if v is not None}
+            for row in zip(*columns)]
+
+# ----------------------------------------------------------------------------
+def parse_range(f, start, end, header=None, encoding=None):
+    """
+    Parse the ADIF records between two byte offsets of an open binary file.
+    Header fields found are added to header.  The encoding is detected
+    from the range if None.
+    Returns a list of QSO dictionaries.
+    """
+    f.seek(start)
+    return parse_bytes(f.read(end - start), header, encoding)
+
+# ----------------------------------------------------------------------------
+def read_cache(cache_file):
+    """
+    Read a sidecar cache file.
+    Returns (fields, header, records) where fields is a dictionary of the
+    fixed header values, or (None, {}, []) if the cache is missing or invalid.
+    """
+    try:
+        with open(cache_file, 'rb') as f:
+            (magic, version, size, mtime, crc, offset, count, data_end) = \
+                CACHE_HEADER.unpack(f.read(CACHE_HEADER.size))
+            if (magic != CACHE_MAGIC) or (version != CACHE_VERSION) or \
+                    (data_end < CACHE_HEADER.size):
+                return (None, {}, [])
+            data = f.read(data_end - CACHE_HEADER.size)
+    except (OSError, struct.error):
+        return (None, {}, [])
+    
+    frames = []
+    pos = 0
+    try:
+        while (pos < len(data)):
+            (n,) = FRAME_LEN.unpack_from(data, pos)
+            pos += FRAME_LEN.size
+            frames.append(data[pos:pos+n])
+            pos += n
+        header = marshal.loads(frames[0])
+        records = []
+        for frame in frames[1:]:
+            records.extend(decode_block(frame))
+    except (IndexError, ValueError, EOFError, TypeError, struct.error):
+        return (None, {}, [])
+    if (len(records) != count):
+        return (None, {}, [])
+    fields = {'size': size, 'mtime': mtime, 'crc': crc, 'offset': offset,
+              'count': count, 'data_end': data_end}
+    return (fields, header, records)
+
+# ----------------------------------------------------------------------------
+def write_cache(cache_file, st, crc, offset, header, records):
+    """
+    Write a new sidecar cache file, replacing any existing one.
+    """
+    frames = [marshal.dumps(header), encode_block(records)]
+    body = b''.join(FRAME_LEN.pack(len(fr)) + fr for fr in frames)
+    data_end = CACHE_HEADER.size + len(body)
+    tmp_file = cache_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, st.st_size,
+            st.st_mtime_ns, crc, offset, len(records), data_end))
+        f.write(body)
+    os.replace(tmp_file, cache_file)
+
+# ----------------------------------------------------------------------------
+def append_cache(cache_file, fields, st, crc, offset, records):
+    """
+    Append a block of new records to an existing sidecar cache file and
+    update its fixed header.  The header is written last, so an interrupted
+    append leaves the previous cache contents valid.
+    """
+    frame = encode_block(records)
+    count = fields['count'] + len(records)
+    with open(cache_file, 'r+b') as f:
+        f.seek(fields['data_end'])
+        f.truncate()
+        if (len(records) > 0):
+            f.write(FRAME_LEN.pack(len(frame)) + frame)
+        data_end = f.tell()
+        f.flush()
+        os.fsync(f.fileno())
+        f.seek(0)
+        f.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, st.st_size,
+            st.st_mtime_ns, crc, offset, count, data_end))
+
+# ----------------------------------------------------------------------------
+def load(filename, header=None, cache_file=None, encoding=None, state=None):
+    """
+    Load all QSO records from an ADIF file using the sidecar cache.
+    
+    Parameters
+    ----------
+    filename : str
+        The ADIF file name.
+    header : dict
+        Optional dictionary that receives the header fields.
+    cache_file : str
+        The cache file name.  Defaults to the ADIF file name plus '.idx'.
+    encoding : str
+        The file encoding.  Detected from the text parsed if None; see
+        adif.detect_encoding().
+    state : dict
+        Optional dictionary that receives 'offset', the byte offset of the
+        end of the last record loaded.  Not set for a gzip file.
+    
+    Returns
+    -------
+    records : list
+        The QSO records as dictionaries, in file order.
+    """
+    if cache_file is None: cache_file = cache_name(filename)
+    if header is None: header = {}
+    if state is None: state = {}
+    
+    with open(filename, 'rb') as f:
+        st = os.fstat(f.fileno())
+        if (f.read(2) == GZIP_MAGIC):
+            return [dict(qso) for qso in iter_records(filename, header, encoding)]
+        crc = tail_checksum(f, st.st_size)
+        
+        (fields, cached_header, records) = read_cache(cache_file)
+        if fields is not None:
+            if (fields['size'] == st.st_size) and (fields['mtime'] == st.st_mtime_ns) \
+                    and (fields['crc'] == crc):
+                header.update(cached_header)
+                state['offset'] = fields['offset']
+                return records
+            if (fields['size'] < st.st_size) and \
+                    (tail_checksum(f, fields['size']) == fields['crc']):
+                # The log has only grown: parse and append the new records.
+                # New header fields mean the cache must be rebuilt.
+                offset = last_eor(f, fields['offset'], st.st_size)
+                new_header = {}
+                new_records = parse_range(f, fields['offset'], offset, new_header, encoding)
+                if (new_header.items() <= cached_header.items()):
+                    try:
+                        append_cache(cache_file, fields, st, crc, offset, new_records)
+                    except OSError as err:
+                        print('ADIF cache write error: {}'.format(str(err)))
+                    header.update(cached_header)
+                    state['offset'] = offset
+                    return records + new_records
+        
+        # No usable cache: parse the whole file and rebuild it.
+        offset = last_eor(f, 0, st.st_size)
+        state['offset'] = offset
+        if (offset == 0):
+            # No records yet, but there may be a header.
+            return parse_range(f, 0, st.st_size, header, encoding)
+        records = parse_range(f, 0, offset, header, encoding)
+    try:
+        write_cache(cache_file, st, crc, offset, header, records)
+    except OSError as err:
+        print('ADIF cache write error: {}'.format(str(err)))
+    return records
+
+
+##############################################################################
+# Main program.
+##############################################################################
+if __name__ == "__main__":
+    import sys
+    import time
+    
+    if len(sys.argv) < 2:
+        print('Please specify an ADIF input file.')
+        sys.exit(1)
+    
+    for i in range(2):
+        start = time.perf_counter()
+        records = load(sys.argv[1])
+        elapsed = time.perf_counter() - start
+        print('{} ADIF records loaded in {:.3f} s.'.format(len(records), elapsed))
@@ -61,6 +61,7 @@ import lib.Logger as log
 import src.app as app
 import src.flrig_api as flrig
 import src.log_adif_api as log_adif
+import src.rig_poller as rig_poller
 
 
 ##############################################################################
@@ -75,34 +76,199 @@ logfile = os.path.join(os.path.abspath('.'), log_base + '.log')
 # Functions.
 ##############################################################################
 
+# Config file sections applied by apply_config(), by component.
+RIG_SECTIONS = ('RIG', 'FLRIG', 'RIGCTLD')
+ADIF_SECTIONS = ('ADIF',)
+MODES_SECTIONS = ('MODES',)
+LOG_SECTIONS = ('LOG',)
+
+#-----------------------------------------------------------------------------
+def log_settings(config):
+    """
+    Return the log.Logger() keyword arguments from the [LOG] section as a
+    dictionary.  Raises ValueError if a setting is invalid.
+    """
+    rotate = config.get('LOG', 'ROTATE').lower()
+    if (len(rotate) == 0): rotate = log.ROTATE_NONE
+    if rotate not in log.ROTATE_MODES:
+        raise ValueError('Unknown LOG ROTATE mode "{}"'.format(rotate))
+    max_bytes = config.get('LOG', 'MAX_BYTES')
+    if (len(max_bytes) == 0): max_bytes = log.DEFAULT_MAX_BYTES
+    backup_count = config.get('LOG', 'BACKUP_COUNT')
+    if (len(backup_count) == 0): backup_count = log.DEFAULT_BACKUP_COUNT
+    when = config.get('LOG', 'WHEN')
+    if (len(when) == 0): when = log.DEFAULT_WHEN
+    queue_size = config.get('LOG', 'QUEUE_SIZE')
+    if (len(queue_size) == 0): queue_size = log.DEFAULT_QUEUE_SIZE
+    overflow = config.get('LOG', 'OVERFLOW').lower()
+    if (len(overflow) == 0): overflow = log.OVERFLOW_DROP
+    if overflow not in log.OVERFLOW_POLICIES:
+        raise ValueError('Unknown LOG OVERFLOW policy "{}"'.format(overflow))
+    return {'rotate': rotate, 'max_bytes': int(max_bytes), 'backup_count': int(backup_count),
+            'when': when, 'queue_size': int(queue_size), 'overflow': overflow}
+
+#-----------------------------------------------------------------------------
+def adif_settings(config):
+    """
+    Return the log_adif.init_api() arguments from the [ADIF] section as a
+    tuple.  Raises ValueError if a setting is invalid.
+    """
+    adif_filename = config.get('ADIF', 'FILENAME')
+    adif_fsync = config.get('ADIF', 'FSYNC')
+    if (len(adif_fsync) == 0): adif_fsync = log_adif.AdifWriter.FSYNC_INTERVAL
+    if adif_fsync.lower() not in log_adif.AdifWriter.FSYNC_POLICIES:
+        raise ValueError('Unknown ADIF FSYNC policy "{}"'.format(adif_fsync))
+    adif_fsync_ms = config.get('ADIF', 'FSYNC_MS')
+    if (len(adif_fsync_ms) == 0): adif_fsync_ms = log_adif.AdifWriter.DEFAULT_FSYNC_INTERVAL_MS
+    adif_follow = config.get('ADIF', 'FOLLOW')
+    if (len(adif_follow) == 0): adif_follow = '1'
+    adif_follow_poll = config.get('ADIF', 'FOLLOW_POLL')
+    if (len(adif_follow_poll) == 0): adif_follow_poll = log_adif.AdifFollower.DEFAULT_POLL_INTERVAL
+    adif_backend = config.get('ADIF', 'BACKEND')
+    if (len(adif_backend) == 0): adif_backend = log_adif.BACKEND_ADIF
+    if adif_backend.lower() not in (log_adif.BACKEND_ADIF, log_adif.BACKEND_SQLITE):
+        raise ValueError('Unknown ADIF backend "{}"'.format(adif_backend))
+    adif_database = config.get('ADIF', 'DATABASE')
+    adif_export = config.get('ADIF', 'EXPORT')
+    if (len(adif_export) > 0) and \
+            (os.path.abspath(adif_export) == os.path.abspath(adif_filename)):
+        raise ValueError('ADIF EXPORT must not be the log file {}'.format(adif_filename))
+    return (adif_filename, adif_fsync.lower(), int(adif_fsync_ms),
+            (adif_follow != '0'), float(adif_follow_poll),
+            adif_backend.lower(), adif_database, adif_export)
+
+#-----------------------------------------------------------------------------
+def rig_settings(config):
+    """
+    Return the flrig.client_init() arguments from the [RIG], [FLRIG] and
+    [RIGCTLD] sections as a tuple.  Raises ValueError if a setting is
+    invalid.
+    """
+    backend = config.get('RIG', 'BACKEND').lower()
+    if (len(backend) == 0): backend = flrig.DEFAULT_BACKEND
+    if backend not in flrig.RIG_BACKENDS:
+        raise ValueError('Unknown rig backend "{}"'.format(backend))
+    if (backend == 'rigctld'):
+        rigctld_host = config.get('RIGCTLD', 'HOST')
+        if (len(rigctld_host) == 0): rigctld_host = flrig.RigctldClient.DEFAULT_HOST
+        rigctld_port = config.get('RIGCTLD', 'PORT')
+        if (len(rigctld_port) == 0): rigctld_port = str(flrig.RigctldClient.DEFAULT_PORT)
+        server_url = '{}:{}'.format(rigctld_host, int(rigctld_port))
+    else:
+        server_url = config.get('FLRIG', 'URL')
+        if (len(server_url) == 0): server_url = flrig.DEFAULT_SERVER_URL
+    connect_timeout = config.get('FLRIG', 'CONNECT_TIMEOUT')
+    if (len(connect_timeout) == 0): connect_timeout = flrig.FlrigClient.DEFAULT_CONNECT_TIMEOUT
+    call_timeout = config.get('FLRIG', 'CALL_TIMEOUT')
+    if (len(call_timeout) == 0): call_timeout = flrig.FlrigClient.DEFAULT_CALL_TIMEOUT
+    return (server_url, float(connect_timeout), float(call_timeout), backend)
+
+#-----------------------------------------------------------------------------
+def start_poller(config):
+    """
+    Start or stop the background rig state poller as set by the [FLRIG]
+    POLL setting.  The poller reads the rig through a client of its own.
+    A running poller is kept, with its state and events, and switched to
+    a client with the current settings.
+    """
+    if (config.get('FLRIG', 'POLL') == '1'):
+        if rig_poller.poller is None:
+            rig_poller.poller = rig_poller.RigPoller(flrig.new_client(), flrig.rig_state)
+        else:
+            rig_poller.poller.set_client(flrig.new_client())
+        rig_poller.poller.start()
+    elif rig_poller.poller is not None:
+        rig_poller.poller.stop()
+
+#-----------------------------------------------------------------------------
+def apply_config(config, sections):
+    """
+    Apply a reloaded config file to the running application.
+    Called by ConfigFile.reload() with the new config and the names of the
+    sections that changed.  All settings are read and checked before any
+    are applied, so an invalid file changes nothing.
+    Returns (status, err_msg).
+    """
+    try:
+        adif_args = adif_settings(config)
+        rig_args = rig_settings(config)
+        log_args = log_settings(config)
+    except ValueError as err:
+        return (False, str(err))
+    modes = config.get_section_items('MODES')
+    
+    # Open the new log file and ADIF log first, so a failure leaves the
+    # running settings as they were.
+    new_logger = None
+    if any(section in sections for section in LOG_SECTIONS):
+        try:
+            new_logger = log.Logger(logfile, install=False, **log_args)
+        except (OSError, ValueError) as err:
+            return (False, 'Log file error: {}'.format(str(err)))
+    if any(section in sections for section in ADIF_SECTIONS):
+        (plan, err_msg) = log_adif.prepare_reconfigure(*adif_args)
+        if plan is None:
+            if new_logger is not None: new_logger.close()
+            return (False, err_msg)
+        (status, err_msg) = log_adif.commit_reconfigure(plan)
+        if not status:
+            if new_logger is not None: new_logger.close()
+            return (status, err_msg)
+    
+    # Nothing below can fail.  The old logger writes its queued messages
+    # and closes before the new one writes.
+    if new_logger is not None:
+        new_logger.install(log.logger)
+        log.logger = new_logger
+    if any(section in sections for section in RIG_SECTIONS):
+        flrig.client_reconfigure(*rig_args)
+        start_poller(config)
+        log.logger.print_and_log('Rig server: {} ({})'.format(rig_args[0], rig_args[3]))
+    if any(section in sections for section in MODES_SECTIONS):
+        flrig.replace_modes(modes)
+    if ('FLASK' in sections):
+        print('Flask settings changed; restart to apply them.')
+    return (True, '')
+
 
 ##############################################################################
 # Main program.
 ############################################################################## 
 if __name__ == "__main__":
     
-    # Start the logger.
-    log.logger = log.Logger(logfile)
-    log.logger.log_msg('{} started.'.format(scriptname))
-    
     # Read the config file.
     config = ConfigFile.ConfigFile()
     (status, err_msg) = config.read(create=False)
     if not status:
         print('Error reading configuration file: {}'.format(err_msg))
     
+    # Start the logger.
+    try:
+        log.logger = log.Logger(logfile, **log_settings(config))
+    except ValueError as err:
+        print('Log configuration error: {}'.format(str(err)))
+        log.logger = log.Logger(logfile)
+    log.logger.log_msg('{} started.'.format(scriptname))
+    
     # Set up the ADIF log file.
-    adif_filename = config.get('ADIF', 'FILENAME')
-    log_adif.init_api(adif_filename)
+    try:
+        log_adif.init_api(*adif_settings(config))
+    except ValueError as err:
+        print('ADIF configuration error: {}'.format(str(err)))
 
-    # Set up the flrig api.
-    server_url = ''
-    if status: 
-        server_url = config.get('FLRIG', 'URL')
-    if (len(server_url) == 0):
-        server_url = flrig.DEFAULT_SERVER_URL
-    log.logger.print_and_log('Flrig server url: {}'.format(server_url))
-    flrig.client_init(server_url)
+    # Set up the rig backend.
+    try:
+        (server_url, connect_timeout, call_timeout, backend) = rig_settings(config)
+    except ValueError as err:
+        print('Rig configuration error: {}'.format(str(err)))
+        (server_url, connect_timeout, call_timeout, backend) = (flrig.DEFAULT_SERVER_URL,
+            flrig.FlrigClient.DEFAULT_CONNECT_TIMEOUT, flrig.FlrigClient.DEFAULT_CALL_TIMEOUT,
+            flrig.DEFAULT_BACKEND)
+    if (backend == 'rigctld'):
+        log.logger.print_and_log('Rigctld server: {}'.format(server_url))
+    else:
+        log.logger.print_and_log('Flrig server url: {}'.format(server_url))
+    flrig.client_init(server_url, connect_timeout, call_timeout, backend)
     if status:
         modes = config.get_section('MODES')
         if (len(modes) > 0):
@@ -110,6 +276,12 @@ if __name__ == "__main__":
         else:
             print('Flrig modes map not found in config file.')
     
+    # Start the background rig state poller.
+    start_poller(config)
+    
+    # Apply changes to the config file while running.
+    config.start_watch(apply_config)
+    
     # Run the Flask simple builtin server.
     flask_host = config.get('FLASK', 'HOST')
     if (len(flask_host) == 0): flask_host = 'localhost'
@@ -117,6 +289,10 @@ if __name__ == "__main__":
     if (len(flask_port) == 0): flask_port = '8080'
     app.run_flask_server(flask_host, flask_port)
     
+    config.stop_watch()
+    if rig_poller.poller is not None:
+        rig_poller.poller.stop()
+    log_adif.close_api()
+    
     log.logger.log_msg('{} exiting.\n'.format(scriptname))
     log.logger.close()
-   
\ No newline at end of file
@@ -4,16 +4,19 @@
 # A Flask web interface for the AB3GY POTA spot application.
 ##############################################################################
 
+import json
 import os
 import time
 from flask import Flask, redirect, render_template, request, make_response
-from flask import session
+from flask import Response, jsonify, session
 
 # Local packages.
 import lib.Logger as log
 import src.flrig_api as flrig
 import src.log_adif_api as log_adif
 import src.potaspots as potaspots
+import src.qso_log as qso_log
+import src.rig_poller as rig_poller
 
 ##############################################################################
 # Globals.
@@ -122,6 +125,7 @@ def route_app_main():
     
     for spot in filtered_spots:
         spot['timeSince'] = int(now - spot['spotTime'])
+    log_adif.annotate_spots(filtered_spots)
     
     html = render_template('app_main.html',
         create_time=create_time,
@@ -142,6 +146,78 @@ def route_app_flrig():
         flrig.set_xcvr(mode, freq)
     return ('', 204) # 204 No Content
 
+#-----------------------------------------------------------------------------
+@app.route('/rigstate', methods=['GET'])
+def route_app_rigstate():
+    """
+    Return the transceiver state as JSON.
+    Optional max_age parameter = maximum age in seconds of cached values.
+    """
+    max_age = request.args.get('max_age', type=float)
+    state = flrig.get_rig_state(max_age)
+    state['stats'] = dict(flrig.xcvr_stats)
+    return jsonify(state)
+
+#-----------------------------------------------------------------------------
+@app.route('/rigevents', methods=['GET'])
+def route_app_rigevents():
+    """
+    Stream rig state change events to the browser as Server-Sent Events.
+    The current state is sent first, followed by each change published by
+    the background rig poller.
+    """
+    poller = rig_poller.poller
+    if poller is None:
+        return ('', 204) # 204 No Content
+
+    def event_stream():
+        (seq, state) = poller.snapshot()
+        for field, value in state.items():
+            yield 'data: {}\n\n'.format(json.dumps({'field': field, 'value': value}))
+        while poller.is_running():
+            events = poller.events_since(seq, timeout=15.0)
+            if (len(events) == 0):
+                yield ': keepalive\n\n'
+            for event in events:
+                seq = event['seq']
+                yield 'data: {}\n\n'.format(json.dumps(event))
+
+    return Response(event_stream(), mimetype='text/event-stream')
+
+#-----------------------------------------------------------------------------
+@app.route('/api/log', methods=['GET'])
+def route_app_api_log():
+    """
+    Return logged QSOs as JSON.
+    Optional filter parameters: call, park, band, mode, date, from, to
+    (dates in YYYYMMDD format).
+    Optional sort = date, call, band, mode or park; order = asc or desc;
+    offset and limit for pagination.
+    """
+    filters = {
+        'call'      : request.args.get('call', ''),
+        'park'      : request.args.get('park', ''),
+        'band'      : request.args.get('band', ''),
+        'mode'      : request.args.get('mode', ''),
+        'date'      : request.args.get('date', ''),
+        'date_from' : request.args.get('from', ''),
+        'date_to'   : request.args.get('to', ''),
+    }
+    sort = request.args.get('sort', 'date')
+    reverse = (request.args.get('order', 'desc').lower() != 'asc')
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', qso_log.DEFAULT_LIMIT, type=int)
+    (total, qsos) = log_adif.query_log(filters, sort, reverse, offset, limit)
+    return jsonify({'total': total, 'offset': offset, 'count': len(qsos), 'qsos': qsos})
+
+#-----------------------------------------------------------------------------
+@app.route('/api/stats', methods=['GET'])
+def route_app_api_stats():
+    """
+    Return the park-hunting statistics as JSON.
+    """
+    return jsonify(log_adif.get_stats())
+
 #-----------------------------------------------------------------------------
 @app.route('/logdata', methods=['GET'])
 def route_app_logdata():
@@ -2,34 +2,282 @@
 # flrig_api.py
 #
 # A flrig interface for the AB3GY POTA spot application.
+# The transceiver is controlled through a rig backend client:
+#    flrig   : lib/FlrigClient.py (xmlrpc over HTTP)
+#    rigctld : lib/RigctldClient.py (Hamlib rigctld TCP line protocol)
+# Both clients provide the same command methods (get_vfo, set_vfo, get_mode,
+# set_mode, get_bw, get_ptt, get_split, ...), return strings or lists, and
+# set their errmsg attribute to a non-empty string when a command fails.
 # FLRIG references:
 #    http://www.w1hkj.com/
 #    http://www.w1hkj.com/flrig-help/
+# Hamlib references:
+#    https://hamlib.github.io/
 ##############################################################################
 
+# System packages.
+import threading
+import time
+
 # Local packages.
+import lib.adif as adif
 import lib.FlrigClient as FlrigClient
 import lib.Logger as log
+import lib.RigctldClient as RigctldClient
 
 ##############################################################################
 # Globals.
 ############################################################################## 
 DEFAULT_SERVER_URL = 'http://localhost:12345'
-flrig_client = None
+DEFAULT_BACKEND = 'flrig'
+DEFAULT_STATE_TTL = 1.0  # Seconds a cached rig state value remains fresh
+PLAN_MAX_AGE = 1.0       # Oldest cached value in seconds trusted to skip a command
+flrig_client = None  # The rig backend client (FlrigClient or RigctldClient)
+client_args = None   # The (server_url, connect_timeout, call_timeout, backend) in use
 modes_map = {}
+rig_state = None
+
+# Tune request statistics.
+xcvr_stats = {
+    'requests'       : 0,  # Number of set_xcvr requests
+    'commands_sent'  : 0,  # Rig commands sent by set_xcvr
+    'commands_saved' : 0,  # Rig commands avoided because the rig was already set
+}
+_stats_lock = threading.Lock()
+
+
+##############################################################################
+# RigState class.
+##############################################################################
+class RigState(object):
+    """
+    Cache of the last known transceiver state.
+    Holds the VFO frequency, mode, bandwidth, PTT and split state along with
+    the time each value was obtained.  Values older than the TTL are stale
+    and are re-read from the rig.  Thread-safe.
+    """
+    FIELDS = ('vfo', 'mode', 'bw', 'ptt', 'split')
+    
+    # ------------------------------------------------------------------------
+    def __init__(self, ttl=DEFAULT_STATE_TTL):
+        """
+        Class constructor.
+        
+        Parameters
+        ----------
+        ttl : float
+            Default time in seconds that a cached value remains fresh.
+        """
+        self.ttl = float(ttl)
+        self._values = {}
+        self._times = {}
+        self._lock = threading.Lock()
+    
+    # ------------------------------------------------------------------------
+    def get(self, field, max_age=None):
+        """
+        Return the cached value of a field, or None if it is missing or older
+        than max_age seconds (the TTL if max_age is None).
+        """
+        if max_age is None: max_age = self.ttl
+        with self._lock:
+            if field not in self._values: return None
+            if ((time.monotonic() - self._times[field]) > max_age): return None
+            return self._values[field]
+    
+    # ------------------------------------------------------------------------
+    def put(self, field, value):
+        """
+        Store a field value obtained from, or just written to, the rig.
+        """
+        with self._lock:
+            self._values[field] = value
+            self._times[field] = time.monotonic()
+    
+    # ------------------------------------------------------------------------
+    def invalidate(self, field=None):
+        """
+        Discard one cached field, or all of them if field is None.
+        """
+        with self._lock:
+            if field is None:
+                self._values.clear()
+                self._times.clear()
+            else:
+                self._values.pop(field, None)
+                self._times.pop(field, None)
+    
+    # ------------------------------------------------------------------------
+    def snapshot(self):
+        """
+        Return all cached values and their ages in seconds as a dictionary.
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = dict(self._values)
+            state['age'] = {k: round(now - t, 3) for k,t in self._times.items()}
+        return state
 
 
 ##############################################################################
 # Functions.
 ############################################################################## 
 
+# Rig backend client classes by backend name.
+RIG_BACKENDS = {
+    'flrig'   : FlrigClient.FlrigClient,
+    'rigctld' : RigctldClient.RigctldClient,
+}
+
 #-----------------------------------------------------------------------------
-def client_init(server_url=DEFAULT_SERVER_URL):
+def client_init(server_url=DEFAULT_SERVER_URL, 
+                connect_timeout=FlrigClient.DEFAULT_CONNECT_TIMEOUT,
+                call_timeout=FlrigClient.DEFAULT_CALL_TIMEOUT,
+                backend=DEFAULT_BACKEND):
     """
-    Initialize the FlrigClient object.
+    Initialize the rig backend client.
+    backend is 'flrig' (server_url is the flrig xmlrpc URL) or 'rigctld'
+    (server_url is the rigctld 'host:port' address).
+    The client keeps a persistent connection to the rig server and is shared
+    by all request threads.
     """
     global flrig_client
-    flrig_client = FlrigClient.FlrigClient(server_url)
+    global client_args
+    global rig_state
+    backend = backend.lower()
+    if backend not in RIG_BACKENDS:
+        print('Unknown rig backend "{}", using {}'.format(backend, DEFAULT_BACKEND))
+        backend = DEFAULT_BACKEND
+    flrig_client = RIG_BACKENDS[backend](server_url, connect_timeout, call_timeout)
+    client_args = (server_url, connect_timeout, call_timeout, backend)
+    rig_state = RigState()
+
+#-----------------------------------------------------------------------------
+def new_client():
+    """
+    Return a new rig backend client with the current settings, for a
+    thread that should not share the request threads' client and errmsg
+    (such as the rig poller).  Returns None before client_init().
+    """
+    if client_args is None: return None
+    (server_url, connect_timeout, call_timeout, backend) = client_args
+    return RIG_BACKENDS[backend](server_url, connect_timeout, call_timeout)
+
+#-----------------------------------------------------------------------------
+def client_reconfigure(server_url=DEFAULT_SERVER_URL,
+                       connect_timeout=FlrigClient.DEFAULT_CONNECT_TIMEOUT,
+                       call_timeout=FlrigClient.DEFAULT_CALL_TIMEOUT,
+                       backend=DEFAULT_BACKEND):
+    """
+    Replace the rig backend client with one using new settings.
+    Requests already running keep using the old client, which is closed
+    when they release it.  The rig state cache is kept if the backend and
+    server are unchanged, and cleared otherwise.
+    Returns the new client.
+    """
+    global flrig_client
+    global client_args
+    global rig_state
+    backend = backend.lower()
+    if backend not in RIG_BACKENDS:
+        print('Unknown rig backend "{}", using {}'.format(backend, DEFAULT_BACKEND))
+        backend = DEFAULT_BACKEND
+    client = RIG_BACKENDS[backend](server_url, connect_timeout, call_timeout)
+    old_client = flrig_client
+    same_rig = (type(old_client) is type(client)) and \
+        (getattr(old_client, 'server_url', None) == server_url)
+    flrig_client = client
+    client_args = (server_url, connect_timeout, call_timeout, backend)
+    if rig_state is None:
+        rig_state = RigState()
+    elif not same_rig:
+        rig_state.invalidate()
+    return client
+
+#-----------------------------------------------------------------------------
+def _cached_read(field, method, max_age=None, client=None):
+    """
+    Return a rig state field from the cache, reading it from the rig with
+    the named client method when the cached value is missing or older than
+    max_age seconds.
+    Use max_age=0 to force a read from the rig.
+    Returns an empty string if the value can not be read.
+    """
+    global flrig_client
+    global rig_state
+    if rig_state is not None:
+        value = rig_state.get(field, max_age)
+        if value is not None: return value
+    if client is None: client = flrig_client
+    if client is None: return ''
+    value = getattr(client, method)()
+    if (len(client.errmsg) == 0) and (rig_state is not None):
+        rig_state.put(field, value)
+    return value
+
+#-----------------------------------------------------------------------------
+def _cached_write(field, method, value, client):
+    """
+    Write a value to the rig with the named client method and, if
+    successful, store it in the cache.
+    The VFO is cached as a string in the same format flrig returns it.
+    """
+    global rig_state
+    getattr(client, method)(value)
+    if (len(client.errmsg) == 0) and (rig_state is not None):
+        if (field == 'vfo'): value = str(int(value))
+        rig_state.put(field, value)
+    elif rig_state is not None:
+        rig_state.invalidate(field)
+
+#-----------------------------------------------------------------------------
+def get_vfo(max_age=None):
+    """
+    Return the current VFO frequency in Hz as a string.
+    """
+    return _cached_read('vfo', 'get_vfo', max_age)
+
+#-----------------------------------------------------------------------------
+def get_mode(max_age=None):
+    """
+    Return the current transceiver mode.
+    """
+    return _cached_read('mode', 'get_mode', max_age)
+
+#-----------------------------------------------------------------------------
+def get_bw(max_age=None):
+    """
+    Return the current VFO bandwidth as a list.
+    """
+    return _cached_read('bw', 'get_bw', max_age)
+
+#-----------------------------------------------------------------------------
+def get_ptt(max_age=None):
+    """
+    Return the PTT state (1 = on, 0 = off) as a string.
+    """
+    return _cached_read('ptt', 'get_ptt', max_age)
+
+#-----------------------------------------------------------------------------
+def get_split(max_age=None):
+    """
+    Return the split state (1 = on, 0 = off) as a string.
+    """
+    return _cached_read('split', 'get_split', max_age)
+
+#-----------------------------------------------------------------------------
+def get_rig_state(max_age=None):
+    """
+    Return the transceiver state as a dictionary, reading any values that
+    are missing from the cache or older than max_age seconds.
+    """
+    return {
+        'vfo'   : get_vfo(max_age),
+        'mode'  : get_mode(max_age),
+        'bw'    : get_bw(max_age),
+        'ptt'   : get_ptt(max_age),
+        'split' : get_split(max_age),
+    }
 
 #-----------------------------------------------------------------------------
 def set_modes(modes_dict):
@@ -41,13 +289,26 @@ def set_modes(modes_dict):
         modes_map[k.upper()] = v.upper()
 
 #-----------------------------------------------------------------------------
-def set_xcvr(mode, freq):
+def replace_modes(modes_dict):
     """
-    Set transcriver mode and frequency.
+    Replace the modes dictionary that maps POTA modes to transceiver modes.
+    The new map is built first and swapped in with one assignment, so a
+    tune request uses either the old or the new map.
     """
-    global flrig_client
     global modes_map
+    modes_map = {k.upper(): v.upper() for k,v in modes_dict.items()}
 
+#-----------------------------------------------------------------------------
+def resolve_mode(mode, freq):
+    """
+    Convert a POTA spot mode and frequency in KHz to the transceiver mode
+    and frequency in Hz.
+    PHONE and SSB are mapped to LSB below 9 MHz and USB above, then the mode
+    is translated through the modes map.
+    Returns a tuple (freq_hz, xcvr_mode); freq_hz is 0.0 if freq is empty.
+    """
+    modes = modes_map
+    
     if (len(freq) > 0):
         freq_hz = float(freq) * 1000.0
     else:
@@ -59,26 +320,130 @@ def set_xcvr(mode, freq):
             mode = 'LSB'
         else:
             mode = 'USB'
-    if mode in modes_map.keys():
-        xcvr_mode = modes_map[mode]
-    else:
-        xcvr_mode = mode
+    xcvr_mode = modes.get(mode, mode)
+    return (freq_hz, xcvr_mode)
+
+#-----------------------------------------------------------------------------
+def plan_xcvr(freq_hz, xcvr_mode):
+    """
+    Compare a tune request against the last known rig state and decide which
+    commands need to be sent.
+    The frequency is set if it differs from the cached VFO.  The mode is set
+    if it differs from the cached mode, or if setting the frequency changes
+    band, because a band change can recall a different mode from the band
+    stack.  If the VFO is not cached the band is unknown, so the mode is
+    set too.  The VFO only needs to be read back after a mode change.
+    Only values younger than PLAN_MAX_AGE are trusted, even while the
+    poller keeps the cache fresh for longer, so a click after the knob was
+    turned is not skipped.
+    Returns a tuple (set_vfo, set_mode, verify_vfo) of booleans.
+    """
+    global rig_state
+    cached_vfo = None
+    cached_mode = None
+    if rig_state is not None:
+        cached_vfo = rig_state.get('vfo', PLAN_MAX_AGE)
+        cached_mode = rig_state.get('mode', PLAN_MAX_AGE)
+    
+    vfo_known = (cached_vfo is not None) and (len(cached_vfo) > 0)
+    set_vfo = False
+    if (freq_hz > 0.0):
+        set_vfo = True
+        if vfo_known:
+            set_vfo = (float(cached_vfo) != freq_hz)
     
-    if flrig_client is not None:
-        # Set the frequency first in case this causes a band change.
-        if (freq_hz > 0.0): flrig_client.set_vfo(freq_hz)
-        if (len(xcvr_mode) > 0): flrig_client.set_mode(xcvr_mode)
+    set_mode = False
+    if (len(xcvr_mode) > 0):
+        set_mode = (cached_mode != xcvr_mode)
+        if set_vfo and not set_mode:
+            if vfo_known:
+                old_band = adif.freq2band(float(cached_vfo) / 1000000.0)
+                new_band = adif.freq2band(freq_hz / 1000000.0)
+                set_mode = (old_band != new_band)
+            else:
+                set_mode = True
+    
+    verify_vfo = set_mode and (freq_hz > 0.0)
+    return (set_vfo, set_mode, verify_vfo)
+
+#-----------------------------------------------------------------------------
+def _count_saved(freq_hz, xcvr_mode, sent):
+    """
+    Add the number of commands avoided by a tune request to the statistics.
+    The full sequence is set VFO, set mode and read back VFO.
+    """
+    global xcvr_stats
+    full = 1
+    if (freq_hz > 0.0): full += 1
+    if (len(xcvr_mode) > 0): full += 1
+    saved = max(full - sent, 0)
+    with _stats_lock:
+        xcvr_stats['requests'] += 1
+        xcvr_stats['commands_sent'] += sent
+        xcvr_stats['commands_saved'] += saved
+    return saved
+
+#-----------------------------------------------------------------------------
+def set_xcvr(mode, freq):
+    """
+    Set transcriver mode and frequency.
+    Only the commands that change the rig state are sent.
+    The whole request uses the client in place when it starts, even if the
+    configuration is reloaded while it runs.
+    """
+    global flrig_client
+    global rig_state
+
+    (freq_hz, xcvr_mode) = resolve_mode(mode, freq)
+    client = flrig_client
+    
+    if client is not None:
+        (set_vfo, set_mode, verify_vfo) = plan_xcvr(freq_hz, xcvr_mode)
+        sent = 0
+        set_freq = ''
+        if hasattr(client, 'tune'):
+            # Backends that support pipelining set the frequency and mode
+            # and read back the frequency in one round trip.
+            if set_vfo or set_mode:
+                set_freq = client.tune(freq_hz if set_vfo else 0.0, 
+                                       xcvr_mode if set_mode else '')
+                sent = int(set_vfo) + int(set_mode) + 1
+                if rig_state is not None:
+                    rig_state.invalidate('bw')
+                    if (len(client.errmsg) == 0):
+                        if set_mode: rig_state.put('mode', xcvr_mode)
+                        rig_state.put('vfo', set_freq)
+                    else:
+                        rig_state.invalidate()
+        else:
+            # Set the frequency first in case this causes a band change.
+            # Successful writes update the rig state cache (write-through).
+            if set_vfo: 
+                _cached_write('vfo', 'set_vfo', freq_hz, client)
+                sent += 1
+            if set_mode: 
+                _cached_write('mode', 'set_mode', xcvr_mode, client)
+                sent += 1
+                # A mode change can alter the VFO and bandwidth.
+                if rig_state is not None:
+                    rig_state.invalidate('vfo')
+                    rig_state.invalidate('bw')
+            if verify_vfo:
+                set_freq = _cached_read('vfo', 'get_vfo', 0, client)
+                sent += 1
         
         # Check frequency in case a mode change altered it.
-        set_freq = flrig_client.get_vfo()
         if (len(set_freq) > 0) and (freq_hz > 0.0):
             f_set_freq = float(set_freq)
             if (f_set_freq != freq_hz):
-                flrig_client.set_vfo(freq_hz)
+                _cached_write('vfo', 'set_vfo', freq_hz, client)
+                sent += 1
+        saved = _count_saved(freq_hz, xcvr_mode, sent)
     
         if log.logger is not None:
-            msg =  'Mode: {} '.format(flrig_client.get_mode())
-            msg += 'VFO: {}'.format(flrig_client.get_vfo())
+            msg =  'Mode: {} '.format(_cached_read('mode', 'get_mode', None, client))
+            msg += 'VFO: {} '.format(_cached_read('vfo', 'get_vfo', None, client))
+            msg += '({} commands saved)'.format(saved)
             log.logger.print_and_log(msg)
 
 
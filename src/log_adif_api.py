@@ -6,17 +6,51 @@
 ##############################################################################
 
 # System packages.
+import atexit
+import collections
 from datetime import datetime, timezone
 from pathlib import Path
+import threading
 import time
 
 # Local packages.
 import lib.adif as adif
+import lib.AdifDatabase as AdifDatabase
+import lib.AdifFollower as AdifFollower
+import lib.AdifWriter as AdifWriter
+import lib.adifcache as adifcache
+import src.log_stats as log_stats
+import src.qso_log as qso_log
+import src.worked_index as worked_index
 
 ##############################################################################
 # Globals.
 ############################################################################## 
+BACKEND_ADIF   = 'adif'    # Append QSOs to the ADIF log file
+BACKEND_SQLITE = 'sqlite'  # Store QSOs in an SQLite database
+
 adif_filename = None
+adif_backend = BACKEND_ADIF
+adif_writer = None
+adif_follower = None
+adif_db = None
+adif_export = None  # ADIF file written from the database on close, or None
+worked = worked_index.WorkedIndex()
+logbook = qso_log.QsoLog()
+stats = log_stats.LogStats()
+
+# Records written by log_data() not yet seen by the follower, so they are
+# not counted twice.  Keyed by the formatted ADIF record.
+own_records = collections.Counter()
+own_lock = threading.Lock()
+writer_lock = threading.Lock()
+
+# Writer settings kept for reopening the file after rotation.
+writer_args = ()
+
+# open_log() arguments of the log in use, for reopening it if a new log
+# that replaced it can not be opened.
+open_args = ()
 
 
 ##############################################################################
@@ -24,29 +58,463 @@ adif_filename = None
 ############################################################################## 
 
 #-----------------------------------------------------------------------------
-def init_api(filename):
+def init_api(filename, fsync_policy=AdifWriter.FSYNC_INTERVAL,
+             fsync_interval_ms=AdifWriter.DEFAULT_FSYNC_INTERVAL_MS,
+             follow=True, follow_poll=AdifFollower.DEFAULT_POLL_INTERVAL,
+             backend=BACKEND_ADIF, db_filename='', export_filename=''):
     """
     Initialize the ADIF logging api.
+    
+    With the 'adif' backend, QSOs are appended to the ADIF log file, which
+    is kept open for the life of the application and created with a header
+    if it does not exist.  See AdifWriter for the fsync policies.  If follow
+    is True, QSOs appended to the file by other programs are added as well,
+    checking the file at least every follow_poll seconds.
+    
+    With the 'sqlite' backend, QSOs are stored in the SQLite database
+    db_filename (default: the ADIF file name with a .db suffix).  A new
+    database is filled from the ADIF log file, which is then only read.
+    If export_filename is given, the database is written to that ADIF file
+    when the log is closed.  It must not be the ADIF log file, which other
+    loggers may still be appending to.
+    
+    The QSOs already in the log are loaded into the worked index, the
+    queryable log and the statistics.
+    """
+    if (len(filename) == 0): return
+    log = open_log(filename, fsync_policy, fsync_interval_ms, backend, db_filename,
+                   export_filename)
+    if log is None: return
+    with writer_lock:
+        install_log(log)
+        if follow: start_follower(follow_poll, log['offset'])
+    atexit.register(close_api)
+
+#-----------------------------------------------------------------------------
+def open_log(filename, fsync_policy, fsync_interval_ms, backend, db_filename,
+             export_filename=''):
+    """
+    Open the ADIF log file or database and index the QSOs in it, without
+    changing the log in use, so a new log can be prepared while the
+    current one keeps working.  See init_api() for the parameters.
+    
+    Returns a dictionary with the keys filename, backend, writer, db,
+    export, writer_args, args, offset (where the indexed ADIF records end)
+    and indexes (worked, logbook, stats), or None if the database can not
+    be opened.  writer is None if the ADIF log file
+    can not be opened.
+    """
+    args = (filename, fsync_policy, fsync_interval_ms, backend, db_filename,
+            export_filename)
+    filename = Path(filename)
+    log = {
+        'args'        : args,
+        'filename'    : filename,
+        'backend'     : backend,
+        'writer'      : None,
+        'db'          : None,
+        'export'      : None,
+        'offset'      : None,
+        'writer_args' : (fsync_policy, fsync_interval_ms),
+    }
+    if (backend == BACKEND_SQLITE):
+        if (len(str(export_filename)) > 0):
+            if (Path(export_filename).resolve() == filename.resolve()):
+                print('ADIF export file must not be the log file {}'.format(filename))
+                return None
+            log['export'] = Path(export_filename)
+        if (len(str(db_filename)) == 0): db_filename = filename.with_suffix('.db')
+        db = AdifDatabase.AdifDatabase(db_filename)
+        if not db.open(): return None
+        if (db.count() == 0) and filename.exists():
+            count = db.import_adif(filename)
+            print('Imported {} QSOs from {} into {}'.format(count, filename, db_filename))
+        log['db'] = db
+        log['indexes'] = build_indexes(list(db.records()), db_filename)
+        return log
+    
+    if (backend != BACKEND_ADIF):
+        print('Unknown ADIF backend "{}", using {}'.format(backend, BACKEND_ADIF))
+        log['backend'] = BACKEND_ADIF
+    records = []
+    state = {}
+    if filename.exists():
+        try:
+            records = adifcache.load(filename, state=state)
+        except Exception as err:
+            print('ADIF log load error: {}'.format(str(err)))
+    log['indexes'] = build_indexes(records, filename)
+    log['offset'] = state.get('offset')
+    writer = AdifWriter.AdifWriter(filename, fsync_policy, fsync_interval_ms)
+    if writer.open():
+        log['writer'] = writer
+    return log
+
+#-----------------------------------------------------------------------------
+def install_log(log):
+    """
+    Make a log returned by open_log() the one in use.
+    The caller must hold writer_lock.
     """
     global adif_filename
-    if (len(filename) > 0):
-        adif_filename = Path(filename)
-        if not adif_filename.exists():
-            with open(adif_filename, 'w') as f:
-                header='potarig log file <eoh>\n'
-                try:
-                    f.write(header)
-                except Exception as err:
-                    print('ADIF file create error: {}'.format(str(err)))
-        
+    global adif_backend
+    global adif_writer
+    global adif_db
+    global adif_export
+    global writer_args
+    global open_args
+    global worked
+    global logbook
+    global stats
+    adif_filename = log['filename']
+    adif_backend = log['backend']
+    adif_writer = log['writer']
+    adif_db = log['db']
+    adif_export = log['export']
+    writer_args = log['writer_args']
+    open_args = log['args']
+    (worked, logbook, stats) = log['indexes']
+    with own_lock:
+        own_records.clear()
+
+#-----------------------------------------------------------------------------
+def start_follower(follow_poll, offset=None):
+    """
+    Start following the ADIF log file for QSOs written by other programs.
+    Only used with the 'adif' backend while the log file is open.
+    To start where open_log() indexed the file, pass its offset and hold
+    writer_lock from install_log() on, so no QSO is missed or counted twice.
+    Otherwise the follower starts at the end of the file.
+    """
+    global adif_follower
+    if (adif_writer is None) or (adif_follower is not None): return
+    adif_follower = AdifFollower.AdifFollower(adif_filename, offset=offset,
+                                              poll_interval=follow_poll)
+    adif_follower.subscribe(on_log_event)
+    adif_follower.start()
+
+#-----------------------------------------------------------------------------
+def stop_follower():
+    """
+    Stop following the ADIF log file.
+    """
+    global adif_follower
+    if adif_follower is not None:
+        adif_follower.stop()
+        adif_follower = None
+
+#-----------------------------------------------------------------------------
+def log_paths(filename, db, export):
+    """
+    Return the set of resolved file paths used by a log.
+    """
+    paths = {Path(filename).resolve()}
+    if db is not None: paths.add(Path(db).resolve())
+    if export is not None: paths.add(Path(export).resolve())
+    return paths
+
+#-----------------------------------------------------------------------------
+def prepare_reconfigure(filename, fsync_policy=AdifWriter.FSYNC_INTERVAL,
+                        fsync_interval_ms=AdifWriter.DEFAULT_FSYNC_INTERVAL_MS,
+                        follow=True, follow_poll=AdifFollower.DEFAULT_POLL_INTERVAL,
+                        backend=BACKEND_ADIF, db_filename='', export_filename=''):
+    """
+    Check new ADIF settings to apply at runtime and open what they need,
+    without changing the log in use.  See init_api() for the parameters.
+    
+    If the log file, backend and database are unchanged, only a new writer
+    is opened for changed fsync settings and the indexes are kept.  A new
+    log is opened and indexed here, unless it shares a file with the log
+    in use; that one is opened by commit_reconfigure() after the old log
+    is closed, so the new log sees every QSO written to the old one.
+    
+    Returns (plan, err_msg).  plan is None on error; otherwise it must be
+    passed to commit_reconfigure().
+    """
+    if (len(filename) == 0): return (None, 'No ADIF log file name')
+    path = Path(filename)
+    if (backend == BACKEND_SQLITE) and (len(str(db_filename)) == 0):
+        db_filename = path.with_suffix('.db')
+    export = Path(export_filename) if (len(str(export_filename)) > 0) else None
+    if (backend == BACKEND_SQLITE) and (export is not None) and \
+            (export.resolve() == path.resolve()):
+        return (None, 'ADIF export file must not be the log file {}'.format(filename))
+    same_log = (path == adif_filename) and (backend == adif_backend)
+    if same_log and (adif_db is not None):
+        same_log = (Path(db_filename) == Path(adif_db.filename))
+    plan = {
+        'args'        : (path, fsync_policy, fsync_interval_ms, backend, db_filename,
+                         export_filename),
+        'name'        : db_filename or filename,
+        'same_log'    : same_log,
+        'export'      : export,
+        'log'         : None,
+        'writer'      : None,
+        'follow'      : follow,
+        'follow_poll' : follow_poll,
+    }
+    
+    if same_log:
+        if (adif_writer is not None) and (writer_args != (fsync_policy, fsync_interval_ms)):
+            writer = AdifWriter.AdifWriter(path, fsync_policy, fsync_interval_ms)
+            if not writer.open():
+                return (None, 'Can not open ADIF log {}'.format(filename))
+            plan['writer'] = writer
+        return (plan, '')
+    
+    if (adif_filename is not None):
+        old_db = adif_db.filename if (adif_db is not None) else None
+        new_db = db_filename if (backend == BACKEND_SQLITE) else None
+        if log_paths(adif_filename, old_db, adif_export) & log_paths(path, new_db, export):
+            return (plan, '')  # Opened after the old log is closed
+    log = open_log(*plan['args'])
+    if (log is None) or ((log['writer'] is None) and (log['db'] is None)):
+        if log is not None: discard_log(log)
+        return (None, 'Can not open ADIF log {}'.format(plan['name']))
+    plan['log'] = log
+    return (plan, '')
+
+#-----------------------------------------------------------------------------
+def commit_reconfigure(plan):
+    """
+    Make the log prepared by prepare_reconfigure() the one in use.
+    The swap is done while holding writer_lock, so each QSO is logged to
+    either the old or the new log, and the old log is closed.
+    
+    A new log that shares a file with the old one is opened after the old
+    log is closed; QSOs in an old database that are missing from the new
+    ADIF log file are appended to it.  If it can not be opened, the old
+    log is reopened.  Nothing else can fail.
+    
+    Returns (status, err_msg).
+    """
+    global adif_writer
+    global adif_db
+    global adif_export
+    global writer_args
+    if plan['same_log']:
+        if (adif_db is not None):
+            adif_export = plan['export']
+        elif (plan['writer'] is not None):
+            with writer_lock:
+                adif_writer.close()
+                adif_writer = plan['writer']
+                writer_args = plan['args'][1:3]
+        set_follower(plan['follow'], plan['follow_poll'])
+        return (True, '')
+    
+    following = (adif_follower is not None)
+    stop_follower()
+    status = True
+    with writer_lock:
+        log = plan['log']
+        old = (adif_writer, adif_db, adif_filename, stats, adif_export)
+        carry = []
+        if log is not None:
+            install_log(log)
+            close_log(*old)
+        else:
+            if (adif_db is not None) and (plan['args'][3] == BACKEND_ADIF) and \
+                    (plan['args'][0].resolve() == adif_filename.resolve()):
+                carry = list(adif_db.records())
+            old_args = open_args
+            close_log(*old)
+            log = open_log(*plan['args'])
+            if (log is None) or ((log['writer'] is None) and (log['db'] is None)):
+                if log is not None: discard_log(log)
+                status = False
+                log = open_log(*old_args)
+            if log is not None:
+                install_log(log)
+            else:
+                (adif_writer, adif_db) = (None, None)
+        if (log is not None) and (following if not status else plan['follow']):
+            start_follower(plan['follow_poll'], log['offset'])
+        if status and (len(carry) > 0):
+            carry_records(carry)
+    if not status:
+        return (False, 'Can not open ADIF log {}'.format(plan['name']))
+    print('ADIF log changed to {}'.format(plan['name']))
+    return (True, '')
+
+#-----------------------------------------------------------------------------
+def discard_log(log):
+    """
+    Close a log returned by open_log() that was never used.
+    """
+    if log['writer'] is not None: log['writer'].close()
+    if log['db'] is not None: log['db'].close()
+
+#-----------------------------------------------------------------------------
+def carry_records(records):
+    """
+    Append the QSOs in a list of records that are missing from the ADIF log
+    file in use, such as those logged to a database the file was imported
+    into.  The caller must hold writer_lock.
+    """
+    if (adif_writer is None): return
+    try:
+        in_file = collections.Counter(log_stats.qso_key(qso)
+                                      for qso in adifcache.load(adif_filename))
+    except Exception as err:
+        print('ADIF log load error: {}'.format(str(err)))
+        return
+    count = 0
+    for qso in records:
+        key = log_stats.qso_key(qso)
+        if (in_file[key] > 0):
+            in_file[key] -= 1
+            continue
+        record = adif.format_record(qso, sort=False, encoding=adif_writer.encoding)
+        if adif_follower is not None:
+            with own_lock:
+                own_records[record] += 1
+        adif_writer.write(record)
+        add_qso(qso)
+        count += 1
+    if (count > 0): print('Added {} QSOs to {}'.format(count, adif_filename))
+
+#-----------------------------------------------------------------------------
+def set_follower(follow, follow_poll):
+    """
+    Start, stop or update the ADIF log file follower.
+    """
+    if not follow:
+        stop_follower()
+    elif adif_follower is not None:
+        adif_follower.poll_interval = float(follow_poll)
+    else:
+        start_follower(follow_poll)
+
+#-----------------------------------------------------------------------------
+def build_indexes(records, log_filename):
+    """
+    Build a worked index, queryable log and statistics from the QSOs in a
+    log.  The statistics snapshot is kept next to log_filename.
+    Returns (worked, logbook, stats).
+    """
+    new_worked = worked_index.WorkedIndex()
+    for qso in records:
+        new_worked.add(qso)
+    new_logbook = qso_log.QsoLog()
+    new_logbook.add_records(records)
+    new_stats = log_stats.LogStats()
+    snapshot_file = log_stats.snapshot_name(log_filename)
+    if (new_stats.bootstrap(records, snapshot_file) > 0):
+        new_stats.save_snapshot(snapshot_file)
+    return (new_worked, new_logbook, new_stats)
+
+#-----------------------------------------------------------------------------
+def close_log(writer, db, filename, qso_stats, export=None):
+    """
+    Write any queued records and close an ADIF log file or database,
+    saving the statistics snapshot of the log.  A database is written to
+    the ADIF file export if given; the ADIF log file is never rewritten.
+    """
+    if writer is not None:
+        writer.close()
+        qso_stats.save_snapshot(log_stats.snapshot_name(filename))
+    if db is not None:
+        if export is not None:
+            count = db.export_adif(export, AdifWriter.DEFAULT_HEADER)
+            if (count >= 0): print('Exported {} QSOs to {}'.format(count, export))
+        qso_stats.save_snapshot(log_stats.snapshot_name(db.filename))
+        db.close()
+
+#-----------------------------------------------------------------------------
+def close_api():
+    """
+    Write any queued records and close the ADIF log file or database.
+    """
+    global adif_writer
+    global adif_db
+    stop_follower()
+    with writer_lock:
+        close_log(adif_writer, adif_db, adif_filename, stats, adif_export)
+        adif_writer = None
+        adif_db = None
+
+#-----------------------------------------------------------------------------
+def add_qso(qso):
+    """
+    Add a QSO record dictionary to the worked index, queryable log and
+    statistics.
+    """
+    worked.add(qso)
+    logbook.add(qso)
+    stats.add(qso)
+
+#-----------------------------------------------------------------------------
+def rebuild(records):
+    """
+    Replace the worked index, queryable log and statistics with new ones
+    built from a list of QSO record dictionaries.
+    """
+    global worked
+    global logbook
+    global stats
+    new_worked = worked_index.WorkedIndex()
+    for qso in records:
+        new_worked.add(qso)
+    new_logbook = qso_log.QsoLog()
+    new_logbook.add_records(records)
+    new_stats = log_stats.LogStats()
+    new_stats.bootstrap(records)
+    (worked, logbook, stats) = (new_worked, new_logbook, new_stats)
+
+#-----------------------------------------------------------------------------
+def on_log_event(event):
+    """
+    Handle an AdifFollower event for the log file.
+    New QSOs written by other programs are added; QSOs written by
+    log_data() were added when they were logged.  After truncation or
+    rotation everything is rebuilt from the file, and after rotation the
+    writer is reopened on the new file.  Runs in the follower thread and
+    holds writer_lock, like log_data(), while the indexes are changed.
+    """
+    global adif_writer
+    if (event['type'] == AdifFollower.EVENT_QSO):
+        qso = event['qso']
+        with writer_lock:
+            encoding = adif_writer.encoding if (adif_writer is not None) else 'utf-8'
+            key = adif.format_record(qso, sort=False, encoding=encoding)
+            with own_lock:
+                if (own_records[key] > 0):
+                    own_records[key] -= 1
+                    if (own_records[key] == 0): del own_records[key]
+                    return
+            add_qso(qso)
+    elif (event['type'] == AdifFollower.EVENT_RESET):
+        print('ADIF log file {}, reloading {} QSOs'.format(
+            'rotated' if event['rotated'] else 'changed', len(event['qsos'])))
+        with writer_lock:
+            with own_lock:
+                own_records.clear()
+            rebuild(event['qsos'])
+            if event['rotated'] and (adif_writer is not None):
+                adif_writer.close()
+                adif_writer = AdifWriter.AdifWriter(adif_filename, *writer_args)
+                if not adif_writer.open():
+                    adif_writer = None
+
+#-----------------------------------------------------------------------------
+def annotate_spots(spots_list):
+    """
+    Add a worked-before status field ('dupe', 'worked' or 'new_park') to each
+    POTA spot dictionary.
+    """
+    global worked
+    worked.annotate_spots(spots_list)
 
 #-----------------------------------------------------------------------------
 def log_data(call, freq, mode, ref, name):
     """
     Create an ADIF record and save it to the log file.
     """
-    global adif_filename
-    if adif_filename is not None:
+    global adif_writer
+    global adif_db
+    with writer_lock:
+        if (adif_writer is None) and (adif_db is None): return
         if (len(freq) > 0):
             freq_mhz = float(freq) * 0.001
             band = adif.freq2band(freq_mhz)
@@ -66,11 +534,32 @@ def log_data(call, freq, mode, ref, name):
         my_adif.set_field('QSO_DATE', qso_date)
         my_adif.set_field('TIME_ON', qso_time)
         my_adif.set_field('COMMENT', comment)
-        with open(adif_filename, 'a') as f:
-            try:
-                f.write('{}\n'.format(my_adif.get_adif(sort=False)))
-            except Exception as err:
-                print('ADIF file write error: {}'.format(str(err)))
+        if adif_db is not None:
+            adif_db.write(my_adif.get_record())
+        else:
+            record = my_adif.get_adif(sort=False, encoding=adif_writer.encoding)
+            if adif_follower is not None:
+                with own_lock:
+                    own_records[record] += 1
+            adif_writer.write(record)
+        add_qso(my_adif.get_record())  # Same log even if reconfigured
+
+#-----------------------------------------------------------------------------
+def get_stats():
+    """
+    Return the park-hunting statistics dictionary.  See LogStats.summary().
+    """
+    global stats
+    return stats.summary()
+
+#-----------------------------------------------------------------------------
+def query_log(filters, sort='date', reverse=True, offset=0, limit=qso_log.DEFAULT_LIMIT):
+    """
+    Find QSOs in the log.  See QsoLog.query() for the parameters.
+    Returns (total, qsos).
+    """
+    global logbook
+    return logbook.query(filters, sort, reverse, offset, limit)
 
 
 ##############################################################################
@@ -0,0 +1,201 @@
+##############################################################################
+# log_stats.py
+#
+# Incremental park-hunting statistics for the AB3GY POTA spot application.
+# Counts QSOs, parks worked, new parks per day, QSOs by band and mode and
+# QSOs by POTA program.  The counters are updated as each QSO is logged and
+# saved to a JSON snapshot so a restart only counts QSOs added since.
+##############################################################################
+
+# System packages.
+import collections
+import json
+import os
+import threading
+
+# Local packages.
+from src.worked_index import normalize_mode, parse_parks
+
+##############################################################################
+# Globals.
+##############################################################################
+SNAPSHOT_SUFFIX  = '.stats.json'
+SNAPSHOT_VERSION = 1
+TOP_PROGRAMS     = 10   # Number of programs in the top programs list
+RECENT_DAYS      = 30   # Number of days in the new parks per day list
+
+
+##############################################################################
+# Functions.
+##############################################################################
+
+#-----------------------------------------------------------------------------
+def snapshot_name(filename):
+    """
+    Return the statistics snapshot file name for an ADIF file.
+    """
+    return str(filename) + SNAPSHOT_SUFFIX
+
+#-----------------------------------------------------------------------------
+def qso_key(qso):
+    """
+    Return a string identifying a QSO record, used to check that a snapshot
+    matches the start of the log.
+    """
+    return '|'.join((qso.get('CALL', ''), qso.get('QSO_DATE', ''),
+                     qso.get('TIME_ON', ''), qso.get('BAND', ''), qso.get('MODE', '')))
+
+
+##############################################################################
+# LogStats class.
+##############################################################################
+class LogStats(object):
+    """
+    Park-hunting statistics updated in constant time per QSO.  Thread-safe.
+    """
+    # ------------------------------------------------------------------------
+    def __init__(self):
+        """
+        Class constructor.
+        """
+        self.clear()
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------------
+    def clear(self):
+        """
+        Reset all counters.
+        """
+        self.qsos = 0
+        self.last_key = ''                           # qso_key() of the last QSO counted
+        self.park_first = {}                         # park: date first worked
+        self.new_parks = collections.Counter()       # date: parks first worked
+        self.by_band = collections.Counter()         # band: QSOs
+        self.by_mode = collections.Counter()         # mode: QSOs
+        self.by_program = collections.Counter()      # program prefix: QSOs
+
+    # ------------------------------------------------------------------------
+    def add(self, qso):
+        """
+        Count an ADIF QSO record dictionary.
+        """
+        date = qso.get('QSO_DATE', '').strip()
+        parks = parse_parks(qso)
+        with self._lock:
+            self.qsos += 1
+            self.last_key = qso_key(qso)
+            self.by_band[qso.get('BAND', '').strip().lower()] += 1
+            self.by_mode[normalize_mode(qso.get('MODE', ''))] += 1
+            for park in parks:
+                self.by_program[park.split('-')[0]] += 1
+                first = self.park_first.get(park)
+                if (first is None) or (date < first):
+                    # New park, or worked earlier than a QSO counted before.
+                    if first is not None:
+                        self.new_parks[first] -= 1
+                        if (self.new_parks[first] <= 0): del self.new_parks[first]
+                    self.park_first[park] = date
+                    self.new_parks[date] += 1
+
+    # ------------------------------------------------------------------------
+    def bootstrap(self, records, snapshot_file=None):
+        """
+        Count the QSO records of a log.
+        If snapshot_file holds a snapshot of the first part of the same log,
+        it is restored and only the records after it are counted.
+        Returns the number of records counted.
+        """
+        start = 0
+        if (snapshot_file is not None) and self.load_snapshot(snapshot_file):
+            n = self.qsos
+            if (0 < n <= len(records)) and (qso_key(records[n-1]) == self.last_key):
+                start = n
+            else:
+                self.clear()
+        for qso in records[start:]:
+            self.add(qso)
+        return len(records) - start
+
+    # ------------------------------------------------------------------------
+    def load_snapshot(self, filename):
+        """
+        Restore the counters from a snapshot file.
+        Returns True if successful, False otherwise.
+        """
+        try:
+            with open(filename, 'r') as f:
+                snap = json.load(f)
+            if (snap.get('version') != SNAPSHOT_VERSION): return False
+            with self._lock:
+                self.qsos = int(snap['qsos'])
+                self.last_key = snap['last_key']
+                self.park_first = dict(snap['park_first'])
+                self.new_parks = collections.Counter(self.park_first.values())
+                self.by_band = collections.Counter(snap['by_band'])
+                self.by_mode = collections.Counter(snap['by_mode'])
+                self.by_program = collections.Counter(snap['by_program'])
+        except FileNotFoundError:
+            return False
+        except Exception as err:
+            print('Log statistics snapshot error: {}'.format(str(err)))
+            self.clear()
+            return False
+        return True
+
+    # ------------------------------------------------------------------------
+    def save_snapshot(self, filename):
+        """
+        Save the counters to a snapshot file.
+        Returns True if successful, False otherwise.
+        """
+        with self._lock:
+            snap = {
+                'version'    : SNAPSHOT_VERSION,
+                'qsos'       : self.qsos,
+                'last_key'   : self.last_key,
+                'park_first' : self.park_first,
+                'by_band'    : self.by_band,
+                'by_mode'    : self.by_mode,
+                'by_program' : self.by_program,
+            }
+            text = json.dumps(snap)
+        tmp_file = str(filename) + '.tmp'
+        try:
+            with open(tmp_file, 'w') as f:
+                f.write(text)
+            os.replace(tmp_file, filename)
+        except Exception as err:
+            print('Log statistics snapshot error: {}'.format(str(err)))
+            return False
+        return True
+
+    # ------------------------------------------------------------------------
+    def summary(self):
+        """
+        Return the statistics as a dictionary with the keys:
+            qsos         : (int) Number of QSOs
+            parks        : (int) Number of parks worked
+            new_parks    : (list) [date, count] of new parks for the most
+                           recent RECENT_DAYS days with new parks
+            by_band      : (dict) QSOs by band
+            by_mode      : (dict) QSOs by mode
+            top_programs : (list) [program, count] of the TOP_PROGRAMS
+                           programs with the most QSOs
+        """
+        with self._lock:
+            return {
+                'qsos'         : self.qsos,
+                'parks'        : len(self.park_first),
+                'new_parks'    : sorted(self.new_parks.items())[-RECENT_DAYS:],
+                'by_band'      : dict(self.by_band),
+                'by_mode'      : dict(self.by_mode),
+                'top_programs' : self.by_program.most_common(TOP_PROGRAMS),
+            }
+
+
+##############################################################################
+# Main program.
+##############################################################################
+if __name__ == "__main__":
+    import sys
+    print('{} main program called'.format(os.path.basename(sys.argv[0])))
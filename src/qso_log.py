@@ -0,0 +1,236 @@
+##############################################################################
+# qso_log.py
+#
+# In-memory queryable QSO log for the AB3GY POTA spot application.
+# Holds the QSO records of the ADIF log with secondary indexes on call,
+# park reference, band, mode and QSO date, so the web interface can look
+# up logged QSOs without rescanning the ADIF file.
+##############################################################################
+
+# System packages.
+import bisect
+import heapq
+import threading
+
+# Local packages.
+import lib.adifcache as adifcache
+from src.worked_index import normalize_mode, parse_parks
+
+##############################################################################
+# Globals.
+##############################################################################
+DEFAULT_LIMIT = 50     # Default number of QSOs returned by a query
+MAX_LIMIT     = 1000   # Maximum number of QSOs returned by a query
+
+# Queries sorted by date matching more QSOs than this walk the date order
+# instead of selecting the page from the matching QSOs.
+DATE_SCAN_MIN = 1000
+
+# Indexed fields.
+INDEXES = ('call', 'park', 'band', 'mode', 'date')
+
+# Sort keys by name.
+SORT_KEYS = {
+    'date' : lambda qso: qso.get('QSO_DATE', '') + qso.get('TIME_ON', ''),
+    'call' : lambda qso: qso.get('CALL', '').upper(),
+    'band' : lambda qso: qso.get('BAND', '').lower(),
+    'mode' : lambda qso: qso.get('MODE', '').upper(),
+    'park' : lambda qso: ' '.join(parse_parks(qso)),
+}
+
+
+##############################################################################
+# QsoLog class.
+##############################################################################
+class QsoLog(object):
+    """
+    QSO records with secondary indexes.  Thread-safe.
+    
+    Each index maps a key to the list of record numbers with that key, in
+    the order the records were added.  A query intersects the index lists
+    of its filters, starting with the shortest, so its cost depends on the
+    number of matching QSOs rather than the size of the log.
+    """
+    # ------------------------------------------------------------------------
+    def __init__(self):
+        """
+        Class constructor.
+        """
+        self._records = []
+        self._index = {name: {} for name in INDEXES}
+        self._dates = []   # Sorted list of the distinct QSO dates
+        self._by_date = [] # Sorted list of (date and time, record number)
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------------
+    def __len__(self):
+        return len(self._records)
+
+    # ------------------------------------------------------------------------
+    @staticmethod
+    def index_keys(qso):
+        """
+        Return a dictionary of the index keys of a QSO record.
+        The park key is a list since a QSO can be with several parks.
+        """
+        return {
+            'call' : [qso.get('CALL', '').strip().upper()],
+            'park' : parse_parks(qso),
+            'band' : [qso.get('BAND', '').strip().lower()],
+            'mode' : [normalize_mode(qso.get('MODE', ''))],
+            'date' : [qso.get('QSO_DATE', '').strip()],
+        }
+
+    # ------------------------------------------------------------------------
+    def _add(self, qso, in_order):
+        """
+        Add a QSO record with the lock held.
+        If in_order is False, the date lists are left for the caller to sort.
+        """
+        keys = self.index_keys(qso)
+        when = SORT_KEYS['date'](qso)
+        n = len(self._records)
+        self._records.append(dict(qso))
+        if (not in_order) or (len(self._by_date) == 0) or (self._by_date[-1][0] <= when):
+            self._by_date.append((when, n))  # Usual case: QSOs logged in order
+        else:
+            bisect.insort(self._by_date, (when, n))
+        for (name, values) in keys.items():
+            index = self._index[name]
+            for value in values:
+                ids = index.get(value)
+                if ids is None:
+                    ids = index[value] = []
+                    if (name == 'date'):
+                        if in_order: bisect.insort(self._dates, value)
+                        else: self._dates.append(value)
+                ids.append(n)
+
+    # ------------------------------------------------------------------------
+    def add(self, qso):
+        """
+        Add an ADIF QSO record dictionary to the log.
+        """
+        with self._lock:
+            self._add(qso, True)
+
+    # ------------------------------------------------------------------------
+    def add_records(self, records):
+        """
+        Add a list of ADIF QSO record dictionaries to the log.
+        Returns the number of records added.
+        """
+        with self._lock:
+            for qso in records:
+                self._add(qso, False)
+            self._by_date.sort()
+            self._dates.sort()
+        return len(records)
+
+    # ------------------------------------------------------------------------
+    def load(self, filename):
+        """
+        Add all QSO records in an ADIF file to the log.
+        Returns the number of records read.
+        """
+        try:
+            return self.add_records(adifcache.load(filename))
+        except Exception as err:
+            print('ADIF log load error: {}'.format(str(err)))
+        return 0
+
+    # ------------------------------------------------------------------------
+    def _date_ids(self, date_from, date_to):
+        """
+        Return the record numbers with a QSO date between date_from and
+        date_to inclusive.  Either limit may be empty.
+        """
+        lo = bisect.bisect_left(self._dates, date_from) if date_from else 0
+        hi = bisect.bisect_right(self._dates, date_to) if date_to else len(self._dates)
+        index = self._index['date']
+        ids = []
+        for date in self._dates[lo:hi]:
+            ids.extend(index[date])
+        return ids
+
+    # ------------------------------------------------------------------------
+    def query(self, filters=None, sort='date', reverse=True, offset=0, limit=DEFAULT_LIMIT):
+        """
+        Find QSOs in the log.
+        
+        Parameters
+        ----------
+        filters : dict
+            Optional filters keyed by 'call', 'park', 'band', 'mode', 'date',
+            'date_from' and 'date_to'.  Dates are in YYYYMMDD format.
+            Empty values are ignored.
+        sort : str
+            The sort key: 'date', 'call', 'band', 'mode' or 'park'.
+        reverse : bool
+            Sort in descending order if True.
+        offset : int
+            Number of matching QSOs to skip.
+        limit : int
+            Maximum number of QSOs to return, up to MAX_LIMIT.
+        
+        Returns
+        -------
+        The following tuple is returned: (total, qsos)
+        total : int
+            The number of matching QSOs.
+        qsos : list
+            The requested page of matching QSO record dictionaries.
+        """
+        if filters is None: filters = {}
+        if sort not in SORT_KEYS: sort = 'date'
+        offset = max(int(offset), 0)
+        limit = min(max(int(limit), 0), MAX_LIMIT)
+        keys = {
+            'call' : filters.get('call', '').strip().upper(),
+            'park' : filters.get('park', '').strip().upper(),
+            'band' : filters.get('band', '').strip().lower(),
+            'mode' : normalize_mode(filters.get('mode', '')),
+            'date' : filters.get('date', '').strip(),
+        }
+        date_from = filters.get('date_from', '').strip()
+        date_to = filters.get('date_to', '').strip()
+        
+        with self._lock:
+            lists = [self._index[name].get(key, []) for (name, key) in keys.items() if key]
+            if date_from or date_to:
+                lists.append(self._date_ids(date_from, date_to))
+            if (len(lists) == 0):
+                ids = range(len(self._records))
+            else:
+                lists.sort(key=len)
+                ids = set(lists[0])
+                for other in lists[1:]:
+                    if (len(ids) == 0): break
+                    ids.intersection_update(other)
+            records = self._records
+            total = len(ids)
+            
+            # Select the page without sorting all matching QSOs.
+            key = SORT_KEYS[sort]
+            count = offset + limit
+            if (sort == 'date') and (total > DATE_SCAN_MIN):
+                # Walk the date order until the page is filled.
+                page = []
+                for (when, n) in (reversed(self._by_date) if reverse else self._by_date):
+                    if (n in ids):
+                        page.append(n)
+                        if (len(page) >= count): break
+            elif reverse:
+                page = heapq.nlargest(count, ids, key=lambda n: (key(records[n]), n))
+            else:
+                page = heapq.nsmallest(count, ids, key=lambda n: (key(records[n]), n))
+            return (total, [dict(records[n]) for n in page[offset:]])
+
+
+##############################################################################
+# Main program.
+##############################################################################
+if __name__ == "__main__":
+    import os
+    import sys
+    print('{} main program called'.format(os.path.basename(sys.argv[0])))
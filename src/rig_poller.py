@@ -0,0 +1,315 @@
+##############################################################################
+# rig_poller.py
+#
+# Background transceiver state poller for the AB3GY POTA spot application.
+# Reads the rig VFO, mode and PTT state through a FlrigClient and publishes
+# change events to subscribers such as the web interface.
+##############################################################################
+
+# System packages.
+import collections
+import threading
+import time
+
+# Local packages.
+import lib.Logger as log
+
+##############################################################################
+# Globals.
+##############################################################################
+FAST_INTERVAL  = 0.25  # Poll interval in seconds while the operator is tuning
+NORMAL_INTERVAL = 1.0  # Poll interval in seconds after tuning stops
+IDLE_INTERVAL  = 3.0   # Poll interval in seconds when the rig is idle
+TX_INTERVAL    = 2.0   # Poll interval in seconds while transmitting
+TUNING_HOLD    = 5.0   # Seconds after a change to keep polling fast
+IDLE_AFTER     = 60.0  # Seconds without a change before the rig is idle
+MAX_FAILURES   = 3     # Consecutive read failures before the poller stops
+MAX_EVENTS     = 100   # Number of events kept for late subscribers
+TTL_MARGIN     = 1.0   # Seconds added to the longest poll interval for the rig state TTL
+
+# Global RigPoller object for use by an application.
+poller = None
+
+
+##############################################################################
+# RigPoller class.
+##############################################################################
+class RigPoller(object):
+    """
+    Polls the transceiver state in a background thread and publishes change
+    events.
+
+    The poller should have a client of its own, so its reads and errmsg
+    are not shared with request threads.
+    The poll rate adapts to the operator: fast while the VFO or mode is
+    changing, slower when the rig is idle or transmitting.  The poller stops
+    itself when the rig server becomes unreachable.
+
+    Each event is a dictionary with the keys:
+        seq   : (int) Event sequence number, increasing by one per event
+        time  : (float) Unix time of the event
+        field : (str) 'vfo', 'mode', 'ptt' or 'status'
+        value : (str) The new value
+    """
+    FIELDS = ('vfo', 'mode', 'ptt')
+
+    # ------------------------------------------------------------------------
+    def __init__(self, client, rig_state=None):
+        """
+        Class constructor.
+
+        Parameters
+        ----------
+        client : FlrigClient
+            The client used to read the rig state, not shared with other
+            threads.
+        rig_state : RigState
+            Optional rig state cache updated with every value read.
+            While the poller runs, the cache TTL is raised to outlast the
+            longest poll interval, so polled values stay fresh between polls.
+        """
+        self.client = client
+        self.rig_state = rig_state
+        self.state = {}
+        self.interval = NORMAL_INTERVAL
+        self._subscribers = []
+        self._events = collections.deque(maxlen=MAX_EVENTS)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_change = time.monotonic()
+        self._failures = 0
+        self._retired = []
+        self._saved_ttl = None
+
+    # ------------------------------------------------------------------------
+    def start(self):
+        """
+        Start the polling thread.  Has no effect if it is already running.
+        """
+        if self.is_running(): return
+        self._stop.clear()
+        self._failures = 0
+        self._last_change = time.monotonic()
+        if (self.rig_state is not None) and (self._saved_ttl is None):
+            self._saved_ttl = self.rig_state.ttl
+            self.rig_state.ttl = max(self._saved_ttl, self.polled_ttl())
+        self._thread = threading.Thread(target=self._run, name='RigPoller', daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------------
+    def stop(self, timeout=None):
+        """
+        Stop the polling thread and wait for it to exit.
+        """
+        self._stop.set()
+        if (self._thread is not None) and (self._thread is not threading.current_thread()):
+            self._thread.join(timeout)
+            if not self._thread.is_alive(): self._close_retired()
+
+    # ------------------------------------------------------------------------
+    def set_client(self, client):
+        """
+        Poll the rig through a new client, keeping the current state and
+        event history.  The next poll uses the new client, and the old one
+        is closed by the polling thread once it is no longer in use.
+        """
+        with self._cond:
+            if (client is not self.client): self._retired.append(self.client)
+            self.client = client
+            self._failures = 0
+
+    # ------------------------------------------------------------------------
+    def _close_retired(self):
+        """
+        Close the clients replaced by set_client().
+        """
+        with self._cond:
+            (retired, self._retired) = (self._retired, [])
+        for client in retired:
+            if hasattr(client, 'close'): client.close()
+
+    # ------------------------------------------------------------------------
+    @staticmethod
+    def polled_ttl():
+        """
+        Return the rig state TTL in seconds used while the poller runs.
+        """
+        return max(FAST_INTERVAL, NORMAL_INTERVAL, IDLE_INTERVAL, TX_INTERVAL) + TTL_MARGIN
+
+    # ------------------------------------------------------------------------
+    def _restore_ttl(self):
+        """
+        Put back the rig state TTL in use before the poller started.
+        """
+        if (self.rig_state is not None) and (self._saved_ttl is not None):
+            self.rig_state.ttl = self._saved_ttl
+            self._saved_ttl = None
+
+    # ------------------------------------------------------------------------
+    def is_running(self):
+        """
+        Return True if the polling thread is running, False otherwise.
+        """
+        return (self._thread is not None) and self._thread.is_alive()
+
+    # ------------------------------------------------------------------------
+    def subscribe(self, callback):
+        """
+        Register a function called with each event dictionary.
+        Callbacks run in the polling thread and must not block.
+        """
+        with self._cond:
+            self._subscribers.append(callback)
+
+    # ------------------------------------------------------------------------
+    def unsubscribe(self, callback):
+        """
+        Remove a function registered with subscribe().
+        """
+        with self._cond:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    # ------------------------------------------------------------------------
+    def events_since(self, seq, timeout=None):
+        """
+        Return the list of events with a sequence number greater than seq.
+        If there are none, wait up to timeout seconds for a new event.
+        Events older than the last MAX_EVENTS are not available.
+        """
+        with self._cond:
+            if (self._seq <= seq) and (timeout is not None):
+                self._cond.wait_for(lambda: self._seq > seq, timeout)
+            return [e for e in self._events if e['seq'] > seq]
+
+    # ------------------------------------------------------------------------
+    def snapshot(self):
+        """
+        Return (seq, state): the most recent event sequence number and a
+        copy of the rig state as of that event.
+        """
+        with self._cond:
+            return (self._seq, dict(self.state))
+
+    # ------------------------------------------------------------------------
+    def last_seq(self):
+        """
+        Return the sequence number of the most recent event.
+        """
+        with self._cond:
+            return self._seq
+
+    # ------------------------------------------------------------------------
+    def _publish(self, field, value):
+        """
+        Record an event, update the rig state and notify subscribers.
+        The state and sequence number change together, so a snapshot()
+        never holds a value from an event after its sequence number.
+        """
+        with self._cond:
+            if field in self.FIELDS: self.state[field] = value
+            self._seq += 1
+            event = {'seq': self._seq, 'time': time.time(), 'field': field, 'value': value}
+            self._events.append(event)
+            subscribers = list(self._subscribers)
+            self._cond.notify_all()
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as err:
+                print('Rig poller subscriber error: {}'.format(str(err)))
+
+    # ------------------------------------------------------------------------
+    def _read(self):
+        """
+        Read the rig state.
+        Returns a dictionary of values, or None if the rig could not be read.
+        """
+        self._close_retired()
+        client = self.client
+        readers = {
+            'vfo'  : client.get_vfo,
+            'mode' : client.get_mode,
+            'ptt'  : client.get_ptt,
+        }
+        values = {}
+        for field in self.FIELDS:
+            values[field] = readers[field]()
+            if (len(client.errmsg) > 0): return None
+            if self.rig_state is not None:
+                self.rig_state.put(field, values[field])
+        return values
+
+    # ------------------------------------------------------------------------
+    def _next_interval(self):
+        """
+        Return the next poll interval based on recent rig activity.
+        """
+        if (self.state.get('ptt', '0') not in ('', '0')):
+            return TX_INTERVAL
+        quiet = time.monotonic() - self._last_change
+        if (quiet < TUNING_HOLD): return FAST_INTERVAL
+        if (quiet > IDLE_AFTER): return IDLE_INTERVAL
+        return NORMAL_INTERVAL
+
+    # ------------------------------------------------------------------------
+    def poll_once(self):
+        """
+        Read the rig state once and publish any changes.
+        Returns True if the rig was read successfully, False otherwise.
+        """
+        values = self._read()
+        if values is None:
+            self._failures += 1
+            return False
+        if (self._failures > 0) or (len(self.state) == 0):
+            self._publish('status', 'online')
+        self._failures = 0
+        for field in self.FIELDS:
+            if (values[field] != self.state.get(field)):
+                if (field != 'ptt'): self._last_change = time.monotonic()
+                self._publish(field, values[field])
+        return True
+
+    # ------------------------------------------------------------------------
+    def _run(self):
+        """
+        Polling thread main loop.
+        """
+        try:
+            self._poll_loop()
+        finally:
+            self._restore_ttl()
+
+    # ------------------------------------------------------------------------
+    def _poll_loop(self):
+        """
+        Poll until stopped or the rig server becomes unreachable.
+        """
+        while not self._stop.is_set():
+            self.poll_once()
+            if (self._failures >= MAX_FAILURES):
+                msg = 'Rig poller stopped: rig server unreachable ({})'.format(self.client.errmsg)
+                if log.logger is not None:
+                    log.logger.print_and_log(msg)
+                else:
+                    print(msg)
+                with self._cond:
+                    self.state = {}
+                self._publish('status', 'offline')
+                break
+            self.interval = self._next_interval()
+            self._stop.wait(self.interval)
+
+
+##############################################################################
+# Main program.
+##############################################################################
+if __name__ == "__main__":
+    import os
+    import sys
+    print('{} main program called'.format(os.path.basename(sys.argv[0])))
+
+
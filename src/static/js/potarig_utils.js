@@ -56,8 +56,39 @@ function pauseReload() {
     }
 }
 
+// Highlight the spot rows matching the transceiver frequency in Hz.
+function highlightTuned(vfo) {
+    var vfo_khz = parseFloat(vfo) / 1000.0;
+    document.querySelectorAll('tr.spot').forEach(function(row) {
+        var spot_khz = parseFloat(row.dataset.freq);
+        if (Math.abs(spot_khz - vfo_khz) < 0.5) {
+            row.classList.add('tuned');
+        }
+        else {
+            row.classList.remove('tuned');
+        }
+    });
+}
+
+// Subscribe to rig state change events from the background rig poller.
+function subscribeRigEvents() {
+    if (typeof(EventSource) == 'undefined') return;
+    var source = new EventSource('/rigevents');
+    source.onmessage = function(msg) {
+        var event = JSON.parse(msg.data);
+        if (event.field == 'vfo') {
+            highlightTuned(event.value);
+        }
+        else if ((event.field == 'status') && (event.value == 'offline')) {
+            highlightTuned(0);
+            source.close();
+        }
+    };
+}
+
 // Add an element to the current page to perform an automatic reload.
 $(document).ready(function(){
     document.getElementById('timeout-seconds').innerText = pageTimeout;
     timedReload(pageTimeout);
+    subscribeRigEvents();
 });
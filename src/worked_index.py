@@ -0,0 +1,160 @@
+##############################################################################
+# worked_index.py
+#
+# In-memory worked-before index for the AB3GY POTA spot application.
+# Tracks the activators and parks already in the ADIF log so each spot can
+# be marked as a dupe, a park worked before, or a new park.
+##############################################################################
+
+# System packages.
+from datetime import datetime, timezone
+import re
+import threading
+
+# Local packages.
+import lib.adif as adif
+import lib.adifcache as adifcache
+
+##############################################################################
+# Globals.
+##############################################################################
+
+# Park reference such as US-1234 or VE-12345.
+park_ref_re = re.compile(r'\b([A-Z0-9]{1,4}-\d{4,5})\b', re.IGNORECASE)
+
+# Spot status values.
+STATUS_DUPE     = 'dupe'      # Already logged today on this band and mode
+STATUS_WORKED   = 'worked'    # Park worked before, but not a dupe
+STATUS_NEW_PARK = 'new_park'  # Park never worked
+
+# Modes that are logged under more than one name.
+MODE_ALIASES = {
+    'USB'   : 'SSB',
+    'LSB'   : 'SSB',
+    'PHONE' : 'SSB',
+}
+
+
+##############################################################################
+# Functions.
+##############################################################################
+
+#-----------------------------------------------------------------------------
+def normalize_mode(mode):
+    """
+    Return the mode name used for dupe checking.
+    """
+    mode = mode.strip().upper()
+    return MODE_ALIASES.get(mode, mode)
+
+#-----------------------------------------------------------------------------
+def parse_parks(qso):
+    """
+    Return the list of park references for an ADIF QSO record dictionary.
+    Uses POTA_REF or a POTA SIG_INFO if present, otherwise the park
+    references at the start of the COMMENT field as written by potarig.
+    """
+    refs = qso.get('POTA_REF', '')
+    if (len(refs) == 0) and (qso.get('SIG', '').upper() == 'POTA'):
+        refs = qso.get('SIG_INFO', '')
+    if (len(refs) == 0):
+        comment = qso.get('COMMENT', '').strip()
+        refs = comment.split(' ')[0] if (len(comment) > 0) else ''
+    return [m.upper() for m in park_ref_re.findall(refs)]
+
+#-----------------------------------------------------------------------------
+def utc_date():
+    """
+    Return the current UTC date in ADIF YYYYMMDD format.
+    """
+    return datetime.now(timezone.utc).strftime('%Y%m%d')
+
+
+##############################################################################
+# WorkedIndex class.
+##############################################################################
+class WorkedIndex(object):
+    """
+    Worked-before index keyed on call, band, mode, date and park reference.
+    All lookups are O(1) set membership tests.  Thread-safe.
+    """
+    # ------------------------------------------------------------------------
+    def __init__(self):
+        """
+        Class constructor.
+        """
+        self._qsos = set()       # (call, band, mode, date, park)
+        self._parks = set()      # park
+        self.count = 0           # Number of QSO records indexed
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------------
+    def add(self, qso):
+        """
+        Add an ADIF QSO record dictionary to the index.
+        """
+        call = qso.get('CALL', '').strip().upper()
+        band = qso.get('BAND', '').strip().lower()
+        mode = normalize_mode(qso.get('MODE', ''))
+        date = qso.get('QSO_DATE', '').strip()
+        parks = parse_parks(qso)
+        with self._lock:
+            self.count += 1
+            for park in parks:
+                self._qsos.add((call, band, mode, date, park))
+                self._parks.add(park)
+
+    # ------------------------------------------------------------------------
+    def load(self, filename):
+        """
+        Add all QSO records in an ADIF file to the index.
+        The records are read through the sidecar cache, so only QSOs added
+        since the last load are parsed.
+        Returns the number of records read.
+        """
+        count = 0
+        try:
+            for qso in adifcache.load(filename):
+                self.add(qso)
+                count += 1
+        except Exception as err:
+            print('ADIF worked index load error: {}'.format(str(err)))
+        return count
+
+    # ------------------------------------------------------------------------
+    def status(self, call, park, band, mode, date=None):
+        """
+        Return the status of a spot: 'dupe', 'worked' or 'new_park'.
+        band is the ADIF band name (e.g. '20m').
+        date is the UTC date in YYYYMMDD format; defaults to today.
+        """
+        if date is None: date = utc_date()
+        key = (call.strip().upper(), band.lower(), normalize_mode(mode), date, park.strip().upper())
+        if key in self._qsos:
+            return STATUS_DUPE
+        if key[4] in self._parks:
+            return STATUS_WORKED
+        return STATUS_NEW_PARK
+
+    # ------------------------------------------------------------------------
+    def annotate_spots(self, spots_list):
+        """
+        Add a 'worked' status field to each POTA spot dictionary.
+        """
+        date = utc_date()
+        for spot in spots_list:
+            try:
+                band = adif.freq2band(float(spot['frequency']) / 1000.0)
+            except ValueError:
+                band = ''
+            spot['worked'] = self.status(spot['activator'], spot['reference'],
+                                         band, spot['mode'], date)
+
+
+##############################################################################
+# Main program.
+##############################################################################
+if __name__ == "__main__":
+    import os
+    import sys
+    print('{} main program called'.format(os.path.basename(sys.argv[0])))
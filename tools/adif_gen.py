@@ -0,0 +1,174 @@
+##############################################################################
+# adif_gen.py
+#
+# Synthetic ADIF log generator for parser benchmarks and fuzzing.
+# Generates a log of a given size and field mix together with the records
+# and header fields it contains, so a parser's output can be checked
+# against what was written.
+#
+# Usage: python tools/adif_gen.py [-h] [options] outfile
+##############################################################################
+
+# System packages.
+import argparse
+import random
+
+##############################################################################
+# Globals.
+##############################################################################
+CALLS = ['K1ABC', 'W1AW', 'N0XX', 'VE3ABC', 'AB3GY', 'KD9XYZ', 'G4ABC', 'DL1ABC']
+BANDS = [('160m', 1.9), ('80m', 3.55), ('40m', 7.074), ('20m', 14.074),
+         ('17m', 18.1), ('15m', 21.074), ('10m', 28.074)]
+MODES = [('SSB', ''), ('CW', ''), ('FT8', ''), ('MFSK', 'FT4'), ('RTTY', ''), ('PSK', 'PSK31')]
+NAMES = ['Tom', 'José', 'Jürgen', 'Zoë', 'Åsa', 'Łukasz', 'Ørjan', 'Naïve Park']
+QSL_FIELDS = ['QSL_RCVD', 'LOTW_QSL_RCVD', 'EQSL_QSL_RCVD', 'APP_QRZLOG_STATUS']
+
+# Generator options and their defaults.
+DEFAULT_OPTIONS = {
+    'header'     : True,    # Write a header ending in <EOH>
+    'crlf'       : False,   # End lines with CR LF
+    'multiline'  : 0.0,     # Fraction of records with a multi-line COMMENT
+    'mixed_case' : 0.0,     # Fraction of tags written in random case
+    'non_ascii'  : 0.0,     # Fraction of records with a non-ASCII NAME
+    'byte_lengths' : False, # Declare UTF-8 byte lengths instead of characters
+    'types'      : 0.0,     # Fraction of fields with a data type indicator
+    'extra'      : 0,       # Number of extra APP_ fields per record
+    'one_line'   : False,   # Write all records on a single line
+}
+
+
+##############################################################################
+# Functions.
+##############################################################################
+
+#-----------------------------------------------------------------------------
+def make_record(rnd, i, options):
+    """
+    Return a synthetic QSO record dictionary.
+    """
+    band, freq = rnd.choice(BANDS)
+    mode, submode = rnd.choice(MODES)
+    qso = {
+        'CALL'     : rnd.choice(CALLS),
+        'BAND'     : band,
+        'FREQ'     : str(freq),
+        'MODE'     : mode,
+        'QSO_DATE' : '20{:02d}{:02d}{:02d}'.format(rnd.randint(10, 25), rnd.randint(1, 12), rnd.randint(1, 28)),
+        'TIME_ON'  : '{:02d}{:02d}{:02d}'.format(rnd.randint(0, 23), rnd.randint(0, 59), rnd.randint(0, 59))[0:rnd.choice((4, 6))],
+        'RST_SENT' : '59',
+        'RST_RCVD' : '57',
+        'COMMENT'  : 'US-{:04d} Park {}'.format(rnd.randint(1, 9999), i),
+    }
+    if (len(submode) > 0): qso['SUBMODE'] = submode
+    if (rnd.random() < options['non_ascii']):
+        qso['NAME'] = rnd.choice(NAMES)
+    if (rnd.random() < options['multiline']):
+        qso['COMMENT'] += '\nsecond line'
+    if (rnd.random() < 0.3):
+        qso[rnd.choice(QSL_FIELDS)] = rnd.choice(('Y', 'N', 'V', 'C'))
+    for n in range(options['extra']):
+        qso['APP_POTARIG_X{}'.format(n)] = str(rnd.randint(0, 10 ** rnd.randint(1, 8)))
+    return qso
+
+#-----------------------------------------------------------------------------
+def format_field(rnd, tag, value, options):
+    """
+    Return one field as ADIF text.
+    """
+    if (rnd.random() < options['mixed_case']):
+        tag = ''.join(c.lower() if (rnd.random() < 0.5) else c for c in tag)
+    if options['byte_lengths']:
+        length = len(value.encode('utf-8'))
+    else:
+        length = len(value)
+    spec = '<{}:{}'.format(tag, length)
+    if (rnd.random() < options['types']): spec += ':S'
+    return spec + '>' + value
+
+#-----------------------------------------------------------------------------
+def generate(count, seed=1, **kwargs):
+    """
+    Generate a synthetic ADIF log.
+    
+    Parameters
+    ----------
+    count : int
+        Number of QSO records.
+    seed : int
+        Random seed; the same seed and options give the same log.
+    kwargs
+        Generator options; see DEFAULT_OPTIONS.
+    
+    Returns
+    -------
+    The following tuple is returned: (data, records, header)
+    data : bytes
+        The UTF-8 encoded ADIF log.
+    records : list
+        The QSO record dictionaries written, as a parser should return them
+        with newlines in values replaced by spaces.
+    header : dict
+        The header fields written.
+    """
+    options = dict(DEFAULT_OPTIONS)
+    for key in kwargs:
+        if key not in options: raise ValueError('Unknown generator option: {}'.format(key))
+    options.update(kwargs)
+    rnd = random.Random(seed)
+    eol = '\r\n' if options['crlf'] else '\n'
+    sep = ' ' if options['one_line'] else eol
+    
+    parts = []
+    header = {}
+    if options['header']:
+        header = {'ADIF_VER': '3.1.4', 'PROGRAMID': 'adif_gen', 'PROGRAMVERSION': '1.0'}
+        parts.append('Synthetic ADIF log' + eol)
+        for (tag, value) in header.items():
+            parts.append(format_field(rnd, tag, value, options) + eol)
+        parts.append('<EOH>' + eol)
+    
+    records = []
+    for i in range(count):
+        qso = make_record(rnd, i, options)
+        fields = []
+        for (tag, value) in qso.items():
+            fields.append(format_field(rnd, tag, value.replace('\n', eol), options))
+        parts.append(' '.join(fields) + ' <EOR>' + sep)
+        records.append({tag: value.replace('\n', ' ' * len(eol)) for (tag, value) in qso.items()})
+    return (''.join(parts).encode('utf-8'), records, header)
+
+
+##############################################################################
+# Main program.
+##############################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Synthetic ADIF log generator')
+    parser.add_argument('outfile', help='ADIF file to write')
+    parser.add_argument('-n', '--records', type=int, default=1000,
+        help='number of QSO records (default 1000)')
+    parser.add_argument('-s', '--seed', type=int, default=1, help='random seed (default 1)')
+    parser.add_argument('--no-header', action='store_true', help='omit the header')
+    parser.add_argument('--crlf', action='store_true', help='end lines with CR LF')
+    parser.add_argument('--one-line', action='store_true', help='write all records on one line')
+    parser.add_argument('--multiline', type=float, default=0.0,
+        help='fraction of records with a multi-line field')
+    parser.add_argument('--mixed-case', type=float, default=0.0,
+        help='fraction of tags in mixed case')
+    parser.add_argument('--non-ascii', type=float, default=0.0,
+        help='fraction of records with a non-ASCII field')
+    parser.add_argument('--byte-lengths', action='store_true',
+        help='declare UTF-8 byte lengths instead of character lengths')
+    parser.add_argument('--types', type=float, default=0.0,
+        help='fraction of fields with a data type indicator')
+    parser.add_argument('--extra', type=int, default=0,
+        help='number of extra fields per record')
+    args = parser.parse_args()
+    
+    (data, records, header) = generate(args.records, args.seed,
+        header=not args.no_header, crlf=args.crlf, one_line=args.one_line,
+        multiline=args.multiline, mixed_case=args.mixed_case,
+        non_ascii=args.non_ascii, byte_lengths=args.byte_lengths,
+        types=args.types, extra=args.extra)
+    with open(args.outfile, 'wb') as f:
+        f.write(data)
+    print('{}: {} records, {} bytes'.format(args.outfile, len(records), len(data)))
@@ -0,0 +1,285 @@
+##############################################################################
+# bench_adif.py
+#
+# ADIF parser benchmark.
+# Generates a synthetic ADIF log with adif_gen.py and times reading it with
+# adif.next_record() and with the previous regex parser, which sliced the
+# remainder of the record after every field and rescanned the joined lines
+# for end tags.  Also times adif.iter_records(), the multi-process bulk
+# loader in adifbulk.py, the sidecar cache in adifcache.py, and writing
+# records with adif.write_records() against the previous get_adif() loop.
+# Results are in records/s and MB/s so parser implementations can be
+# compared on the same log.
+#
+# Usage: python tools/bench_adif.py [-h] [options]
+##############################################################################
+
+# System packages.
+import argparse
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Environment setup.
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+sys.path.insert(1, os.path.join(repo_dir, 'lib'))
+sys.path.insert(2, os.path.dirname(os.path.abspath(__file__)))
+
+# Local packages.
+import adif
+import adifbulk
+import adifcache
+import adif_gen
+from strutils import make_utf8
+
+##############################################################################
+# Globals.
+##############################################################################
+CALLS = ['K1ABC', 'W1AW', 'N0XX', 'VE3ABC', 'AB3GY', 'KD9XYZ', 'G4ABC', 'DL1ABC']
+BANDS = [('160m', 1.9), ('80m', 3.55), ('40m', 7.074), ('20m', 14.074),
+         ('17m', 18.1), ('15m', 21.074), ('10m', 28.074)]
+MODES = ['SSB', 'CW', 'FT8', 'FT4', 'RTTY']
+
+
+##############################################################################
+# Functions.
+##############################################################################
+
+#-----------------------------------------------------------------------------
+def make_record(rnd, i):
+    """
+    Return a synthetic QSO record dictionary.
+    """
+    band, freq = rnd.choice(BANDS)
+    return {
+        'CALL'     : rnd.choice(CALLS),
+        'BAND'     : band,
+        'FREQ'     : str(freq),
+        'MODE'     : rnd.choice(MODES),
+        'QSO_DATE' : '2024{:02d}{:02d}'.format(rnd.randint(1, 12), rnd.randint(1, 28)),
+        'TIME_ON'  : '{:02d}{:02d}'.format(rnd.randint(0, 23), rnd.randint(0, 59)),
+        'RST_SENT' : '59',
+        'RST_RCVD' : '57',
+        'COMMENT'  : 'US-{:04d} Benchmark Park {}'.format(rnd.randint(1, 9999), i),
+    }
+
+#-----------------------------------------------------------------------------
+def write_log(filename, count, seed=1, **options):
+    """
+    Write a synthetic ADIF log with count QSO records.
+    See adif_gen.DEFAULT_OPTIONS for the options.
+    """
+    (data, records, header) = adif_gen.generate(count, seed, **options)
+    with open(filename, 'wb') as f:
+        f.write(data)
+
+
+##############################################################################
+# Legacy parser, kept for comparison.
+##############################################################################
+class legacy_adif(adif.adif):
+    """
+    The regex parser used by adif.py before the single-pass tokenizer.
+    """
+    def next_record(self, file):
+        eor = True
+        m = adif.adif_eor_re.search(self._line)
+        if m:
+            eor = self.parse(self._line, True)
+            if eor:
+                self._line = self._line[m.end():]
+                return True
+        for line in file:
+            self._line += make_utf8(line).replace('\n', ' ').replace('\r', ' ')
+            m = adif.adif_eoh_re.search(self._line)
+            if m:
+                self.parse(self._line, True)
+                self._line = self._line[m.end():]
+                eor = False
+            m = adif.adif_eor_re.search(self._line)
+            if m:
+                eor = self.parse(self._line, eor)
+                if eor:
+                    self._line = self._line[m.end():]
+                    return True
+        return False
+
+    def parse(self, record, new=False):
+        self._EOH = False
+        eor_found = False
+        if new: self.clear()
+        m = adif.adif_specifier_re.search(record)
+        while m:
+            tag = m.group(1).upper()
+            sz = min(int(m.group(2)), len(m.group(4)))
+            value = m.group(4)[0:sz]
+            self.QSO[tag] = value
+            record = record[int(m.start(4) + sz):]
+            m = adif.adif_specifier_re.search(record)
+        if adif.adif_eor_re.search(record): eor_found = True
+        if adif.adif_eoh_re.search(record):
+            self.clear()
+            self._EOH = True
+        return eor_found
+
+
+#-----------------------------------------------------------------------------
+def legacy_get_adif(qso, sort=True):
+    """
+    The record formatter used by adif.get_adif() before write_records().
+    """
+    adif = ""
+    if sort:
+        fields = sorted(qso.keys())
+    else:
+        fields = list(qso.keys())
+    for field in fields:
+        value = qso[field]
+        adif += '<' + field + ':' + str(len(value)) + '>' + value + ' '
+    adif += '<EOR>'
+    return adif
+
+
+#-----------------------------------------------------------------------------
+def time_parser(cls, filename, mode='rb'):
+    """
+    Read every record in the file with the parser class, opening the file
+    in mode ('r' for the legacy parser, which reads text).
+    Returns (record count, elapsed seconds).
+    """
+    count = 0
+    parser = cls()
+    start = time.perf_counter()
+    with open(filename, mode) as f:
+        while parser.next_record(f):
+            count += 1
+    return (count, time.perf_counter() - start)
+
+#-----------------------------------------------------------------------------
+def time_iter(filename):
+    """
+    Read every record in the file with adif.iter_records().
+    Returns (record count, elapsed seconds).
+    """
+    count = 0
+    start = time.perf_counter()
+    for qso in adif.iter_records(filename):
+        count += 1
+    return (count, time.perf_counter() - start)
+
+#-----------------------------------------------------------------------------
+def time_bulk(filename, workers):
+    """
+    Load every record in the file with the bulk loader.
+    Returns (record count, elapsed seconds).
+    """
+    start = time.perf_counter()
+    records = adifbulk.load_parallel(filename, workers)
+    return (len(records), time.perf_counter() - start)
+
+#-----------------------------------------------------------------------------
+def time_cache(filename, cold):
+    """
+    Load every record in the file through the sidecar cache.  If cold is
+    True the cache file is removed first, so it is rebuilt.
+    Returns (record count, elapsed seconds).
+    """
+    cache_file = adifcache.cache_name(filename)
+    if cold and os.path.exists(cache_file): os.remove(cache_file)
+    start = time.perf_counter()
+    records = adifcache.load(filename)
+    return (len(records), time.perf_counter() - start)
+
+#-----------------------------------------------------------------------------
+def time_writer(filename, count, sort, legacy=False):
+    """
+    Write count records to a file, cycling through a pool of synthetic QSOs.
+    Returns elapsed seconds.
+    """
+    rnd = random.Random(1)
+    pool = [make_record(rnd, i) for i in range(1000)]
+    records = itertools.islice(itertools.cycle(pool), count)
+    start = time.perf_counter()
+    if legacy:
+        with open(filename, 'w') as f:
+            for qso in records:
+                f.write(legacy_get_adif(qso, sort) + '\n')
+    else:
+        adif.write_records(filename, records, sort=sort)
+    return time.perf_counter() - start
+
+
+
+##############################################################################
+# Main program.
+##############################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='ADIF parser benchmark')
+    parser.add_argument('-n', '--records', type=int, default=100000,
+        help='number of QSO records to generate (default 100000)')
+    parser.add_argument('-f', '--file', default='',
+        help='benchmark an existing ADIF file instead of a generated one')
+    parser.add_argument('-s', '--serialize', type=int, default=1000000,
+        help='number of QSO records to serialize, 0 to skip (default 1000000)')
+    parser.add_argument('-w', '--workers', type=int, nargs='*', default=None,
+        help='bulk loader worker counts to time (default 1 and the CPU count)')
+    parser.add_argument('--crlf', action='store_true', help='generate CR LF line endings')
+    parser.add_argument('--multiline', type=float, default=0.0,
+        help='fraction of generated records with a multi-line field')
+    parser.add_argument('--mixed-case', type=float, default=0.0,
+        help='fraction of generated tags in mixed case')
+    parser.add_argument('--non-ascii', type=float, default=0.0,
+        help='fraction of generated records with a non-ASCII field')
+    parser.add_argument('--extra', type=int, default=0,
+        help='number of extra fields per generated record')
+    args = parser.parse_args()
+
+    filename = args.file
+    tmpdir = None
+    if (len(filename) == 0):
+        tmpdir = tempfile.TemporaryDirectory()
+        filename = os.path.join(tmpdir.name, 'bench.adif')
+        write_log(filename, args.records, crlf=args.crlf, multiline=args.multiline,
+                  mixed_case=args.mixed_case, non_ascii=args.non_ascii, extra=args.extra)
+    size_mb = os.path.getsize(filename) / 1000000.0
+    print('{}: {:.1f} MB, {} CPUs'.format(filename, size_mb, os.cpu_count()))
+
+    report = lambda name, count, elapsed: print(
+        '  {:16}: {} records in {:.2f} s, {:.0f} records/s, {:.1f} MB/s'.format(
+        name, count, elapsed, count / elapsed, size_mb / elapsed))
+
+    for name, cls, mode in (('legacy regex', legacy_adif, 'r'), ('single-pass', adif.adif, 'rb'),
+                            ('single-pass text', adif.adif, 'r')):
+        (count, elapsed) = time_parser(cls, filename, mode)
+        report(name, count, elapsed)
+    (count, elapsed) = time_iter(filename)
+    report('iter_records', count, elapsed)
+
+    workers = args.workers
+    if workers is None:
+        workers = sorted(set([1, os.cpu_count() or 1]))
+    for n in workers:
+        (count, elapsed) = time_bulk(filename, n)
+        report('bulk x{}'.format(n), count, elapsed)
+    for name, cold in (('cache cold', True), ('cache warm', False)):
+        (count, elapsed) = time_cache(filename, cold)
+        report(name, count, elapsed)
+
+    if (args.serialize > 0):
+        out_dir = tempfile.TemporaryDirectory()
+        out_file = os.path.join(out_dir.name, 'write.adif')
+        print('Serialize {} records:'.format(args.serialize))
+        for name, sort, legacy in (('legacy sorted', True, True), ('legacy', False, True),
+                                   ('bulk sorted', True, False), ('bulk', False, False)):
+            elapsed = time_writer(out_file, args.serialize, sort, legacy)
+            out_mb = os.path.getsize(out_file) / 1000000.0
+            print('  {:16}: {:.2f} s, {:.0f} records/s, {:.1f} MB/s'.format(
+                name, elapsed, args.serialize / elapsed, out_mb / elapsed))
+        out_dir.cleanup()
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
@@ -0,0 +1,157 @@
+##############################################################################
+# bench_rig.py
+#
+# Rig control latency benchmark for the AB3GY POTA spot application.
+# Drives flrig_api.set_xcvr() against the local flrig or rigctld emulator
+# from several threads, as if several browser tabs were clicking spot Set
+# buttons, and reports tune command latency percentiles and throughput.
+#
+# Usage: python tools/bench_rig.py [-h] [options]
+##############################################################################
+
+# System packages.
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+# Environment setup.
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+sys.path.insert(1, os.path.join(repo_dir, 'lib'))
+
+# Local packages.
+import lib.FlrigEmulator as FlrigEmulator
+import lib.RigctldEmulator as RigctldEmulator
+import src.flrig_api as flrig
+
+##############################################################################
+# Globals.
+##############################################################################
+
+# Sample spots as (frequency in KHz, POTA mode).
+SPOTS = [
+    ('7074', 'FT8'), ('7185', 'SSB'), ('7030', 'CW'), ('10136', 'FT8'),
+    ('14074', 'FT8'), ('14285', 'SSB'), ('14062', 'CW'), ('18100', 'FT8'),
+    ('21074', 'FT8'), ('21300', 'SSB'), ('28074', 'FT8'), ('3573', 'FT8'),
+]
+
+# POTA to transceiver mode maps by backend.
+MODES = {
+    'flrig'   : {'CW': 'CW-U', 'FT8': 'DATA-USB', 'FT4': 'DATA-USB'},
+    'rigctld' : {'CW': 'CW', 'FT8': 'PKTUSB', 'FT4': 'PKTUSB'},
+}
+
+EMULATORS = {
+    'flrig'   : FlrigEmulator.FlrigEmulator,
+    'rigctld' : RigctldEmulator.RigctldEmulator,
+}
+
+
+##############################################################################
+# Functions.
+##############################################################################
+
+#-----------------------------------------------------------------------------
+def percentile(sorted_values, pct):
+    """
+    Return the pct percentile of a sorted list of values.
+    """
+    if (len(sorted_values) == 0): return 0.0
+    idx = int(round((pct / 100.0) * (len(sorted_values) - 1)))
+    return sorted_values[idx]
+
+#-----------------------------------------------------------------------------
+def run_clients(num_clients, num_tunes, seed=1):
+    """
+    Run num_clients threads each tuning num_tunes spots.
+    Returns (latencies, elapsed) where latencies is a list of seconds.
+    """
+    latencies = []
+    lock = threading.Lock()
+    start_event = threading.Event()
+
+    def client(n):
+        rnd = random.Random(seed + n)
+        mine = []
+        start_event.wait()
+        for i in range(num_tunes):
+            freq, mode = rnd.choice(SPOTS)
+            t0 = time.perf_counter()
+            flrig.set_xcvr(mode, freq)
+            mine.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(num_clients)]
+    for t in threads: t.start()
+    t_start = time.perf_counter()
+    start_event.set()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - t_start
+    return (latencies, elapsed)
+
+#-----------------------------------------------------------------------------
+def print_report(title, latencies, elapsed, commands):
+    """
+    Print latency percentiles and throughput.
+    """
+    lat = sorted(latencies)
+    ms = lambda s: s * 1000.0
+    print(title)
+    print('  tunes        : {}'.format(len(lat)))
+    print('  rig commands : {} ({:.2f} per tune)'.format(commands, commands / max(len(lat), 1)))
+    print('  latency ms   : mean {:.2f}  p50 {:.2f}  p90 {:.2f}  p99 {:.2f}  max {:.2f}'.format(
+        ms(statistics.fmean(lat)), ms(percentile(lat, 50)), ms(percentile(lat, 90)),
+        ms(percentile(lat, 99)), ms(lat[-1])))
+    print('  throughput   : {:.1f} tunes/s'.format(len(lat) / elapsed))
+    print('  saved        : {} redundant commands not sent'.format(flrig.xcvr_stats['commands_saved']))
+
+
+##############################################################################
+# Main program.
+##############################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Rig control latency benchmark')
+    parser.add_argument('-c', '--clients', type=int, default=4,
+        help='number of concurrent clients (default 4)')
+    parser.add_argument('-n', '--tunes', type=int, default=50,
+        help='tune commands per client (default 50)')
+    parser.add_argument('-l', '--latency', type=float, default=2.0,
+        help='emulated rig latency per command in ms (default 2.0)')
+    parser.add_argument('-j', '--jitter', type=float, default=1.0,
+        help='emulated rig latency jitter in ms (default 1.0)')
+    parser.add_argument('-b', '--backend', choices=sorted(EMULATORS.keys()), default='flrig',
+        help='rig backend to benchmark (default flrig)')
+    parser.add_argument('-u', '--url', default='',
+        help='benchmark an existing rig server instead of the emulator')
+    args = parser.parse_args()
+
+    emulator = None
+    url = args.url
+    if (len(url) == 0):
+        emulator = EMULATORS[args.backend]('localhost', 0,
+            args.latency / 1000.0, args.jitter / 1000.0)
+        emulator.start()
+        url = emulator.url()
+
+    flrig.client_init(url, backend=args.backend)
+    flrig.set_modes(MODES[args.backend])
+    flrig.set_xcvr('FT8', '14074') # Open the connection before timing
+
+    commands_before = flrig.flrig_client.call_count()
+    (latencies, elapsed) = run_clients(args.clients, args.tunes)
+    commands = flrig.flrig_client.call_count() - commands_before
+
+    title = '{} backend, {} clients x {} tunes, server {}'.format(
+        args.backend, args.clients, args.tunes, url)
+    if emulator is not None:
+        title += ', latency {} ms +/- {} ms'.format(args.latency, args.jitter)
+    print_report(title, latencies, elapsed, commands)
+
+    flrig.flrig_client.close()
+    if emulator is not None:
+        emulator.stop()
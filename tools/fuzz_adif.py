@@ -0,0 +1,351 @@
+##############################################################################
+# fuzz_adif.py
+#
+# ADIF parser fuzzing harness.
+# Generates synthetic logs with adif_gen.py, mutates them at random, and
+# checks that every ADIF reader in lib/ returns the same records and header
+# fields as a simple reference model of the ADIF tokenizer.  Unmutated logs
+# are also checked against the records that were generated.
+# A failing input is saved so it can be reproduced.
+#
+# Usage: python tools/fuzz_adif.py [-h] [options]
+##############################################################################
+
+# System packages.
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import traceback
+
+# Environment setup.
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+sys.path.insert(1, os.path.join(repo_dir, 'lib'))
+sys.path.insert(2, os.path.dirname(os.path.abspath(__file__)))
+
+# Local packages.
+import adif
+import adifbulk
+import adifcache
+import adif_gen
+
+##############################################################################
+# Globals.
+##############################################################################
+
+# Characters inserted by mutations; mostly ADIF syntax.
+MUTATION_CHARS = b'<>:0123456789 \r\nEORHeorh_AZaz\xc3\xa9'
+
+# Characters of an ADIF field name.
+TAG_CHARS = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_'
+
+
+##############################################################################
+# Reference model.
+##############################################################################
+
+#-----------------------------------------------------------------------------
+def reference_encoding(data):
+    """
+    Return the encoding of a log: UTF-8 unless its first run of non-ASCII
+    bytes is not valid UTF-8 (other than being cut short by the end of the
+    file), in which case adif.FALLBACK_ENCODING.
+    """
+    i = 0
+    while (i < len(data)) and (data[i] < 0x80): i += 1
+    j = i
+    while (j < len(data)) and (data[j] >= 0x80): j += 1
+    try:
+        data[i:j].decode('utf-8')
+    except UnicodeDecodeError as err:
+        if (j < len(data)) or (err.end < j - i):
+            return adif.FALLBACK_ENCODING
+    return 'utf-8'
+
+#-----------------------------------------------------------------------------
+def reference_fields(segment, fields, encoding):
+    """
+    Tokenize the fields of one record, one byte at a time.
+    
+    A specifier runs from '<' to the next '>'.  Without a ':' it is
+    ignored.  With one, the text before the first ':' is the tag, which
+    must be letters, digits and underscores, and the text up to the next
+    ':' or '>' must be a length; if not, scanning resumes at the byte after
+    the '<'.  The value is the next length bytes,
+    ending early at a '<'.  A non-ASCII value that does not end at a
+    space, tab, '<' or the end of the record is taken as length characters
+    instead if those do.
+    """
+    ends = b' \t<'
+    at_end = lambda k: (k >= n) or (segment[k] in ends)
+    i = 0
+    n = len(segment)
+    while (i < n):
+        if (segment[i] != ord('<')):
+            i += 1
+            continue
+        j = i + 1
+        while (j < n) and (segment[j] != ord('>')): j += 1
+        if (j >= n): break
+        spec = segment[i+1:j]
+        if (b':' not in spec):
+            i = j + 1
+            continue
+        (tag, rest) = spec.split(b':', 1)
+        if (len(tag) == 0) or (tag.strip(TAG_CHARS) != b''):
+            i += 1
+            continue
+        try:
+            length = int(rest.split(b':', 1)[0].decode('latin-1'))
+        except ValueError:
+            i += 1
+            continue
+        k = j + 1
+        while (k < j + 1 + length) and (k < n) and (segment[k] != ord('<')): k += 1
+        raw = segment[j+1:k]
+        if not raw.isascii() and not at_end(k):
+            limit = segment.find(b'<', j + 1)
+            if (limit < 0): limit = n
+            chars = segment[j+1:limit].decode(encoding, errors='surrogateescape')[0:length]
+            k2 = j + 1 + len(chars.encode(encoding, errors='surrogateescape'))
+            if at_end(k2):
+                k = k2
+                raw = segment[j+1:k]
+        fields[tag.decode('ascii').upper()] = raw.decode(encoding, errors='replace')
+        i = k
+
+#-----------------------------------------------------------------------------
+def reference_parse(data):
+    """
+    Parse a log file with the reference model.
+    
+    CR and LF bytes are read as spaces.  The data is first split into
+    records at each <EOR> or <EOH> (any case), wherever it appears, and the
+    fields of each record are then tokenized with reference_fields().
+    Fields before <EOH> belong to the header and are not a record, and
+    fields after the last end tag are discarded.  Header fields are taken
+    from every record that has an end tag.
+    
+    Returns (records, header) where header holds adif.header_tags fields.
+    """
+    encoding = reference_encoding(data)
+    data = data.replace(b'\r', b' ').replace(b'\n', b' ')
+    records = []
+    header = {}
+    start = 0
+    i = data.find(b'<')
+    while (i >= 0):
+        tag = data[i:i+5].upper()
+        if (tag == b'<EOR>') or (tag == b'<EOH>'):
+            fields = {}
+            reference_fields(data[start:i], fields, encoding)
+            for (name, value) in fields.items():
+                if name in adif.header_tags:
+                    header[name] = value
+                elif (name == 'ADIF_VERS'):
+                    header[name] = value
+                    header['ADIF_VER'] = value
+                elif name.startswith('USERDEF'):
+                    header[name] = value
+            if (tag == b'<EOR>'): records.append(fields)
+            start = i + 5
+        i = data.find(b'<', i + 1)
+    return (records, header)
+
+
+##############################################################################
+# Readers under test.  Each returns (records, header) for a file name.
+##############################################################################
+
+#-----------------------------------------------------------------------------
+def read_next_record(filename):
+    reader = adif.adif()
+    records = []
+    with open(filename, 'rb') as f:
+        while reader.next_record(f):
+            records.append(dict(reader.get_record()))
+    return (records, reader.HEADER)
+
+#-----------------------------------------------------------------------------
+def read_iter_records(filename, chunk_size=None):
+    saved = adif.READ_CHUNK_SIZE
+    if chunk_size is not None: adif.READ_CHUNK_SIZE = chunk_size
+    try:
+        header = {}
+        records = [dict(qso) for qso in adif.iter_records(filename, header)]
+    finally:
+        adif.READ_CHUNK_SIZE = saved
+    return (records, header)
+
+#-----------------------------------------------------------------------------
+def read_bulk(filename):
+    header = {}
+    records = adifbulk.load_parallel(filename, 1, header)
+    return (records, header)
+
+#-----------------------------------------------------------------------------
+def read_bulk_parallel(filename):
+    saved = (adifbulk.MIN_PARALLEL_SIZE, adifbulk.MIN_CHUNK_SIZE)
+    (adifbulk.MIN_PARALLEL_SIZE, adifbulk.MIN_CHUNK_SIZE) = (0, 64)
+    try:
+        header = {}
+        records = adifbulk.load_parallel(filename, 2, header)
+    finally:
+        (adifbulk.MIN_PARALLEL_SIZE, adifbulk.MIN_CHUNK_SIZE) = saved
+    return (records, header)
+
+#-----------------------------------------------------------------------------
+def read_cache(filename):
+    header = {}
+    cache_file = filename + adifcache.CACHE_SUFFIX
+    if os.path.exists(cache_file): os.remove(cache_file)
+    records = adifcache.load(filename, header)
+    header2 = {}
+    cached = adifcache.load(filename, header2)
+    if (cached != records) or (header2 != header):
+        raise AssertionError('cached records differ from parsed records')
+    return (records, header)
+
+READERS = {
+    'next_record'  : read_next_record,
+    'iter_records' : read_iter_records,
+    'bulk'         : read_bulk,
+    'bulk_parallel': read_bulk_parallel,
+    'cache'        : read_cache,
+}
+
+
+##############################################################################
+# Fuzzing.
+##############################################################################
+
+#-----------------------------------------------------------------------------
+def mutate(rnd, data):
+    """
+    Apply a few random byte-level mutations to a log.
+    """
+    data = bytearray(data)
+    for m in range(rnd.randint(1, 8)):
+        if (len(data) == 0): break
+        pos = rnd.randrange(len(data))
+        op = rnd.randrange(5)
+        if (op == 0):
+            del data[pos:pos + rnd.randint(1, 8)]
+        elif (op == 1):
+            data[pos:pos] = bytes(rnd.choice(MUTATION_CHARS) for k in range(rnd.randint(1, 4)))
+        elif (op == 2):
+            data[pos] = rnd.choice(MUTATION_CHARS)
+        elif (op == 3):
+            end = min(pos + rnd.randint(1, 40), len(data))
+            data[pos:pos] = data[pos:end]
+        else:
+            del data[pos:]
+    return bytes(data)
+
+#-----------------------------------------------------------------------------
+def check(filename, data, expected=None, readers=READERS, rnd=None):
+    """
+    Check all readers against the reference model for one log.
+    If expected is (records, header) as generated, the reference model is
+    also checked against it.
+    Returns a list of failure messages.
+    """
+    with open(filename, 'wb') as f:
+        f.write(data)
+    (ref_records, ref_header) = reference_parse(data)
+    failures = []
+    if expected is not None:
+        (gen_records, gen_header) = expected
+        bad = sum(1 for (a, b) in zip(ref_records, gen_records) if a != b)
+        bad += abs(len(ref_records) - len(gen_records))
+        if (bad > 0):
+            failures.append('reference: {} of {} records differ from the generated log'.format(
+                bad, len(gen_records)))
+        if any(ref_header.get(k) != v for (k, v) in gen_header.items()):
+            failures.append('reference: header {} differs from the generated {}'.format(
+                ref_header, gen_header))
+    for (name, reader) in readers.items():
+        try:
+            # Readers report an incomplete last record; keep that quiet.
+            with contextlib.redirect_stdout(io.StringIO()):
+                if (name == 'iter_records') and (rnd is not None):
+                    (records, header) = reader(filename, rnd.randint(1, 64))
+                else:
+                    (records, header) = reader(filename)
+        except Exception:
+            failures.append('{}: exception\n{}'.format(name, traceback.format_exc()))
+            continue
+        if (records != ref_records):
+            first = next((i for (i, (a, b)) in enumerate(zip(records, ref_records)) if a != b),
+                         min(len(records), len(ref_records)))
+            failures.append('{}: {} records, reference {}; first difference at record {}:\n  {}\n  {}'.format(
+                name, len(records), len(ref_records), first,
+                records[first] if first < len(records) else None,
+                ref_records[first] if first < len(ref_records) else None))
+        if (header != ref_header):
+            failures.append('{}: header {} differs from reference {}'.format(name, header, ref_header))
+    return failures
+
+#-----------------------------------------------------------------------------
+def random_options(rnd):
+    """
+    Return a random set of generator options.
+    """
+    return {
+        'header'     : rnd.random() < 0.8,
+        'crlf'       : rnd.random() < 0.3,
+        'one_line'   : rnd.random() < 0.1,
+        'multiline'  : rnd.choice((0.0, 0.2)),
+        'mixed_case' : rnd.choice((0.0, 0.5)),
+        'non_ascii'  : rnd.choice((0.0, 0.3)),
+        'types'      : rnd.choice((0.0, 0.3)),
+        'extra'      : rnd.choice((0, 0, 3)),
+        'byte_lengths' : rnd.random() < 0.2,
+    }
+
+
+##############################################################################
+# Main program.
+##############################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='ADIF parser fuzzing harness')
+    parser.add_argument('-i', '--iterations', type=int, default=200,
+        help='number of generated logs (default 200)')
+    parser.add_argument('-m', '--mutations', type=int, default=5,
+        help='mutated copies of each log (default 5)')
+    parser.add_argument('-n', '--records', type=int, default=20,
+        help='maximum records per log (default 20)')
+    parser.add_argument('-s', '--seed', type=int, default=1, help='random seed (default 1)')
+    parser.add_argument('-o', '--output', default='.',
+        help='directory for failing inputs (default current directory)')
+    args = parser.parse_args()
+    
+    rnd = random.Random(args.seed)
+    tmpdir = tempfile.TemporaryDirectory()
+    filename = os.path.join(tmpdir.name, 'fuzz.adif')
+    cases = 0
+    failed = 0
+    for it in range(args.iterations):
+        options = random_options(rnd)
+        (data, records, header) = adif_gen.generate(rnd.randint(0, args.records),
+                                                    rnd.randrange(1 << 30), **options)
+        inputs = [(data, (records, header))]
+        inputs += [(mutate(rnd, data), None) for m in range(args.mutations)]
+        for (n, (case, expected)) in enumerate(inputs):
+            cases += 1
+            failures = check(filename, case, expected, rnd=rnd)
+            if (len(failures) > 0):
+                failed += 1
+                out = os.path.join(args.output, 'fuzz_fail_{}_{}.adif'.format(it, n))
+                with open(out, 'wb') as f:
+                    f.write(case)
+                print('FAIL {} (options {})'.format(out, options))
+                for msg in failures:
+                    print('  ' + msg)
+    tmpdir.cleanup()
+    print('{} cases, {} failed'.format(cases, failed))
+    sys.exit(1 if (failed > 0) else 0)